@@ -1,3 +1,11 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import CallLog
+
+
+@admin.register(CallLog)
+class CallLogAdmin(admin.ModelAdmin):
+    list_display = ('call_sid', 'organization', 'caller_number', 'prompt_version', 'status', 'duration', 'started_at')
+    list_filter = ('status',)
+    search_fields = ('call_sid', 'caller_number', 'organization__name')
+    ordering = ('-started_at',)
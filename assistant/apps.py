@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AssistantConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'assistant'
+
+    def ready(self):
+        from .prompt_engine import load_templates
+        from .signals import connect_signals
+        load_templates()
+        connect_signals()
@@ -0,0 +1,190 @@
+"""
+check_availability tool for the voice assistant
+
+Answers "do you have anything Thursday afternoon?" during a call with a short
+sentence the assistant can read out. Everything comes from the availability
+cache (gabby_booking/availability_cache.py): the organization's services are
+cached under its generation and the next VOICE_AVAILABILITY_WARM_DAYS days are
+computed for every service when the call starts, so a lookup is a handful of
+cache reads (a few milliseconds). MediaStreamConsumer enforces
+VOICE_AVAILABILITY_BUDGET_MS, sized so a day that is not warmed yet (a question
+asked before warming finishes, or beyond the warmed range) can still be
+computed, and falls back to offering the booking link when the answer is late.
+"""
+import logging
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from gabby_booking.availability_cache import next_available, organization_generation
+from gabby_booking.models import Service
+
+logger = logging.getLogger(__name__)
+
+PARTS_OF_DAY = {
+    'morning': (0, 12 * 60),
+    'afternoon': (12 * 60, 17 * 60),
+    'evening': (17 * 60, 24 * 60),
+}
+SPOKEN_SLOTS = 3
+WARM_ALL = 10 ** 6  # next_available limit that scans the whole warm range
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+TOOL_DEFINITION = {
+    "type": "function",
+    "name": "check_availability",
+    "description": (
+        "Check live availability for a service. Use it whenever the caller asks when they can come in "
+        "or whether a day or time is free, and read the result back as is."
+    ),
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "service": {"type": "string", "description": "Service name as the caller said it"},
+            "date": {
+                "type": "string",
+                "description": "YYYY-MM-DD, 'today', 'tomorrow' or a weekday name; omit for the earliest opening"
+            },
+            "part_of_day": {"type": "string", "enum": ["morning", "afternoon", "evening", "any"]}
+        },
+        "required": ["service"]
+    }
+}
+
+
+def budget_seconds():
+    return getattr(settings, 'VOICE_AVAILABILITY_BUDGET_MS', 250) / 1000
+
+
+def organization_services(organization_id):
+    """[(id, name)] of the organization's services, cached until services change."""
+    key = f"voice:{organization_id}:{organization_generation(organization_id)}:services"
+    services = cache.get(key)
+    if services is None:
+        services = list(Service.objects.filter(organization_id=organization_id).order_by('id').values_list('id', 'name'))
+        cache.set(key, services, getattr(settings, 'AVAILABILITY_CACHE_TIMEOUT', 60 * 60))
+    return services
+
+
+def match_service(services, spoken):
+    """Best match for a spoken service name: exact, then containment either way; sole service as fallback."""
+    spoken = (spoken or '').strip().lower()
+    for matches in (
+        lambda name: name == spoken,
+        lambda name: spoken and (spoken in name or name in spoken),
+    ):
+        found = [service for service in services if matches(service[1].lower())]
+        if len(found) == 1:
+            return found[0]
+    return services[0] if len(services) == 1 else None
+
+
+def resolve_date(value, today):
+    """YYYY-MM-DD, 'today', 'tomorrow' or a weekday name (next occurrence, today included) -> date; None if empty."""
+    value = (value or '').strip().lower()
+    if not value:
+        return None
+    if value == 'today':
+        return today
+    if value == 'tomorrow':
+        return today + timedelta(days=1)
+    if value in WEEKDAYS:
+        return today + timedelta(days=(WEEKDAYS.index(value) - today.weekday()) % 7)
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def spoken_time(minutes):
+    hour, minute = divmod(minutes, 60)
+    suffix = 'am' if hour < 12 else 'pm'
+    hour = hour % 12 or 12
+    return f"{hour} {suffix}" if not minute else f"{hour}:{minute:02d} {suffix}"
+
+
+def spoken_day(day, today):
+    if day == today:
+        return 'today'
+    if day == today + timedelta(days=1):
+        return 'tomorrow'
+    return f"{day.strftime('%A, %B')} {day.day}"
+
+
+def spoken_list(items):
+    if len(items) <= 1:
+        return ''.join(items)
+    return f"{', '.join(items[:-1])} or {items[-1]}"
+
+
+def warm_availability(organization_id, days=None):
+    """Compute the coming days for every service and location so check_availability is served from cache."""
+    days = days or getattr(settings, 'VOICE_AVAILABILITY_WARM_DAYS', 7)
+    now = timezone.localtime()
+    for service_id, _ in organization_services(organization_id):
+        next_available(organization_id, service_id, now, limit=WARM_ALL, max_days=days)
+
+
+def check_availability(organization_id, service=None, date=None, part_of_day=None, now=None):
+    """
+    A short spoken answer for the requested service, day and part of day
+
+    Lists up to SPOKEN_SLOTS free starts across locations and providers; when
+    the requested day (or part of it) is full, offers the next openings after it.
+    """
+    started = time.perf_counter()
+    now = now or timezone.localtime()
+    today = now.date()
+
+    services = organization_services(organization_id)
+    if not services:
+        return "I can't see any services to book online right now."
+    matched = match_service(services, service)
+    if not matched:
+        return f"Which service would you like? We offer {spoken_list([name for _, name in services])}."
+    service_id, service_name = matched
+
+    try:
+        day = resolve_date(date, today)
+    except ValueError:
+        day = None
+    part = (part_of_day or '').lower()
+    window_start, window_end = PARTS_OF_DAY.get(part, (0, 24 * 60))
+
+    answer = ''
+    after = now.replace(tzinfo=None)
+    if day and day >= today:
+        day_start = datetime.combine(day, datetime.min.time())
+        _, openings = next_available(
+            organization_id, service_id, max(after, day_start + timedelta(minutes=window_start)),
+            limit=SPOKEN_SLOTS, max_days=1, now=now
+        )
+        starts = [start for _, start, _, _ in openings if start < window_end]
+        when = spoken_day(day, today)
+        if part in PARTS_OF_DAY:
+            when = f"this {part}" if day == today else f"{when} {part}"
+        if starts:
+            return _within_budget(
+                f"For {service_name} {when} I have {spoken_list([spoken_time(start) for start in starts])}.",
+                started, organization_id
+            )
+        answer = f"I have nothing {when} for {service_name}. "
+        after = max(after, day_start + timedelta(minutes=window_end))
+
+    _, openings = next_available(organization_id, service_id, after, limit=SPOKEN_SLOTS, now=now)
+    by_day = {}
+    for d, start, _, _ in openings:
+        by_day.setdefault(d, []).append(spoken_time(start))
+    offers = [f"{spoken_day(d, today)} at {spoken_list(times)}" for d, times in by_day.items()]
+    if offers:
+        answer += f"The next openings for {service_name} are {', and '.join(offers)}."
+    else:
+        answer += f"I don't see any openings for {service_name} in the coming weeks."
+    return _within_budget(answer, started, organization_id)
+
+
+def _within_budget(answer, started, organization_id):
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if elapsed_ms > budget_seconds() * 1000:
+        logger.warning(f"check_availability for organization {organization_id} took {elapsed_ms:.1f} ms")
+    return answer
@@ -0,0 +1,163 @@
+"""
+Rebuild materialized system prompts for every organization (or a filtered set)
+
+Usage:
+    python manage.py rebuild_prompts
+    python manage.py rebuild_prompts --org 12 15 --workers 1
+    python manage.py rebuild_prompts --locale fr --dry-run
+
+Organization ids are streamed from the database in chunks and each chunk is
+rebuilt by a worker process. Every section is re-rendered (the segment cache
+is bypassed), and the command prints the size deltas and the sections that
+changed, so a change to prompt_builder.py or assistant/prompts/ can be rolled
+out and reviewed for the whole fleet in one go.
+"""
+import time
+from collections import Counter
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from gabby_booking.models import Organization, OrganizationPrompt
+from assistant.prompt_builder import render_prompt
+from assistant.prompt_store import refresh_organization_prompt, hash_sections, changed_sections
+
+
+def rebuild_chunk(organization_ids, dry_run=False):
+    """
+    Rebuild the prompts of one chunk of organizations. Runs inside a worker process.
+
+    Returns:
+        list of dicts: organization_id, old_size, new_size, changed_sections, error
+    """
+    previous = {
+        row['organization_id']: row
+        for row in OrganizationPrompt.objects.filter(
+            organization_id__in=organization_ids
+        ).values('organization_id', 'compiled_prompt', 'section_hashes')
+    }
+
+    results = []
+    for organization_id in organization_ids:
+        old = previous.get(organization_id, {})
+        result = {
+            'organization_id': organization_id,
+            'old_size': len(old.get('compiled_prompt', '')),
+            'new_size': 0,
+            'changed_sections': [],
+            'error': None,
+        }
+        try:
+            if dry_run:
+                prompt_text, segments = render_prompt(organization_id)
+                new_hashes = hash_sections(segments)
+            else:
+                record = refresh_organization_prompt(organization_id, force=True)
+                if record is None:
+                    continue
+                prompt_text, new_hashes = record.compiled_prompt, record.section_hashes
+
+            result['new_size'] = len(prompt_text)
+            result['changed_sections'] = changed_sections(old.get('section_hashes') or {}, new_hashes)
+        except Organization.DoesNotExist:
+            continue
+        except Exception as e:
+            result['error'] = str(e)
+        results.append(result)
+    return results
+
+
+def _rebuild_chunk_task(args):
+    return rebuild_chunk(*args)
+
+
+def _close_connections():
+    # Connections must never be shared across a fork
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Rebuild materialized system prompts and report size deltas and changed sections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--org', nargs='+', type=int, dest='organization_ids', help='Only rebuild these organization ids')
+        parser.add_argument('--locale', help='Only rebuild organizations using this prompt locale')
+        parser.add_argument('--workers', type=int, default=4, help='Number of worker processes (1 = run in-process)')
+        parser.add_argument('--chunk-size', type=int, default=200, help='Organizations per database read and per worker task')
+        parser.add_argument('--dry-run', action='store_true', help='Render and compare without writing to the prompt store')
+        parser.add_argument('--top', type=int, default=10, help='Number of largest size changes to list')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        queryset = Organization.objects.order_by('id')
+        if options['organization_ids']:
+            queryset = queryset.filter(id__in=options['organization_ids'])
+        if options['locale']:
+            queryset = queryset.filter(locale=options['locale'])
+
+        chunk_size = max(options['chunk_size'], 1)
+        chunks = self.iter_chunks(queryset.values_list('id', flat=True), chunk_size)
+        dry_run = options['dry_run']
+
+        results = []
+        if options['workers'] <= 1:
+            for chunk in chunks:
+                results.extend(rebuild_chunk(chunk, dry_run))
+        else:
+            # Materialize the chunk list before forking so the parent's cursor is closed
+            chunks = list(chunks)
+            _close_connections()
+            with get_context('fork').Pool(options['workers'], initializer=_close_connections) as pool:
+                for chunk_results in pool.imap_unordered(_rebuild_chunk_task, [(chunk, dry_run) for chunk in chunks]):
+                    results.extend(chunk_results)
+
+        self.report(results, options['top'], dry_run, time.monotonic() - started)
+
+    def iter_chunks(self, ids, chunk_size):
+        chunk = []
+        for organization_id in ids.iterator(chunk_size=chunk_size):
+            chunk.append(organization_id)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def report(self, results, top, dry_run, elapsed):
+        failed = [r for r in results if r['error']]
+        rebuilt = [r for r in results if not r['error']]
+        changed = [r for r in rebuilt if r['changed_sections']]
+        old_total = sum(r['old_size'] for r in rebuilt)
+        new_total = sum(r['new_size'] for r in rebuilt)
+
+        section_counts = Counter()
+        for r in changed:
+            section_counts.update(r['changed_sections'])
+
+        mode = ' (dry run, nothing written)' if dry_run else ''
+        self.stdout.write(f"Rebuilt {len(rebuilt)} prompts in {elapsed:.1f}s{mode}")
+        self.stdout.write(f"  changed: {len(changed)}, unchanged: {len(rebuilt) - len(changed)}, failed: {len(failed)}")
+        self.stdout.write(f"  total size: {old_total} -> {new_total} chars ({new_total - old_total:+d})")
+
+        if section_counts:
+            self.stdout.write("Changed sections:")
+            for section, count in section_counts.most_common():
+                self.stdout.write(f"  {section}: {count}")
+
+        largest = sorted(changed, key=lambda r: abs(r['new_size'] - r['old_size']), reverse=True)[:top]
+        if largest:
+            self.stdout.write("Largest size changes:")
+            for r in largest:
+                self.stdout.write(
+                    f"  org {r['organization_id']}: {r['old_size']} -> {r['new_size']} "
+                    f"({r['new_size'] - r['old_size']:+d}) [{', '.join(r['changed_sections'])}]"
+                )
+
+        for r in failed:
+            self.stderr.write(f"  org {r['organization_id']}: {r['error']}")
+
+        if failed:
+            self.stdout.write(self.style.WARNING(f"Completed with {len(failed)} failures"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Done"))
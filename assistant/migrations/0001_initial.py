@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-19 06:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('gabby_booking', '0014_organizationprompt_compiled_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CallLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('call_sid', models.CharField(max_length=64, unique=True)),
+                ('caller_number', models.CharField(blank=True, default='', max_length=20)),
+                ('prompt_version', models.PositiveIntegerField(blank=True, help_text='OrganizationPrompt version used for this call', null=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='call_logs', to='gabby_booking.organization')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistant', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calllog',
+            name='duration',
+            field=models.PositiveIntegerField(blank=True, help_text='Seconds, once the call completed', null=True),
+        ),
+        migrations.AddField(
+            model_name='calllog',
+            name='ended_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='calllog',
+            name='status',
+            field=models.CharField(blank=True, default='', help_text='Twilio CallStatus, e.g. completed', max_length=20),
+        ),
+    ]
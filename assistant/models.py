@@ -1,3 +1,18 @@
 from django.db import models
+from gabby_booking.models import Organization
 
-# Create your models here.
+
+class CallLog(models.Model):
+    """One row per inbound call handled by the voice assistant."""
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='call_logs')
+    call_sid = models.CharField(max_length=64, unique=True)
+    caller_number = models.CharField(max_length=20, blank=True, default='')
+    prompt_version = models.PositiveIntegerField(null=True, blank=True, help_text="OrganizationPrompt version used for this call")
+    started_at = models.DateTimeField(auto_now_add=True)
+    # From Twilio status callbacks (status_callbacks.py)
+    status = models.CharField(max_length=20, blank=True, default='', help_text="Twilio CallStatus, e.g. completed")
+    duration = models.PositiveIntegerField(null=True, blank=True, help_text="Seconds, once the call completed")
+    ended_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Call {self.call_sid} - {self.organization.name}"
@@ -1,8 +1,324 @@
+"""
+System prompt assembly
+
+The prompt is a static, org-independent instruction prefix followed by an
+org-specific "# Reference Data" suffix made of independent sections (hours,
+rules, services, add-ons, team, FAQs, SMS templates...). All wording lives in
+assistant/prompts/<locale>.txt; this module loads the data and fills it in.
+
+Keep org values out of the prefix: providers cache prompts by exact prefix, so
+a byte-identical prefix lets every call, for every org, hit the prompt cache.
+"""
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Prefetch
+
 from gabby_booking.models import (
     Organization, Service, Option, BusinessHours, ExceptionalClosing,
-    OrganizationFAQ, Assistant, BookingRule, CommunicationTemplate,
-    ServiceLocation, Location, TeamMember, TeamMemberConfig
+    OrganizationFAQ, Location, TeamMember
 )
+from .prompt_engine import get_templates, static_prefix, assemble, render_cached_segments
+
+SECTION_ORDER = ['identity', 'policies', 'locations', 'hours', 'rules', 'services', 'addons', 'team', 'faqs', 'sms']
+
+# Collections each section reads; one-to-one settings are always joined.
+SECTION_PREFETCHES = {
+    'locations': [Prefetch('service_location__locations', queryset=Location.objects.order_by('id'))],
+    'hours': [
+        Prefetch('business_hours', queryset=BusinessHours.objects.order_by('id')),
+        Prefetch('exceptional_closings', queryset=ExceptionalClosing.objects.order_by('open_date', 'id')),
+    ],
+    'services': [Prefetch('services', queryset=Service.objects.order_by('id'))],
+    'addons': [Prefetch('options', queryset=Option.objects.order_by('id'))],
+    'team': [Prefetch('team_members', queryset=TeamMember.objects.select_related('location').order_by('id'))],
+    'faqs': [Prefetch('faqs', queryset=OrganizationFAQ.objects.order_by('id'))],
+}
+
+WEEK_DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def _related_or_none(instance, name):
+    """Reverse one-to-one accessor that returns None instead of raising."""
+    try:
+        return getattr(instance, name)
+    except ObjectDoesNotExist:
+        return None
+
+
+def load_prompt_data(organization_id, sections=None):
+    """
+    Fetch the organization graph needed to render the given sections (default: all)
+
+    One-to-one settings are joined in the organization query and every
+    collection is prefetched, so the number of queries is fixed (at most 8) no matter
+    how many services, FAQs or team members the organization has.
+
+    Raises:
+        Organization.DoesNotExist
+    """
+    prefetches = []
+    for section in sections or SECTION_ORDER:
+        prefetches.extend(SECTION_PREFETCHES.get(section, []))
+
+    return Organization.objects.select_related(
+        'assistant', 'booking_rule', 'communication_template', 'service_location', 'team_config'
+    ).prefetch_related(*prefetches).get(id=organization_id)
+
+
+def render_identity(organization, t):
+    assistant = _related_or_none(organization, 'assistant')
+    assistant_name = assistant.name if assistant else t['identity.default_assistant_name'].template
+
+    details = ""
+    if organization.description:
+        details += t['identity.about'].substitute(description=organization.description) + "\n"
+    if organization.industry:
+        details += t['identity.industry'].substitute(industry=organization.industry) + "\n"
+
+    greeting_message = assistant.greeting_message if assistant else None
+    if not greeting_message:
+        greeting_message = t['identity.default_greeting'].substitute(
+            business_name=organization.name, assistant_name=assistant_name
+        )
+
+    return t['identity'].substitute(
+        assistant_name=assistant_name,
+        business_name=organization.name,
+        details=details,
+        greeting=greeting_message,
+    )
+
+
+def render_policies(organization, t):
+    booking_rule = _related_or_none(organization, 'booking_rule')
+    lines = []
+
+    if booking_rule:
+        if booking_rule.set_cutoff_time and booking_rule.cutoff_time_value:
+            lines.append(t['policies.cutoff'].substitute(value=booking_rule.cutoff_time_value))
+
+        if booking_rule.allow_modifications:
+            if booking_rule.modifications_deadline:
+                lines.append(t['policies.modifications'].substitute(value=booking_rule.modifications_deadline))
+        else:
+            lines.append(t['policies.no_modifications'].template)
+
+        if booking_rule.allow_cancellations:
+            if booking_rule.cancellation_deadline:
+                lines.append(t['policies.cancellations'].substitute(value=booking_rule.cancellation_deadline))
+        else:
+            lines.append(t['policies.no_cancellations'].template)
+
+    return t['policies'].substitute(items="\n".join(lines) or t['policies.empty'].template)
+
+
+def render_locations(organization, t):
+    service_location = _related_or_none(organization, 'service_location')
+    if not service_location:
+        return ""
+
+    lines = []
+    if service_location.address_type == 'one-main' and service_location.main_address:
+        lines.append(t['locations.main'].substitute(address=service_location.main_address))
+    elif service_location.address_type == 'multiple-locations':
+        lines.append(t['locations.multiple'].template)
+        for loc in service_location.locations.all():
+            lines.append(t['locations.item'].substitute(name=loc.name, address=loc.address))
+    elif service_location.address_type == 'client-location':
+        lines.append(t['locations.client'].template)
+
+    if not lines:
+        return ""
+    return t['locations'].substitute(items="\n".join(lines))
+
+
+def render_hours(organization, t):
+    days_map = {}
+    for hour in organization.business_hours.all():
+        if hour.hours_type == 'closed':
+            days_map[hour.day_of_week] = t['hours.closed'].template
+        elif hour.hours_type == 'open_24':
+            days_map[hour.day_of_week] = t['hours.open_24'].template
+        else:
+            open_time = hour.open_time.strftime('%H:%M') if hour.open_time else ""
+            close_time = hour.close_time.strftime('%H:%M') if hour.close_time else ""
+            days_map[hour.day_of_week] = t['hours.range'].substitute(open=open_time, close=close_time)
+
+    day_labels = t['hours.days'].template.split()
+    days = "\n".join(
+        t['hours.day'].substitute(day=label, hours=days_map.get(day, t['hours.closed'].template))
+        for day, label in zip(WEEK_DAYS, day_labels)
+    )
+
+    closings = ""
+    closing_lines = []
+    for closing in organization.exceptional_closings.all():
+        if closing.reason:
+            closing_lines.append(t['hours.closing_reason'].substitute(
+                start=closing.open_date, end=closing.close_date, reason=closing.reason
+            ))
+        else:
+            closing_lines.append(t['hours.closing'].substitute(start=closing.open_date, end=closing.close_date))
+    if closing_lines:
+        closings = t['hours.closings_header'].template + "\n" + "\n".join(closing_lines)
+
+    return t['hours'].substitute(days=days, closings=closings)
+
+
+def render_rules(organization, t):
+    booking_rule = _related_or_none(organization, 'booking_rule')
+    lines = []
+
+    if booking_rule:
+        if booking_rule.set_cutoff_time and booking_rule.cutoff_time_value:
+            lines.append(t['rules.cutoff'].substitute(value=booking_rule.cutoff_time_value))
+
+        if booking_rule.allow_modifications:
+            if booking_rule.modifications_deadline:
+                lines.append(t['rules.modifications'].substitute(value=booking_rule.modifications_deadline))
+        else:
+            lines.append(t['rules.no_modifications'].template)
+
+        if booking_rule.allow_cancellations:
+            if booking_rule.cancellation_deadline:
+                lines.append(t['rules.cancellations'].substitute(value=booking_rule.cancellation_deadline))
+        else:
+            lines.append(t['rules.no_cancellations'].template)
+
+        if booking_rule.set_minimum_gap and booking_rule.gap_time_value:
+            lines.append(t['rules.gap'].substitute(value=booking_rule.gap_time_value))
+
+        if booking_rule.email_reminder_delay:
+            lines.append(t['rules.reminder'].substitute(value=booking_rule.email_reminder_delay))
+
+        if booking_rule.offer_newsletter:
+            lines.append(t['rules.newsletter'].template)
+
+        if booking_rule.terms_and_conditions_url:
+            lines.append(t['rules.terms'].substitute(value=booking_rule.terms_and_conditions_url))
+
+    return t['rules'].substitute(items="\n".join(lines) or t['rules.empty'].template)
+
+
+def render_services(organization, t):
+    lines = []
+    for service in organization.services.all():
+        line = t['services.item'].substitute(name=service.name, duration=service.duration, price=service.price)
+        if service.detail:
+            line += t['services.detail'].substitute(detail=service.detail)
+        lines.append(line)
+
+    return t['services'].substitute(items="\n".join(lines) or t['services.empty'].template)
+
+
+def render_addons(organization, t):
+    lines = []
+    for addon in organization.options.all():
+        line = t['addons.item'].substitute(name=addon.name)
+        if addon.duration:
+            line += t['addons.duration'].substitute(duration=addon.duration)
+        line += t['addons.price'].substitute(price=addon.price)
+        if addon.detail:
+            line += t['addons.detail'].substitute(detail=addon.detail)
+        lines.append(line)
+
+    if not lines:
+        return ""
+    return t['addons'].substitute(items="\n".join(lines))
+
+
+def render_team(organization, t):
+    team_config = _related_or_none(organization, 'team_config')
+    if not (team_config and team_config.has_multiple_members):
+        return ""
+
+    intro = t['team.intro'].template
+    if team_config.allow_client_choose_worker:
+        intro += t['team.choose'].template
+
+    lines = []
+    for member in organization.team_members.all():
+        line = t['team.item'].substitute(name=member.name)
+        if member.email:
+            line += t['team.email'].substitute(email=member.email)
+        if member.location:
+            line += t['team.location'].substitute(location=member.location.name)
+        lines.append(line)
+
+    return t['team'].substitute(intro=intro, items="\n".join(lines))
+
+
+def render_faqs(organization, t):
+    lines = [
+        t['faqs.item'].substitute(question=faq.question, answer=faq.answer)
+        for faq in organization.faqs.all()
+    ]
+    return t['faqs'].substitute(items="\n".join(lines) or t['faqs.empty'].template)
+
+
+def render_sms(organization, t):
+    comm_template = _related_or_none(organization, 'communication_template')
+    if comm_template:
+        booking = comm_template.booking_sms_content
+        update = comm_template.confirmation_email_content[:200]
+        cancel = comm_template.cancellation_email_content[:200]
+    else:
+        booking = t['sms.default_booking'].template
+        update = t['sms.default_update'].template
+        cancel = t['sms.default_cancel'].template
+
+    return t['sms'].substitute(booking=booking, update=update, cancel=cancel)
+
+
+SECTION_RENDERERS = {
+    'identity': render_identity,
+    'policies': render_policies,
+    'locations': render_locations,
+    'hours': render_hours,
+    'rules': render_rules,
+    'services': render_services,
+    'addons': render_addons,
+    'team': render_team,
+    'faqs': render_faqs,
+    'sms': render_sms,
+}
+
+
+def render_sections(organization_id, sections, locale=None):
+    """Load the data for the given sections and render them. Returns {section: text}."""
+    organization = load_prompt_data(organization_id, sections)
+    t = get_templates(locale or organization.locale)
+    return {name: SECTION_RENDERERS[name](organization, t) for name in sections}
+
+
+def compile_prompt(organization_id, locale, section_versions, force=False):
+    """
+    Assemble the prompt from cached segments, re-rendering only dirty sections
+
+    Returns:
+        tuple: (prompt: str, segments: {section: text}, rendered_sections: list of re-rendered section names)
+    """
+    segments, rendered = render_cached_segments(
+        organization_id, locale, section_versions, SECTION_ORDER,
+        lambda missing: render_sections(organization_id, missing, locale),
+        force=force,
+    )
+    return assemble(static_prefix(locale), SECTION_ORDER, segments), segments, rendered
+
+
+def render_prompt(organization_id):
+    """
+    Render every section from the database, bypassing the segment cache
+
+    Returns:
+        tuple: (prompt: str, segments: {section: text})
+
+    Raises:
+        Organization.DoesNotExist
+    """
+    organization = load_prompt_data(organization_id)
+    t = get_templates(organization.locale)
+    segments = {name: renderer(organization, t) for name, renderer in SECTION_RENDERERS.items()}
+    return assemble(static_prefix(organization.locale), SECTION_ORDER, segments), segments
 
 
 def build_system_prompt(organization_id):
@@ -10,280 +326,6 @@ def build_system_prompt(organization_id):
     Build a dynamic system prompt based on organization data
     """
     try:
-        organization = Organization.objects.get(id=organization_id)
-        assistant = Assistant.objects.filter(organization=organization).first()
-        services = Service.objects.filter(organization=organization)
-        addons = Option.objects.filter(organization=organization)
-        business_hours = BusinessHours.objects.filter(organization=organization)
-        exceptional_closings = ExceptionalClosing.objects.filter(organization=organization)
-        faqs = OrganizationFAQ.objects.filter(organization=organization)
-        booking_rule = BookingRule.objects.filter(organization=organization).first()
-        comm_template = CommunicationTemplate.objects.filter(organization=organization).first()
-        service_location = ServiceLocation.objects.filter(organization=organization).first()
-        locations = Location.objects.filter(service_location=service_location) if service_location else []
-        team_config = TeamMemberConfig.objects.filter(organization=organization).first()
-        team_members = TeamMember.objects.filter(organization=organization)
-
-        # Assistant details
-        assistant_name = assistant.name if assistant else "Assistant"
-        greeting_message = assistant.greeting_message if assistant else f"Thank you for calling {organization.name}, this is {assistant_name} speaking. How can I help you today?"
-
-        # Organization details
-        org_description = organization.description if organization.description else ""
-        org_industry = organization.industry if organization.industry else ""
-
-        # Build business hours section
-        hours_text = ""
-        days_map = {}
-        for hour in business_hours:
-            day = hour.day_of_week
-            if hour.hours_type == 'closed':
-                days_map[day] = "Closed"
-            elif hour.hours_type == 'open_24':
-                days_map[day] = "Open 24 Hours"
-            else:
-                open_time = hour.open_time.strftime('%H:%M') if hour.open_time else ""
-                close_time = hour.close_time.strftime('%H:%M') if hour.close_time else ""
-                days_map[day] = f"{open_time}–{close_time}"
-
-        for day in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']:
-            hours_text += f"  - {day[:3]}: {days_map.get(day, 'Closed')}\n"
-
-        # Build exceptional closings
-        closings_text = ""
-        for closing in exceptional_closings:
-            closings_text += f"- {closing.open_date} to {closing.close_date}"
-            if closing.reason:
-                closings_text += f": {closing.reason}"
-            closings_text += "\n"
-
-        # Build booking rules and policies
-        booking_rules_text = ""
-        policy_explanations = ""
-
-        if booking_rule:
-            if booking_rule.set_cutoff_time and booking_rule.cutoff_time_value:
-                booking_rules_text += f"- Book at least {booking_rule.cutoff_time_value} in advance\n"
-                policy_explanations += f'- If asked about booking time: "Bookings must be made at least {booking_rule.cutoff_time_value} in advance."\n'
-
-            if booking_rule.allow_modifications:
-                if booking_rule.modifications_deadline:
-                    booking_rules_text += f"- Modifications require {booking_rule.modifications_deadline} notice\n"
-                    policy_explanations += f'- If asked about modifications: "Rescheduling requires at least {booking_rule.modifications_deadline} notice."\n'
-            else:
-                booking_rules_text += "- Modifications not allowed\n"
-                policy_explanations += '- If asked about modifications: "Our policy doesn\'t allow modifications once booked."\n'
-
-            if booking_rule.allow_cancellations:
-                if booking_rule.cancellation_deadline:
-                    booking_rules_text += f"- Cancellations require {booking_rule.cancellation_deadline} notice\n"
-                    policy_explanations += f'- If asked about cancellations: "Cancellations require at least {booking_rule.cancellation_deadline} notice."\n'
-            else:
-                booking_rules_text += "- Cancellations not allowed\n"
-                policy_explanations += '- If asked about cancellations: "Our policy doesn\'t allow cancellations."\n'
-
-            if booking_rule.set_minimum_gap and booking_rule.gap_time_value:
-                booking_rules_text += f"- Minimum gap between appointments: {booking_rule.gap_time_value}\n"
-
-            if booking_rule.email_reminder_delay:
-                booking_rules_text += f"- Reminder emails sent: {booking_rule.email_reminder_delay} before appointment\n"
-
-            if booking_rule.offer_newsletter:
-                booking_rules_text += "- Newsletter subscription available\n"
-
-            if booking_rule.terms_and_conditions_url:
-                booking_rules_text += f"- Terms & Conditions: {booking_rule.terms_and_conditions_url}\n"
-
-        # Build services section with full details
-        services_text = ""
-        for service in services:
-            services_text += f"- {service.name} ({service.duration} min) - ${service.price}"
-            if service.detail:
-                services_text += f" - {service.detail}"
-            services_text += "\n"
-
-        # Build add-ons section with details
-        addons_text = ""
-        for addon in addons:
-            addons_text += f"- {addon.name}"
-            if addon.duration:
-                addons_text += f" ({addon.duration} min)"
-            addons_text += f" - ${addon.price}"
-            if addon.detail:
-                addons_text += f" - {addon.detail}"
-            addons_text += "\n"
-
-        # Build service locations section
-        locations_text = ""
-        if service_location:
-            if service_location.address_type == 'one-main' and service_location.main_address:
-                locations_text = f"Main location: {service_location.main_address}\n"
-            elif service_location.address_type == 'multiple-locations':
-                locations_text = "Multiple locations:\n"
-                for loc in locations:
-                    locations_text += f"  - {loc.name}: {loc.address}\n"
-            elif service_location.address_type == 'client-location':
-                locations_text = "Services provided at client's location\n"
-
-        # Build team members section
-        team_text = ""
-        if team_config and team_config.has_multiple_members:
-            team_text = f"We have multiple team members"
-            if team_config.allow_client_choose_worker:
-                team_text += " and you can choose your preferred staff member"
-            team_text += ":\n"
-            for member in team_members:
-                team_text += f"  - {member.name}"
-                if member.email:
-                    team_text += f" ({member.email})"
-                if member.location:
-                    team_text += f" - Available at: {member.location.name}"
-                team_text += "\n"
-
-        # Build FAQs section
-        faqs_text = ""
-        for faq in faqs:
-            faqs_text += f'- "{faq.question}" → {faq.answer}\n'
-
-        # Get booking SMS template
-        booking_sms = comm_template.booking_sms_content if comm_template else "Here's your booking link: {{booking_link}}"
-
-        # Build the complete system prompt
-        prompt = rf"""
-# Role & Objective
-- You are {assistant_name}, the virtual receptionist for {organization.name}.
-{f"- About us: {org_description}" if org_description else ""}
-{f"- Industry: {org_industry}" if org_industry else ""}
-- Success means:
-  - Answer general questions briefly and accurately.
-  - Only take these actions: send an SMS link (book, reschedule, cancel), take a message for the team, or transfer to a human.
-  - Never book, modify, or cancel yourself.
-  - Always close with a short confirmation and ask if more help is needed.
-
-# Personality & Tone
-- Personality: warm, calm, professional.
-- Tone: short and natural.
-- Length: 1–2 sentences per turn.
-- One question per turn.
-- Vary confirmations: "Sure." / "Got it." / "Absolutely."
-
-# Golden Rules
-- You never book, modify, or cancel yourself.
-- You only send SMS links, take a message, or transfer.
-- Replies must stay short and clear.
-- After every action, confirm once and ask if anything else is needed.
-
-# Tool Call Execution
-- When a tool is needed, you must always do these in the SAME turn:
-  1. Call the correct function immediately (book_service, update_booking, cancel_booking, notify_owner, transfer_call).
-  2. After the call, say one short line to the caller.
-- The function call always comes first in the turn.
-- Never wait for the user to confirm before calling the tool.
-
-# 1_greeting
-- Say exactly this sentence once:
-  "{greeting_message}"
-- Do not paraphrase or add anything else.
-
-## 2_intent_classification
-Identify caller's request and route:
-- Booking (e.g., "I want to book…", "Can I schedule an appointment?") → 3_send_booking_link
-- Modify booking:
-   - If caller clearly refers to details (e.g., "I'd like to add an add-on", "Can I change my service?", "I want to extend my session") → 7_notify_owner
-   - If caller just says "modify/change my booking" without specifying → ask a clarifying question:
-     "Do you want to change the date/time of your booking, or something else?"
-       - If it's date/time → 4_send_update_link
-       - If it's something else → 7_notify_owner
-- Reschedule (e.g., "I need to change my appointment", "Can I move my booking?") → 4_send_update_link
-- Cancel (e.g., "Please cancel my appointment", "I can't make it today") → 5_send_cancelling_link
-- General question (e.g., hours, prices, services, policies, or why a booking/cancellation didn't work) → 6_answer_question
-- Message for the team (e.g., running late, note for you, medical contraindication, allergies, preferences, fears, reimbursement request, quote request) → 7_notify_owner
-- Manager request now or strong dissatisfaction → 8_transfer_call
-
-## 3_send_booking_link
-- Always immediately call the function \`book_service\` with {{ caller_number: "<caller_phone>" }}.
-- Never ask the customer for anything, including their name or other details.
-- Always pass parameters by name when calling the function.
-
-## 4_send_update_link
-- Always immediately call the function \`update_booking\` with {{ caller_number: "<caller_phone>" }}.
-- Never ask the customer for any additional information.
-- Always pass parameters by name when calling the function.
-
-## 5_send_cancelling_link
-- Always immediately call the function \`cancel_booking\` with {{ caller_number: "<caller_phone>" }}.
-- Never ask the customer for any additional information.
-- Always pass parameters by name when calling the function.
-- NEVER SAY: 'Your booking has been successfully canceled.'
-
-## 6_answer_question
-- Goal: answer briefly (1–2 sentences) using Reference Data and Booking rules.
-- Never invent information.
-- Use these policy explanations when relevant:
-{policy_explanations if policy_explanations else "  - Follow the booking rules listed below"}
-- If the question is not covered:
-  - Call function \`notify_owner\` with {{ reason: "<reason>" }}.
-- The <reason> must always be passed to the function as provided in the context.
-
-## 7_notify_owner
-- Collect caller's name and short message.
-- Always call function \`notify_owner\` with {{ reason: "<reason>" }}.
-- The <reason> must always be passed to the function as provided in the context.
-- Never ask the customer for any input.
-
-## 8_transfer_call
-Trigger conditions:
-- Direct manager request → call function \`transfer_call\` with {{ caller_number: "<caller_phone>" }} immediately
-- Three consecutive misunderstandings → call function \`transfer_call\` automatically
-- Strong dissatisfaction → ask first, then transfer if confirmed
-
-## 9_end_call
-- Ask: "Is there anything else I can help you with today?"
-- If no, say: "Thank you for calling {organization.name}. Have a wonderful day!"
-- Then stop the conversation immediately.
-
-# Reference Data
-
-{f"## Locations\n{locations_text}" if locations_text else ""}
-
-## Opening hours
-{hours_text}
-{f"- Exceptional closings:\n{closings_text}" if closings_text else ""}
-
-## Booking rules
-{booking_rules_text or "- Standard booking rules apply"}
-
-## Services
-{services_text or "- Please check our website for services"}
-
-{f"## Add-ons\n{addons_text}" if addons_text else ""}
-
-{f"## Team Members\n{team_text}" if team_text else ""}
-
-## Quick FAQs
-{faqs_text or "- Please ask for specific information"}
-
-# Error & Unclear Handling
-- First unclear: "Sorry, could you repeat that?"
-- Second unclear: "I'm having trouble understanding. Could you please repeat your request?"
-- Third unclear: Call function \`transfer_call\` and say: "Sorry, I'll connect you to a team member now."
-
-# Tool Failure Handling
-- First failure: Call the same function again in the same turn.
-- Second failure: Call function \`transfer_call\` and say: "Sorry, it still didn't work. I'll connect you to a team member now."
-
-# SMS Templates
-## Booking SMS
-{booking_sms}
-
-## Update Booking SMS
-{comm_template.confirmation_email_content[:200] if comm_template else "Use your customer portal to update your booking."}
-
-## Cancel Booking SMS
-{comm_template.cancellation_email_content[:200] if comm_template else "Use your customer portal to cancel your booking."}
-"""
-
-        return prompt.strip()
-
+        return render_prompt(organization_id)[0]
     except Organization.DoesNotExist:
         return None
@@ -0,0 +1,126 @@
+"""
+Section-based prompt template engine
+
+Prompt text lives in assistant/prompts/<locale>.txt as named blocks:
+
+    @@ services
+    ## Services
+    $items
+
+Blocks are string.Template strings. Each locale file is parsed once, at app
+startup, and locales without a file (or missing blocks) fall back to English.
+
+Rendered sections are cached individually, keyed by organization, locale and
+the version of the data behind the section (see OrganizationPrompt.section_versions),
+so a rebuild only re-renders the sections whose data changed.
+"""
+import hashlib
+import logging
+from pathlib import Path
+from string import Template
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+PROMPTS_DIR = Path(__file__).resolve().parent / 'prompts'
+DEFAULT_LOCALE = 'en'
+BLOCK_MARKER = '@@ '
+
+_templates = {}
+_fingerprint = None
+
+
+def parse_template_file(text):
+    """Split a locale file into {block_name: Template}."""
+    blocks = {}
+    name = None
+    lines = []
+    for line in text.split('\n'):
+        if line.startswith(BLOCK_MARKER):
+            if name:
+                blocks[name] = Template('\n'.join(lines).strip('\n'))
+            name = line[len(BLOCK_MARKER):].strip()
+            lines = []
+        else:
+            lines.append(line)
+    if name:
+        blocks[name] = Template('\n'.join(lines).strip('\n'))
+    return blocks
+
+
+def load_templates():
+    """Parse every locale file. Called once from AssistantConfig.ready()."""
+    global _templates, _fingerprint
+
+    digest = hashlib.sha256()
+    templates = {}
+    for path in sorted(PROMPTS_DIR.glob('*.txt')):
+        text = path.read_text(encoding='utf-8')
+        digest.update(path.name.encode('utf-8'))
+        digest.update(text.encode('utf-8'))
+        templates[path.stem] = parse_template_file(text)
+
+    default = templates.get(DEFAULT_LOCALE, {})
+    for locale, blocks in templates.items():
+        if locale != DEFAULT_LOCALE:
+            templates[locale] = {**default, **blocks}
+
+    _templates = templates
+    _fingerprint = digest.hexdigest()[:12]
+    logger.info(f"Loaded prompt templates for locales: {', '.join(sorted(templates))}")
+
+
+def get_templates(locale=None):
+    """Return the block dict for a locale, falling back to English."""
+    if not _templates:
+        load_templates()
+    return _templates.get(locale or DEFAULT_LOCALE) or _templates[DEFAULT_LOCALE]
+
+
+def templates_fingerprint():
+    if not _templates:
+        load_templates()
+    return _fingerprint
+
+
+def static_prefix(locale=None):
+    """The org-independent instruction prefix, including the trailing Reference Data header."""
+    return get_templates(locale)['prefix'].template + '\n\n'
+
+
+def assemble(prefix, section_order, segments):
+    body = '\n'.join(segments[name].rstrip('\n') + '\n' for name in section_order if segments.get(name))
+    return (prefix + body).strip()
+
+
+def segment_cache_key(organization_id, locale, section, version):
+    return f"prompt-segment:{templates_fingerprint()}:{locale}:{organization_id}:{section}:{version}"
+
+
+def render_cached_segments(organization_id, locale, section_versions, section_order, render_sections, force=False):
+    """
+    Return {section: text}, re-rendering only sections missing from the cache
+
+    Args:
+        section_versions: {section: int}, bumped whenever a section's data changes
+        render_sections: callable(missing_sections) -> {section: text}
+        force: ignore cached segments (e.g. after changing the renderers)
+    """
+    keys = {
+        name: segment_cache_key(organization_id, locale, name, section_versions.get(name, 0))
+        for name in section_order
+    }
+    cached = {} if force else cache.get_many(keys.values())
+
+    segments = {name: cached[key] for name, key in keys.items() if key in cached}
+    missing = [name for name in section_order if name not in segments]
+
+    if missing:
+        rendered = render_sections(missing)
+        segments.update(rendered)
+        timeout = getattr(settings, 'PROMPT_SEGMENT_CACHE_TIMEOUT', 60 * 60 * 24)
+        cache.set_many({keys[name]: rendered[name] for name in missing}, timeout)
+
+    return segments, missing
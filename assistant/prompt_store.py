@@ -0,0 +1,154 @@
+"""
+Materialized system prompts
+
+The compiled prompt is stored on OrganizationPrompt together with a content
+hash (served as ETag) and a version that only moves when the text actually
+changes. Saves on any prompt input model mark the sections they feed as dirty
+and schedule a single rebuild per organization when the surrounding
+transaction commits; the rebuild only re-renders the dirty sections and takes
+the rest from the segment cache.
+"""
+import hashlib
+import logging
+import threading
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+
+from gabby_booking.models import Organization, OrganizationPrompt
+from .prompt_builder import SECTION_ORDER, compile_prompt
+
+logger = logging.getLogger(__name__)
+
+
+def hash_prompt(prompt_text):
+    return hashlib.sha256(prompt_text.encode('utf-8')).hexdigest()
+
+
+def hash_sections(segments):
+    """Short per-section digests, stored so rebuilds can report which sections changed."""
+    return {name: hash_prompt(text)[:16] for name, text in segments.items()}
+
+
+def changed_sections(old_hashes, new_hashes):
+    return sorted(name for name in set(old_hashes) | set(new_hashes) if old_hashes.get(name) != new_hashes.get(name))
+
+
+def refresh_organization_prompt(organization_id, dirty_sections=None, force=False):
+    """
+    Rebuild and store the compiled prompt for an organization
+
+    Args:
+        dirty_sections: sections whose data changed; None means all of them
+        force: re-render every section even if it is cached
+
+    Returns:
+        OrganizationPrompt or None if the organization does not exist
+    """
+    with transaction.atomic():
+        locale = Organization.objects.filter(id=organization_id).values_list('locale', flat=True).first()
+        if locale is None:
+            return None
+
+        record, created = OrganizationPrompt.objects.select_for_update().get_or_create(
+            organization_id=organization_id
+        )
+
+        section_versions = dict(record.section_versions)
+        for section in SECTION_ORDER if dirty_sections is None else dirty_sections:
+            section_versions[section] = section_versions.get(section, 0) + 1
+
+        prompt_text, segments, rendered = compile_prompt(organization_id, locale, section_versions, force=force)
+        update_fields = []
+        if section_versions != record.section_versions:
+            record.section_versions = section_versions
+            update_fields.append('section_versions')
+
+        section_hashes = hash_sections(segments)
+        if section_hashes != record.section_hashes:
+            record.section_hashes = section_hashes
+            update_fields.append('section_hashes')
+
+        content_hash = hash_prompt(prompt_text)
+        if content_hash != record.content_hash:
+            record.compiled_prompt = prompt_text
+            record.content_hash = content_hash
+            record.version += 1
+            record.compiled_at = timezone.now()
+            update_fields += ['compiled_prompt', 'content_hash', 'version', 'compiled_at']
+            logger.info(f"Compiled prompt v{record.version} for organization {organization_id} (rendered: {', '.join(rendered) or 'none'})")
+
+        if update_fields:
+            record.save(update_fields=update_fields)
+
+        return record
+
+
+def get_organization_prompt(organization_id):
+    """
+    Return the materialized prompt, compiling it on first use
+
+    Returns:
+        OrganizationPrompt or None if the organization does not exist
+    """
+    record = OrganizationPrompt.objects.filter(organization_id=organization_id).first()
+    if record and record.version:
+        return record
+    return refresh_organization_prompt(organization_id)
+
+
+# (connection alias, organization id) -> the _PromptRefresh waiting for that
+# connection's transaction to commit; per thread, like the connections themselves
+_pending = threading.local()
+
+
+def _pending_refreshes():
+    if not hasattr(_pending, 'refreshes'):
+        _pending.refreshes = {}
+    return _pending.refreshes
+
+
+class _PromptRefresh:
+    """on_commit callback collecting the dirty sections of one organization until it runs."""
+
+    def __init__(self, key, sections):
+        self.key = key
+        self.organization_id = key[1]
+        self.sections = set(sections)
+        self.done = False
+
+    def __call__(self):
+        if self.done:
+            return
+        self.done = True
+        refreshes = _pending_refreshes()
+        if refreshes.get(self.key) is self:
+            del refreshes[self.key]
+        try:
+            refresh_organization_prompt(self.organization_id, dirty_sections=sorted(self.sections))
+        except Exception as e:
+            logger.error(f"Error refreshing prompt for organization {self.organization_id}: {str(e)}")
+
+
+def schedule_prompt_refresh(organization_id, sections, using=None):
+    """
+    Rebuild the given prompt sections once the current transaction commits
+
+    Bulk saves (e.g. business hours for seven days) inside one transaction
+    collapse into a single rebuild covering every dirty section. Outside a
+    transaction the rebuild runs immediately.
+    """
+    if organization_id is None:
+        return
+
+    using = using or DEFAULT_DB_ALIAS
+    key = (using, organization_id)
+    refreshes = _pending_refreshes()
+    refresh = refreshes.get(key)
+    if refresh is None or refresh.done:
+        refresh = refreshes[key] = _PromptRefresh(key, sections)
+    else:
+        refresh.sections.update(sections)
+    # Registered for every save, not just the first: a rolled-back savepoint drops its
+    # callbacks, and any one that survives runs the merged refresh (the rest are no-ops)
+    transaction.on_commit(refresh, using=using)
@@ -0,0 +1,51 @@
+"""
+Keep materialized prompts in sync with the models the prompt sections read
+"""
+from django.db.models.signals import post_save, post_delete
+
+from gabby_booking.models import (
+    Organization, Service, Option, BusinessHours, ExceptionalClosing,
+    OrganizationFAQ, Assistant, BookingRule, CommunicationTemplate,
+    ServiceLocation, Location, TeamMember, TeamMemberConfig
+)
+from .prompt_store import schedule_prompt_refresh
+
+# Prompt sections (see prompt_builder.SECTION_ORDER) fed by each model
+PROMPT_INPUT_MODELS = {
+    Assistant: ['identity'],
+    Service: ['services'],
+    Option: ['addons'],
+    BusinessHours: ['hours'],
+    ExceptionalClosing: ['hours'],
+    OrganizationFAQ: ['faqs'],
+    BookingRule: ['policies', 'rules'],
+    CommunicationTemplate: ['sms'],
+    ServiceLocation: ['locations'],
+    TeamMember: ['team'],
+    TeamMemberConfig: ['team'],
+}
+LOCATION_SECTIONS = ['locations', 'team']
+
+
+def organization_changed(sender, instance, **kwargs):
+    schedule_prompt_refresh(instance.id, ['identity'], using=kwargs.get('using'))
+
+
+def prompt_input_changed(sender, instance, **kwargs):
+    schedule_prompt_refresh(instance.organization_id, PROMPT_INPUT_MODELS[sender], using=kwargs.get('using'))
+
+
+def location_changed(sender, instance, **kwargs):
+    organization_id = ServiceLocation.objects.filter(
+        id=instance.service_location_id
+    ).values_list('organization_id', flat=True).first()
+    schedule_prompt_refresh(organization_id, LOCATION_SECTIONS, using=kwargs.get('using'))
+
+
+def connect_signals():
+    post_save.connect(organization_changed, sender=Organization, dispatch_uid='prompt_organization_saved')
+    for model in PROMPT_INPUT_MODELS:
+        post_save.connect(prompt_input_changed, sender=model, dispatch_uid=f'prompt_{model.__name__}_saved')
+        post_delete.connect(prompt_input_changed, sender=model, dispatch_uid=f'prompt_{model.__name__}_deleted')
+    post_save.connect(location_changed, sender=Location, dispatch_uid='prompt_location_saved')
+    post_delete.connect(location_changed, sender=Location, dispatch_uid='prompt_location_deleted')
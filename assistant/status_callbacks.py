@@ -0,0 +1,243 @@
+"""
+Twilio status callbacks
+
+Twilio posts a callback for every state change of a message (queued, sent,
+delivered, ...) and of a call (ringing, in-progress, completed). A burst of
+bookings or calls is a burst of callbacks, so the endpoints (views.sms_status
+and views.call_status) only check the signature and add the update to an
+in-memory buffer; they never touch the database.
+
+A flusher thread writes the buffer every STATUS_CALLBACK_FLUSH_SECONDS, or
+sooner once STATUS_CALLBACK_BATCH_SIZE updates are waiting: one transaction
+with a SELECT and a bulk_update per kind, plus an upsert for calls that
+were never logged by the media stream. Updates to the same SID are coalesced
+and a status never moves backwards (callbacks can arrive out of order), so
+each row is written at most once per flush.
+
+Buffered updates are flushed when the process exits; a crash loses at most
+one interval of status updates, which are informational only.
+"""
+import atexit
+import logging
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from gabby_booking.models import Assistant, OutboundSMS
+from .models import CallLog
+
+logger = logging.getLogger(__name__)
+
+# Later states rank higher; an update never replaces a higher-ranked status
+MESSAGE_STATUS_RANK = {
+    'accepted': 0, 'scheduled': 0, 'queued': 0, 'sending': 1, 'sent': 2,
+    'delivered': 3, 'undelivered': 3, 'failed': 3, 'canceled': 3, 'read': 4,
+}
+CALL_STATUS_RANK = {
+    'queued': 0, 'initiated': 0, 'ringing': 1, 'in-progress': 2,
+    'completed': 3, 'busy': 3, 'failed': 3, 'no-answer': 3, 'canceled': 3,
+}
+MAX_BUFFERED = 50000
+
+
+@lru_cache(maxsize=1)
+def _validator(auth_token):
+    from twilio.request_validator import RequestValidator
+    return RequestValidator(auth_token)
+
+
+def valid_twilio_request(request):
+    """Whether the request carries a valid X-Twilio-Signature for TWILIO_AUTH_TOKEN."""
+    auth_token = getattr(settings, 'TWILIO_AUTH_TOKEN', None)
+    if not auth_token:
+        logger.error("TWILIO_AUTH_TOKEN is not configured; rejecting Twilio callback")
+        return False
+    # Behind ngrok or a proxy the public URL Twilio signed differs from the local one
+    base_url = getattr(settings, 'TWILIO_CALLBACK_BASE_URL', '')
+    url = f"{base_url.rstrip('/')}{request.get_full_path()}" if base_url else request.build_absolute_uri()
+    return _validator(auth_token).validate(url, request.POST.dict(), request.headers.get('X-Twilio-Signature', ''))
+
+
+def _rank(ranks, value):
+    return ranks.get(value, -1) if value else -1
+
+
+class StatusBuffer:
+    """Coalesced message and call status updates waiting to be written."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._messages = {}
+        self._calls = {}
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add_message(self, sid, status, error_code=''):
+        self._add(self._messages, MESSAGE_STATUS_RANK, sid, {'status': status, 'error_code': error_code})
+
+    def add_call(self, sid, status, duration=None, to_number='', from_number=''):
+        self._add(self._calls, CALL_STATUS_RANK, sid, {
+            'status': status, 'duration': duration, 'to_number': to_number, 'from_number': from_number,
+        })
+
+    def _add(self, pending, ranks, sid, update):
+        update['at'] = timezone.now()
+        with self._lock:
+            if len(self._messages) + len(self._calls) >= MAX_BUFFERED and sid not in pending:
+                logger.warning(f"Status buffer full, dropping {update['status']} update for {sid}")
+                return
+            current = pending.get(sid)
+            if current is None or _rank(ranks, update['status']) >= _rank(ranks, current['status']):
+                # Keep details (duration, numbers) an earlier callback carried
+                pending[sid] = {**(current or {}), **{key: value for key, value in update.items() if value not in (None, '')}}
+            size = len(self._messages) + len(self._calls)
+        if size >= getattr(settings, 'STATUS_CALLBACK_BATCH_SIZE', 500):
+            self._wake.set()
+        self._ensure_flusher()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._messages) + len(self._calls)
+
+    def _take(self):
+        with self._lock:
+            messages, self._messages = self._messages, {}
+            calls, self._calls = self._calls, {}
+        return messages, calls
+
+    def _restore(self, messages, calls):
+        """Put back updates a failed flush did not write, unless a later status arrived meanwhile."""
+        with self._lock:
+            for pending, ranks, updates in ((self._messages, MESSAGE_STATUS_RANK, messages), (self._calls, CALL_STATUS_RANK, calls)):
+                for sid, update in updates.items():
+                    current = pending.get(sid)
+                    if current is None or _rank(ranks, update['status']) > _rank(ranks, current['status']):
+                        pending[sid] = update
+
+    def flush(self):
+        """
+        Write everything buffered
+
+        Returns:
+            (messages updated, calls updated or created)
+        """
+        messages, calls = self._take()
+        if not messages and not calls:
+            return 0, 0
+        try:
+            with transaction.atomic():
+                written = write_message_statuses(messages), write_call_statuses(calls)
+        except Exception as e:
+            logger.error(f"Status callback flush failed, keeping {len(messages) + len(calls)} updates: {e}")
+            self._restore(messages, calls)
+            return 0, 0
+        logger.info(f"Flushed {len(messages)} message and {len(calls)} call status updates")
+        return written
+
+    def _ensure_flusher(self):
+        # None disables the thread; tests call flush() themselves
+        if self._thread is not None or getattr(settings, 'STATUS_CALLBACK_FLUSH_SECONDS', 0.25) is None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='status-callback-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        interval = getattr(settings, 'STATUS_CALLBACK_FLUSH_SECONDS', 0.25)
+        while True:
+            self._wake.wait(interval)
+            self._wake.clear()
+            close_old_connections()
+            self.flush()
+
+
+def write_message_statuses(updates):
+    """Apply coalesced message updates keyed by MessageSid; returns the number of rows changed."""
+    if not updates:
+        return 0
+    changed = []
+    for message in OutboundSMS.objects.filter(sid__in=updates).only('id', 'sid', 'delivery_status', 'error_code', 'delivered_at'):
+        update = updates[message.sid]
+        if _rank(MESSAGE_STATUS_RANK, update['status']) < _rank(MESSAGE_STATUS_RANK, message.delivery_status):
+            continue
+        message.delivery_status = update['status']
+        message.error_code = update.get('error_code', message.error_code)
+        if update['status'] == 'delivered':
+            message.delivered_at = update['at']
+        changed.append(message)
+    return OutboundSMS.objects.bulk_update(changed, ['delivery_status', 'error_code', 'delivered_at']) if changed else 0
+
+
+def write_call_statuses(updates):
+    """Apply coalesced call updates keyed by CallSid; calls not logged yet are created."""
+    if not updates:
+        return 0
+    calls = {call.call_sid: call for call in CallLog.objects.filter(call_sid__in=updates).only('id', 'call_sid', 'status', 'duration', 'ended_at')}
+    changed = []
+    missing = {}
+    for sid, update in updates.items():
+        call = calls.get(sid)
+        if call is None:
+            missing[sid] = update
+            continue
+        if _rank(CALL_STATUS_RANK, update['status']) < _rank(CALL_STATUS_RANK, call.status):
+            continue
+        _apply_call_update(call, update)
+        changed.append(call)
+    written = CallLog.objects.bulk_update(changed, ['status', 'duration', 'ended_at']) if changed else 0
+    if missing:
+        written += create_call_logs(missing)
+    return written
+
+
+def create_call_logs(updates):
+    """
+    Insert call logs for calls the media stream never logged
+
+    A log the media stream inserted after our SELECT is updated instead (an
+    upsert on call_sid), so the status update is applied rather than dropped.
+
+    Returns:
+        int: number of calls inserted or updated
+    """
+    # The organization is the one owning the dialled number
+    organizations = dict(Assistant.objects.filter(
+        twilio_phone_number__in={update.get('to_number') for update in updates.values()}
+    ).values_list('twilio_phone_number', 'organization_id'))
+    new_calls = []
+    for sid, update in updates.items():
+        organization_id = organizations.get(update.get('to_number'))
+        if organization_id is None:
+            logger.warning(f"Status callback for unknown call {sid} to {update.get('to_number')}")
+            continue
+        call = CallLog(call_sid=sid, organization_id=organization_id, caller_number=update.get('from_number', ''))
+        _apply_call_update(call, update)
+        new_calls.append(call)
+    if new_calls:
+        CallLog.objects.bulk_create(
+            new_calls, update_conflicts=True, unique_fields=['call_sid'], update_fields=['status', 'duration', 'ended_at'],
+        )
+    return len(new_calls)
+
+
+def _apply_call_update(call, update):
+    call.status = update['status']
+    if update.get('duration') is not None:
+        call.duration = update['duration']
+    if CALL_STATUS_RANK.get(update['status']) == 3:
+        call.ended_at = update['at']
+
+
+status_buffer = StatusBuffer()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        status_buffer.flush()
+    except Exception as e:
+        logger.error(f"Could not flush status callbacks at exit: {e}")
@@ -1,3 +1,321 @@
-from django.test import TestCase
+import statistics
+import time as clock
+from datetime import datetime, time, timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from gabby_booking.models import (
+    Organization, Assistant, Service, Option, OrganizationFAQ, BookingRule, BusinessHours,
+    ServiceLocation, Location, TeamMember, TeamMemberConfig, CommunicationTemplate, Appointment, Customer, OutboundSMS
+)
+from users.models import User
+from .availability_tool import check_availability, warm_availability
+from .models import CallLog
+from .prompt_builder import build_system_prompt
+from .prompt_engine import static_prefix, parse_template_file
+from .prompt_store import get_organization_prompt, refresh_organization_prompt
+from .status_callbacks import create_call_logs, status_buffer
+
+STATIC_PROMPT_PREFIX = static_prefix('en')
+
+
+class PromptLayoutTests(TestCase):
+    """The static instruction prefix must be byte-identical for every organization."""
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+
+    def make_org(self, name, assistant_name, greeting):
+        organization = Organization.objects.create(owner=self.owner, name=name, industry='Wellness', description=f'{name} description')
+        Assistant.objects.create(organization=organization, name=assistant_name, voice_type='alloy', greeting_message=greeting)
+        Service.objects.create(organization=organization, name=f'{name} massage', price=80, duration=60, detail='Relaxing')
+        OrganizationFAQ.objects.create(organization=organization, question='Do you have parking?', answer=f'Yes, behind {name}.')
+        BookingRule.objects.create(organization=organization, allow_modifications=False, allow_cancellations=True, cancellation_deadline='24 hours')
+        return organization
+
+    def test_prefix_is_identical_across_organizations(self):
+        first = self.make_org('Serenity Spa', 'Clara', 'Hi, Serenity Spa, Clara speaking.')
+        second = self.make_org('Downtown Yoga', 'Max', 'Downtown Yoga, this is Max.')
+
+        first_prompt = build_system_prompt(first.id)
+        second_prompt = build_system_prompt(second.id)
+
+        self.assertTrue(first_prompt.startswith(STATIC_PROMPT_PREFIX))
+        self.assertTrue(second_prompt.startswith(STATIC_PROMPT_PREFIX))
+        self.assertNotEqual(first_prompt, second_prompt)
+
+    def test_prefix_contains_no_org_specific_values(self):
+        organization = self.make_org('Serenity Spa', 'Clara', 'Hi, Serenity Spa, Clara speaking.')
+        prompt = build_system_prompt(organization.id)
+
+        for value in ['Serenity Spa', 'Clara', '24 hours', 'parking']:
+            self.assertNotIn(value, STATIC_PROMPT_PREFIX)
+            self.assertIn(value, prompt[len(STATIC_PROMPT_PREFIX):])
+
+    def test_missing_organization_returns_none(self):
+        self.assertIsNone(build_system_prompt(999999))
+
+
+class MaterializedPromptTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.organization = Organization.objects.create(owner=owner, name='Serenity Spa')
+
+    def test_version_moves_only_when_prompt_changes(self):
+        first = get_organization_prompt(self.organization.id)
+        self.assertEqual(first.version, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.organization.current_step = 5
+            self.organization.save()
+        self.assertEqual(get_organization_prompt(self.organization.id).version, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            OrganizationFAQ.objects.create(organization=self.organization, question='Parking?', answer='Yes')
+            OrganizationFAQ.objects.create(organization=self.organization, question='Showers?', answer='No')
+        second = get_organization_prompt(self.organization.id)
+        self.assertEqual(second.version, 2)
+        self.assertIn('Showers?', second.compiled_prompt)
+
+    def test_refresh_survives_a_rolled_back_savepoint(self):
+        self.assertEqual(get_organization_prompt(self.organization.id).version, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    OrganizationFAQ.objects.create(organization=self.organization, question='Lockers?', answer='Yes')
+                    raise ValueError
+            except ValueError:
+                pass
+            OrganizationFAQ.objects.create(organization=self.organization, question='Showers?', answer='No')
+        record = get_organization_prompt(self.organization.id)
+        self.assertEqual(record.version, 2)
+        self.assertIn('Showers?', record.compiled_prompt)
+        self.assertNotIn('Lockers?', record.compiled_prompt)
+
+    def test_get_prompt_honours_if_none_match(self):
+        response = self.client.get('/assistant/get-prompt/', {'org_id': self.organization.id})
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.client.get('/assistant/get-prompt/', {'org_id': self.organization.id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class PromptSegmentTests(TestCase):
+    """Only the sections whose data changed are re-rendered."""
+
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.organization = Organization.objects.create(owner=owner, name='Serenity Spa')
+            Service.objects.create(organization=self.organization, name='Massage', price=80, duration=60)
+            OrganizationFAQ.objects.create(organization=self.organization, question='Parking?', answer='Yes')
+
+    def test_faq_edit_only_rerenders_faqs(self):
+        with CaptureQueriesContext(connection) as context:
+            with self.captureOnCommitCallbacks(execute=True):
+                OrganizationFAQ.objects.create(organization=self.organization, question='Showers?', answer='No')
+
+        tables = ' '.join(query['sql'] for query in context.captured_queries)
+        self.assertNotIn('FROM "gabby_booking_service"', tables)
+        self.assertNotIn('FROM "gabby_booking_businesshours"', tables)
+
+        record = get_organization_prompt(self.organization.id)
+        self.assertIn('Showers?', record.compiled_prompt)
+        self.assertIn('Massage', record.compiled_prompt)
+        self.assertEqual(record.compiled_prompt, build_system_prompt(self.organization.id))
+
+    def test_forced_rebuild_matches_incremental(self):
+        incremental = get_organization_prompt(self.organization.id).compiled_prompt
+        forced = refresh_organization_prompt(self.organization.id, force=True).compiled_prompt
+        self.assertEqual(incremental, forced)
+
+    def test_locale_falls_back_to_english(self):
+        self.organization.locale = 'xx'
+        self.organization.save()
+        self.assertTrue(build_system_prompt(self.organization.id).startswith(STATIC_PROMPT_PREFIX))
+
+    def test_parse_template_file(self):
+        blocks = parse_template_file('@@ first\nHello $name\n\n@@ second\nBye\n')
+        self.assertEqual(blocks['first'].substitute(name='Clara'), 'Hello Clara')
+        self.assertEqual(blocks['second'].template, 'Bye')
+
+    def test_rebuild_command_reports_changed_sections(self):
+        get_organization_prompt(self.organization.id)
+        OrganizationFAQ.objects.filter(organization=self.organization).update(answer='Behind the building')
+
+        out = StringIO()
+        call_command('rebuild_prompts', workers=1, stdout=out)
+        self.assertIn('changed: 1', out.getvalue())
+        self.assertIn('faqs: 1', out.getvalue())
+        self.assertIn('Behind the building', get_organization_prompt(self.organization.id).compiled_prompt)
+
+
+class PromptQueryCountTests(TestCase):
+    """build_system_prompt must not issue more queries as an organization grows."""
+
+    def setUp(self):
+        owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        self.organization = Organization.objects.create(owner=owner, name='Serenity Spa')
+        Assistant.objects.create(organization=self.organization, name='Clara', voice_type='alloy')
+        BookingRule.objects.create(organization=self.organization)
+        CommunicationTemplate.objects.create(organization=self.organization, booking_sms_content='{{booking_link}}')
+        TeamMemberConfig.objects.create(organization=self.organization, has_multiple_members=True)
+        self.service_location = ServiceLocation.objects.create(organization=self.organization, address_type='multiple-locations')
+        self.add_rows(1)
+
+    def add_rows(self, count):
+        for i in range(count):
+            location = Location.objects.create(service_location=self.service_location, name=f'Room {i}', address='1 Main St')
+            Service.objects.create(organization=self.organization, name=f'Service {i}', price=50, duration=30, detail='')
+            Option.objects.create(organization=self.organization, name=f'Add-on {i}', price=10, duration=15)
+            OrganizationFAQ.objects.create(organization=self.organization, question=f'Question {i}?', answer='Answer')
+            TeamMember.objects.create(organization=self.organization, location=location, name=f'Member {i}', email=f'm{i}@example.com')
+            BusinessHours.objects.create(organization=self.organization, day_of_week='Monday', hours_type='closed')
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            build_system_prompt(self.organization.id)
+        return len(context.captured_queries)
+
+    def test_query_count_is_constant(self):
+        small = self.count_queries()
+        self.add_rows(25)
+        large = self.count_queries()
+
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, 8)
+
+
+class AvailabilityToolTests(TestCase):
+    """check_availability answers from the warmed cache, well inside the voice latency budget."""
+
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        self.organization = Organization.objects.create(owner=owner, name='Serenity Spa')
+        self.service = Service.objects.create(organization=self.organization, name='Deep tissue massage', price=80, duration=60, detail='')
+        Service.objects.create(organization=self.organization, name='Facial', price=60, duration=45, detail='')
+        self.now = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time(8, 0)))
+        BusinessHours.objects.create(
+            organization=self.organization, day_of_week=self.now.strftime('%A'), hours_type='custom',
+            open_time=time(9, 0), close_time=time(17, 0), break_start_time=time(12, 0), break_end_time=time(13, 0)
+        )
+
+    def test_spoken_slots_and_fallback_to_next_openings(self):
+        answer = check_availability(self.organization.id, 'massage', 'today', 'afternoon', now=self.now)
+        self.assertEqual(answer, 'For Deep tissue massage this afternoon I have 1 pm, 1:30 pm or 2 pm.')
+
+        customer = Customer.objects.create(organization=self.organization, email='c@example.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(
+                organization=self.organization, customer=customer, service=self.service,
+                date=self.now.date(), time=time(13, 0), duration=240, total_price=80, status='confirmed'
+            )
+        answer = check_availability(self.organization.id, 'massage', 'today', 'afternoon', now=self.now)
+        next_week = self.now.date() + timedelta(days=7)
+        self.assertEqual(answer, (
+            'I have nothing this afternoon for Deep tissue massage. The next openings for Deep tissue massage are '
+            f"{next_week.strftime('%A, %B')} {next_week.day} at 9 am, 9:30 am or 10 am."
+        ))
+        self.assertIn('We offer Deep tissue massage or Facial', check_availability(self.organization.id, 'pedicure'))
+
+    def test_warmed_answers_stay_within_budget(self):
+        warm_availability(self.organization.id)
+        timings = []
+        with CaptureQueriesContext(connection) as context:
+            for _ in range(20):
+                started = clock.perf_counter()
+                check_availability(self.organization.id, 'facial', 'tomorrow', now=self.now - timedelta(days=1))
+                timings.append(clock.perf_counter() - started)
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertLess(statistics.quantiles(timings, n=20)[-1], 0.05)
+
+
+@override_settings(TWILIO_AUTH_TOKEN='test-token', TWILIO_CALLBACK_BASE_URL='', STATUS_CALLBACK_FLUSH_SECONDS=None)
+class StatusCallbackTests(TestCase):
+
+    def setUp(self):
+        status_buffer.flush()
+        owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        self.organization = Organization.objects.create(owner=owner, name='Serenity Spa')
+        Assistant.objects.create(organization=self.organization, name='Clara', voice_type='alloy', twilio_phone_number='+15550001111')
+
+    def post(self, path, params, signed=True):
+        from twilio.request_validator import RequestValidator
+        signature = RequestValidator('test-token').compute_signature(f'http://testserver{path}', params) if signed else 'bogus'
+        return self.client.post(path, params, HTTP_X_TWILIO_SIGNATURE=signature)
+
+    def test_message_callbacks_are_buffered_and_written_in_one_batch(self):
+        now = timezone.now()
+        OutboundSMS.objects.bulk_create([
+            OutboundSMS(organization=self.organization, to_number='+15551234567', body='Hi', status='sent',
+                        next_attempt_at=now, sid=f'SM{i}') for i in range(20)
+        ])
+        self.assertEqual(self.post('/assistant/sms-status/', {'MessageSid': 'SM0', 'MessageStatus': 'sent'}, signed=False).status_code, 403)
+
+        with CaptureQueriesContext(connection) as requests:
+            for i in range(20):
+                for message_status in ('queued', 'delivered', 'sent'):
+                    # 'sent' arriving after 'delivered' must not move the status back
+                    response = self.post('/assistant/sms-status/', {'MessageSid': f'SM{i}', 'MessageStatus': message_status})
+                    self.assertEqual(response.status_code, 204)
+        self.assertEqual(len(requests.captured_queries), 0)
+        self.assertEqual(len(status_buffer), 20)
+
+        with CaptureQueriesContext(connection) as flush:
+            self.assertEqual(status_buffer.flush(), (20, 0))
+        # SELECT and one bulk UPDATE, inside a savepoint
+        self.assertLessEqual(len(flush.captured_queries), 4)
+        self.assertEqual(set(OutboundSMS.objects.values_list('delivery_status', flat=True)), {'delivered'})
+        self.assertEqual(OutboundSMS.objects.filter(delivered_at__isnull=True).count(), 0)
+
+    def test_call_callbacks_update_and_create_call_logs(self):
+        CallLog.objects.create(organization=self.organization, call_sid='CA1', caller_number='+15559990000')
+        for params in (
+            {'CallSid': 'CA1', 'CallStatus': 'in-progress', 'To': '+15550001111', 'From': '+15559990000'},
+            {'CallSid': 'CA1', 'CallStatus': 'completed', 'CallDuration': '125', 'To': '+15550001111', 'From': '+15559990000'},
+            {'CallSid': 'CA2', 'CallStatus': 'no-answer', 'CallDuration': '0', 'To': '+15550001111', 'From': '+15558880000'},
+            {'CallSid': 'CA3', 'CallStatus': 'completed', 'To': '+15550002222', 'From': '+15558880000'},
+        ):
+            self.assertEqual(self.post('/assistant/call-status/', params).status_code, 204)
+        self.assertEqual(status_buffer.flush(), (0, 2))
+
+        answered = CallLog.objects.get(call_sid='CA1')
+        self.assertEqual((answered.status, answered.duration), ('completed', 125))
+        self.assertIsNotNone(answered.ended_at)
+        missed = CallLog.objects.get(call_sid='CA2')
+        self.assertEqual((missed.organization_id, missed.status, missed.caller_number), (self.organization.id, 'no-answer', '+15558880000'))
+        # Unknown number: nothing to attach it to
+        self.assertFalse(CallLog.objects.filter(call_sid='CA3').exists())
+
+    def test_call_logged_after_the_lookup_is_updated_not_dropped(self):
+        # The media stream logged the call between the flush's SELECT and its insert
+        CallLog.objects.create(organization=self.organization, call_sid='CA1', caller_number='+15559990000', prompt_version=3)
+        update = {'status': 'completed', 'duration': 60, 'to_number': '+15550001111', 'from_number': '', 'at': timezone.now()}
+        self.assertEqual(create_call_logs({'CA1': update}), 1)
+
+        call = CallLog.objects.get(call_sid='CA1')
+        self.assertEqual((call.status, call.duration, call.caller_number, call.prompt_version), ('completed', 60, '+15559990000', 3))
+        self.assertEqual(create_call_logs({'CA9': {**update, 'to_number': '+15550002222'}}), 0)
+
+
+class StartupImportTests(SimpleTestCase):
+    """Heavy SDKs must be loaded lazily through sonoria_backend.clients."""
+
+    def test_startup_does_not_import_lazy_sdks(self):
+        from startup_benchmark import run_once
+
+        timing, imports = run_once()
+        self.assertEqual(timing['lazy_loaded'], [])
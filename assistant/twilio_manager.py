@@ -1,21 +1,20 @@
-import os
-from twilio.rest import Client
 import logging
 
+from sonoria_backend.clients import get_twilio_client
+
 logger = logging.getLogger(__name__)
 
-TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
-TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
 
-def get_twilio_client():
-    if not TWILIO_ACCOUNT_SID or not TWILIO_AUTH_TOKEN:
-        return None
-    return Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+def _status_callback_params(status_callback_url):
+    if not status_callback_url:
+        return {}
+    return {'status_callback': status_callback_url, 'status_callback_method': 'POST'}
 
 
-def buy_phone_number(organization_id, webhook_url):
+def buy_phone_number(organization_id, webhook_url, status_callback_url=None):
     """
     Buy a new phone number from Twilio and configure it
+    status_callback_url receives call status updates (views.call_status)
     Returns: (phone_number, phone_sid) or (None, None) if failed
     """
     try:
@@ -37,7 +36,8 @@ def buy_phone_number(organization_id, webhook_url):
         incoming_phone = client.incoming_phone_numbers.create(
             phone_number=phone_number,
             voice_url=webhook_url,
-            voice_method='POST'
+            voice_method='POST',
+            **_status_callback_params(status_callback_url)
         )
 
         logger.info(f"Purchased phone number: {phone_number} with SID: {incoming_phone.sid}")
@@ -48,9 +48,9 @@ def buy_phone_number(organization_id, webhook_url):
         return None, None
 
 
-def update_phone_webhook(phone_sid, webhook_url):
+def update_phone_webhook(phone_sid, webhook_url, status_callback_url=None):
     """
-    Update the webhook URL for an existing phone number
+    Update the webhook URL (and call status callback) for an existing phone number
     """
     try:
         client = get_twilio_client()
@@ -60,7 +60,8 @@ def update_phone_webhook(phone_sid, webhook_url):
 
         client.incoming_phone_numbers(phone_sid).update(
             voice_url=webhook_url,
-            voice_method='POST'
+            voice_method='POST',
+            **_status_callback_params(status_callback_url)
         )
 
         logger.info(f"Updated webhook for {phone_sid} to {webhook_url}")
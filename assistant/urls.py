@@ -3,6 +3,8 @@ from . import views
 
 urlpatterns = [
     path('incoming-call/', views.incoming_call, name='assistant_incoming_call'),
+    path('sms-status/', views.sms_status, name='assistant_sms_status'),
+    path('call-status/', views.call_status, name='assistant_call_status'),
     path('session-token/', views.get_session_token, name='assistant_session_token'),
     path('send-sms/', views.send_sms, name='assistant_send_sms'),
     path('get-prompt/', views.get_prompt, name='assistant_get_prompt'),
@@ -1,13 +1,15 @@
 import os
 from django.http import HttpResponse
+from django.utils.http import parse_etags, quote_etag
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 from twilio.twiml.voice_response import VoiceResponse, Connect, Stream
-from twilio.rest import Client
-from .prompt_builder import build_system_prompt
+from sonoria_backend.clients import get_twilio_client
+from .prompt_store import get_organization_prompt
+from .status_callbacks import status_buffer, valid_twilio_request
 from gabby_booking.models import Organization, Assistant, FallbackNumber
 import logging
 from django.conf import settings
@@ -15,16 +17,11 @@ from django.conf import settings
 logger = logging.getLogger(__name__)
 
 # Twilio credentials from Django settings
-TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
-TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
 TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER')
 
 # OpenAI credentials
 OPENAI_API_KEY = getattr(settings, 'OPENAI_API_KEY', os.getenv('OPENAI_API_KEY'))
 
-# Initialize Twilio client
-twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN) if TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN else None
-
 
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
@@ -98,6 +95,48 @@ def incoming_call(request):
         return HttpResponse("Internal server error", status=500)
 
 
+@csrf_exempt
+@require_http_methods(["POST"])
+def sms_status(request):
+    """
+    Twilio message status callback; buffered and written in batches (status_callbacks.py)
+
+    POST /assistant/sms-status/  (MessageSid, MessageStatus, ErrorCode)
+    """
+    if not valid_twilio_request(request):
+        return HttpResponse("Invalid signature", status=403)
+    message_sid = request.POST.get('MessageSid')
+    message_status = request.POST.get('MessageStatus')
+    if not message_sid or not message_status:
+        return HttpResponse("MessageSid and MessageStatus required", status=400)
+    status_buffer.add_message(message_sid, message_status, request.POST.get('ErrorCode', ''))
+    return HttpResponse(status=204)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def call_status(request):
+    """
+    Twilio call status callback; buffered and written in batches (status_callbacks.py)
+
+    POST /assistant/call-status/  (CallSid, CallStatus, CallDuration, To, From)
+    """
+    if not valid_twilio_request(request):
+        return HttpResponse("Invalid signature", status=403)
+    call_sid = request.POST.get('CallSid')
+    call_status_value = request.POST.get('CallStatus')
+    if not call_sid or not call_status_value:
+        return HttpResponse("CallSid and CallStatus required", status=400)
+    duration = request.POST.get('CallDuration')
+    status_buffer.add_call(
+        call_sid, call_status_value,
+        duration=int(duration) if duration and duration.isdigit() else None,
+        to_number=request.POST.get('To', ''),
+        from_number=request.POST.get('From', ''),
+    )
+    return HttpResponse(status=204)
+
+
 @api_view(['GET'])
 def get_session_token(request):
     """
@@ -138,6 +177,7 @@ def send_sms(request):
     Send SMS using Twilio
     """
     try:
+        twilio_client = get_twilio_client()
         if not twilio_client:
             return Response({'error': 'Twilio not configured'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -164,7 +204,10 @@ def send_sms(request):
 @api_view(['GET'])
 def get_prompt(request):
     """
-    Get the system prompt for an organization
+    Get the materialized system prompt for an organization
+    Supports conditional requests: send the ETag back as If-None-Match to get a 304
+
+    GET /assistant/get-prompt/?org_id=<id>
     """
     try:
         organization_id = request.GET.get('org_id')
@@ -172,12 +215,24 @@ def get_prompt(request):
         if not organization_id:
             return Response({'error': 'organization_id required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        prompt = build_system_prompt(organization_id)
+        prompt = get_organization_prompt(organization_id)
 
         if not prompt:
             return Response({'error': 'Organization not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        return Response({'prompt': prompt}, status=status.HTTP_200_OK)
+        etag = quote_etag(prompt.content_hash)
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            client_etags = [tag.removeprefix('W/') for tag in parse_etags(if_none_match)]
+            if etag in client_etags or '*' in client_etags:
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        return Response({
+            'prompt': prompt.compiled_prompt,
+            'version': prompt.version,
+            'content_hash': prompt.content_hash,
+            'compiled_at': prompt.compiled_at,
+        }, status=status.HTTP_200_OK, headers={'ETag': etag})
 
     except Exception as e:
         logger.error(f"Error getting prompt: {str(e)}")
@@ -190,6 +245,7 @@ def transfer_call(request):
     Transfer call to fallback number
     """
     try:
+        twilio_client = get_twilio_client()
         if not twilio_client:
             return Response({'error': 'Twilio not configured'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -279,6 +335,7 @@ def create_assistant_with_number(request):
         if ngrok_url:
             # Use ngrok URL for webhooks
             webhook_url = f"{ngrok_url}/assistant/incoming-call/"
+            status_callback_url = f"{ngrok_url}/assistant/call-status/"
         else:
             # Fallback to request host
             host = request.get_host()
@@ -292,9 +349,10 @@ def create_assistant_with_number(request):
 
             protocol = 'https' if request.is_secure() else 'http'
             webhook_url = f"{protocol}://{host}/assistant/incoming-call/"
+            status_callback_url = f"{protocol}://{host}/assistant/call-status/"
 
         # Buy phone number
-        phone_number, phone_sid = buy_phone_number(organization_id, webhook_url)
+        phone_number, phone_sid = buy_phone_number(organization_id, webhook_url, status_callback_url)
 
         if not phone_number:
             return Response({'error': 'Failed to purchase phone number. Check server logs for details.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
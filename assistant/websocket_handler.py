@@ -4,9 +4,15 @@ import websockets
 import os
 import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
-from .prompt_builder import build_system_prompt
-from gabby_booking.models import Organization, Assistant, CommunicationTemplate
+from sonoria_backend.clients import get_twilio_client
+from .prompt_store import get_organization_prompt
+from .availability_tool import TOOL_DEFINITION as CHECK_AVAILABILITY_TOOL, budget_seconds, check_availability, warm_availability
+from .models import CallLog
+from gabby_booking.message_templates import render_message
+from gabby_booking.sms_outbox import claim_sms_send, record_sent_sms, release_sms_send, status_callback_url
+from gabby_booking.models import Organization, Assistant
 from asgiref.sync import sync_to_async
+from django.db import connections
 
 logger = logging.getLogger(__name__)
 
@@ -93,8 +99,13 @@ class MediaStreamConsumer(AsyncWebsocketConsumer):
             )()
             voice = assistant.voice_type if assistant else 'alloy'
 
-            # Build system prompt
-            system_prompt = await sync_to_async(build_system_prompt)(self.organization_id)
+            # Load the materialized system prompt and record which version this call uses
+            prompt = await sync_to_async(get_organization_prompt)(self.organization_id)
+            system_prompt = prompt.compiled_prompt if prompt else None
+            await sync_to_async(self.record_call)(prompt.version if prompt else None)
+
+            # Compute the coming days while the greeting plays so check_availability hits the cache
+            asyncio.create_task(self.warm_availability())
 
             # Connect to OpenAI
             self.openai_ws = await websockets.connect(
@@ -118,6 +129,7 @@ class MediaStreamConsumer(AsyncWebsocketConsumer):
                     "temperature": 0.6,
                     "input_audio_transcription": {"model": "whisper-1"},
                     "tools": [
+                        CHECK_AVAILABILITY_TOOL,
                         {
                             "type": "function",
                             "name": "book_service",
@@ -203,6 +215,19 @@ class MediaStreamConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             logger.error(f"Error connecting to OpenAI: {str(e)}")
 
+    def record_call(self, prompt_version):
+        try:
+            CallLog.objects.update_or_create(
+                call_sid=self.call_sid,
+                defaults={
+                    'organization_id': self.organization_id,
+                    'caller_number': self.caller_number or '',
+                    'prompt_version': prompt_version,
+                }
+            )
+        except Exception as e:
+            logger.error(f"Error recording call {self.call_sid}: {str(e)}")
+
     async def listen_to_openai(self):
         try:
             async for message in self.openai_ws:
@@ -252,7 +277,10 @@ class MediaStreamConsumer(AsyncWebsocketConsumer):
         logger.info(f"Function called: {function_name} with args: {args}")
 
         try:
-            if function_name == 'book_service':
+            if function_name == 'check_availability':
+                response_message = await self.check_availability(args)
+
+            elif function_name == 'book_service':
                 await self.send_booking_sms()
                 response_message = "All of our classes are booked online — I've sent you the booking link by SMS. Anything else?"
 
@@ -299,108 +327,89 @@ class MediaStreamConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             logger.error(f"Error handling function call: {str(e)}")
 
-    async def send_booking_sms(self):
-        # Import here to avoid circular imports
-        from .views import twilio_client, TWILIO_PHONE_NUMBER
-        import os
-
+    async def warm_availability(self):
+        # Off the shared sync thread so it never delays a check_availability answer
         try:
-            # Get organization and assistant data
-            organization = await sync_to_async(Organization.objects.get)(id=self.organization_id)
-            assistant = await sync_to_async(
-                lambda: Assistant.objects.filter(organization=organization).first()
-            )()
-
-            # Get assistant name
-            assistant_name = assistant.name if assistant else "Clara"
-
-            # Get frontend URL from environment
-            frontend_url = os.getenv('FRONTEND_URL', 'https://sonoria-frontend-9cay.vercel.app')
-            booking_link = f"{frontend_url}/booking-portal?org={organization.id}"
-
-            # Use the exact message format specified
-            message_body = f"""Hi this is {assistant_name} from {organization.name}. Here's the link to book your appointment easily:
-{booking_link}
-Let me know if you need anything, I'm happy to help."""
-
-            if twilio_client:
-                await sync_to_async(twilio_client.messages.create)(
-                    body=message_body,
-                    from_=TWILIO_PHONE_NUMBER,
-                    to=self.caller_number
-                )
-                logger.info(f"Booking SMS sent successfully to {self.caller_number}")
+            await sync_to_async(self._warm_availability, thread_sensitive=False)()
         except Exception as e:
-            logger.error(f"Error sending booking SMS: {str(e)}")
+            logger.error(f"Error warming availability for org {self.organization_id}: {str(e)}")
 
-    async def send_update_sms(self):
-        from .views import twilio_client, TWILIO_PHONE_NUMBER
-        import os
+    def _warm_availability(self):
+        try:
+            warm_availability(self.organization_id)
+        finally:
+            connections.close_all()
 
+    def _check_availability(self, args):
         try:
-            # Get organization and assistant data
-            organization = await sync_to_async(Organization.objects.get)(id=self.organization_id)
-            assistant = await sync_to_async(
-                lambda: Assistant.objects.filter(organization=organization).first()
-            )()
+            return check_availability(self.organization_id, args.get('service'), args.get('date'), args.get('part_of_day'))
+        finally:
+            connections.close_all()
 
-            # Get assistant name
-            assistant_name = assistant.name if assistant else "Clara"
+    async def check_availability(self, args):
+        """Spoken availability answer within VOICE_AVAILABILITY_BUDGET_MS, else offer the booking link."""
+        try:
+            # Off the shared sync thread: a lookup that overruns must not hold up record_call, SMS or prompt loads
+            return await asyncio.wait_for(
+                sync_to_async(self._check_availability, thread_sensitive=False)(args),
+                timeout=budget_seconds()
+            )
+        except asyncio.TimeoutError:
+            # The lookup keeps running in its own thread and fills the cache for the next question
+            logger.warning(f"check_availability over budget for org {self.organization_id}: {args}")
+        except Exception as e:
+            logger.error(f"Error checking availability: {str(e)}")
+        return "I can't see the live calendar right now — I can text you the booking link instead. Would you like that?"
 
-            # Get frontend URL from environment
-            frontend_url = os.getenv('FRONTEND_URL', 'https://sonoria-frontend-9cay.vercel.app')
-            customer_portal_link = f"{frontend_url}/customer-portal?org={organization.id}"
+    async def send_templated_sms(self, template_name, label):
+        """Text the caller one of the organization's messages (gabby_booking/message_templates.py)."""
+        from .views import TWILIO_PHONE_NUMBER
+        twilio_client = get_twilio_client()
+        if not twilio_client:
+            return
 
-            # Use the exact message format specified
-            message_body = f"""Hi this is {assistant_name} from {organization.name}. Here's the link to reschedule your appointment easily:
-{customer_portal_link}
-Let me know if you need anything, I'm happy to help."""
+        # A repeated tool call within SMS_DEDUP_WINDOW_SECONDS is answered as sent without texting again
+        if not await sync_to_async(claim_sms_send)(self.organization_id, self.caller_number, template_name):
+            logger.info(f"Duplicate {label.lower()} SMS to {self.caller_number} suppressed")
+            return
 
-            if twilio_client:
-                await sync_to_async(twilio_client.messages.create)(
-                    body=message_body,
-                    from_=TWILIO_PHONE_NUMBER,
-                    to=self.caller_number
-                )
-                logger.info(f"Update SMS sent successfully to {self.caller_number}")
+        try:
+            # Owner's template when they saved one; names and links come from the cached bundle
+            message_body = await sync_to_async(render_message)(self.organization_id, template_name)
+            callback_url = status_callback_url('assistant_sms_status')
+            message = await sync_to_async(twilio_client.messages.create)(
+                body=message_body,
+                from_=TWILIO_PHONE_NUMBER,
+                to=self.caller_number,
+                **({'status_callback': callback_url} if callback_url else {})
+            )
+            logger.info(f"{label} SMS sent successfully to {self.caller_number}")
         except Exception as e:
-            logger.error(f"Error sending update SMS: {str(e)}")
-
-    async def send_cancel_sms(self):
-        from .views import twilio_client, TWILIO_PHONE_NUMBER
-        import os
+            logger.error(f"Error sending {label.lower()} SMS: {str(e)}")
+            await sync_to_async(release_sms_send)(self.organization_id, self.caller_number, template_name)
+            return
 
         try:
-            # Get organization and assistant data
-            organization = await sync_to_async(Organization.objects.get)(id=self.organization_id)
-            assistant = await sync_to_async(
-                lambda: Assistant.objects.filter(organization=organization).first()
-            )()
-
-            # Get assistant name
-            assistant_name = assistant.name if assistant else "Clara"
+            # Logged so the delivery status callback has a row to update
+            await sync_to_async(record_sent_sms)(
+                self.organization_id, self.caller_number, TWILIO_PHONE_NUMBER, message_body,
+                message.sid, f"call_{label.lower()}"
+            )
+        except Exception as e:
+            logger.error(f"Error recording {label.lower()} SMS: {str(e)}")
 
-            # Get frontend URL from environment
-            frontend_url = os.getenv('FRONTEND_URL', 'https://sonoria-frontend-9cay.vercel.app')
-            customer_portal_link = f"{frontend_url}/customer-portal?org={organization.id}"
+    async def send_booking_sms(self):
+        await self.send_templated_sms('booking_sms_content', 'Booking')
 
-            # Use the exact message format specified
-            message_body = f"""Hi this is {assistant_name} from {organization.name}. Here's the link to cancel your appointment:
-{customer_portal_link}
-You can easily manage your booking there. Let me know if you need any help!"""
+    async def send_update_sms(self):
+        await self.send_templated_sms('reschedule_sms', 'Update')
 
-            if twilio_client:
-                await sync_to_async(twilio_client.messages.create)(
-                    body=message_body,
-                    from_=TWILIO_PHONE_NUMBER,
-                    to=self.caller_number
-                )
-                logger.info(f"Cancel SMS sent successfully to {self.caller_number}")
-        except Exception as e:
-            logger.error(f"Error sending cancel SMS: {str(e)}")
+    async def send_cancel_sms(self):
+        await self.send_templated_sms('cancellation_sms', 'Cancel')
 
     async def notify_owner(self, reason):
-        from .views import twilio_client, TWILIO_PHONE_NUMBER
+        from .views import TWILIO_PHONE_NUMBER
+        twilio_client = get_twilio_client()
         from gabby_booking.models import FallbackNumber
 
         try:
@@ -420,7 +429,7 @@ You can easily manage your booking there. Let me know if you need any help!"""
             logger.error(f"Error notifying owner: {str(e)}")
 
     async def transfer_call_to_human(self):
-        from .views import twilio_client
+        twilio_client = get_twilio_client()
         from gabby_booking.models import FallbackNumber
 
         try:
@@ -5,8 +5,8 @@ from django.utils.html import format_html
 
 from .models import (
     Organization, RegistrationStep, Service, Option, BusinessHours, ExceptionalClosing,
-    ReservationType, SMSSetting, GoogleCalendarSetting, OrganizationFAQ, Assistant, FallbackNumber,OrganizationPrompt,
-    ServiceLocation, Location, Customer, Appointment
+    ReservationType, SMSSetting, GoogleCalendarSetting, OrganizationFAQ, Assistant, FallbackNumber,OrganizationPrompt,PromptGenerationJob,
+    ServiceLocation, Location, Customer, Appointment, OutboundSMS, OutboundEmail
 )
 
 ### INLINE ADMIN CLASSES ###
@@ -164,11 +164,21 @@ class FallbackNumberAdmin(admin.ModelAdmin):
 
 @admin.register(OrganizationPrompt)
 class OrganizationPromptAdmin(admin.ModelAdmin):
-    list_display = ('organization', 'created_at')
+    list_display = ('organization', 'version', 'compiled_at', 'created_at')
+    readonly_fields = ('content_hash', 'version', 'compiled_at')
     search_fields = ('organization__name',)
     ordering = ('-created_at',)
 
 
+@admin.register(PromptGenerationJob)
+class PromptGenerationJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'organization', 'status', 'cached', 'created_at', 'updated_at')
+    list_filter = ('status', 'cached')
+    readonly_fields = ('input_hash', 'result', 'error')
+    search_fields = ('organization__name', 'input_hash')
+    ordering = ('-created_at',)
+
+
 @admin.register(ServiceLocation)
 class ServiceLocationAdmin(admin.ModelAdmin):
     list_display = ('organization', 'address_type', 'main_address')
@@ -231,4 +241,20 @@ class AppointmentAdmin(admin.ModelAdmin):
 
     def get_organization(self, obj):
         return obj.organization.name
-    get_organization.short_description = 'Organization'
\ No newline at end of file
+    get_organization.short_description = 'Organization'
+
+
+@admin.register(OutboundSMS)
+class OutboundSMSAdmin(admin.ModelAdmin):
+    list_display = ('id', 'organization', 'notification_type', 'to_number', 'status', 'delivery_status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'delivery_status', 'notification_type')
+    search_fields = ('to_number', 'sid')
+    readonly_fields = ('created_at', 'sent_at', 'sid', 'attempts', 'last_error')
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'subject', 'to', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject',)
+    readonly_fields = ('created_at', 'sent_at', 'attempts', 'last_error')
@@ -0,0 +1,344 @@
+"""
+Availability engine for the booking portal and the voice assistant
+
+Times are handled as minutes since midnight and opening hours, breaks and
+appointments as half-open (start, end) intervals. Everything needed for a
+date range (business hours, closings, booking rules, providers and their
+appointments) is loaded up front in a fixed number of queries. Each
+provider-day is then rendered into a 1440-byte minute bitmap (opening hours
+cleared, busy intervals set by slice assignment) and free starts are found by
+sliding the booking duration over it, so a 90-day calendar costs the same
+number of queries as a single day.
+
+Rules applied:
+  - BusinessHours for the day of week; location-specific rows override the
+    organization's rows, and the break is cut out of custom hours. An
+    organization with no hours configured at all is treated as open
+    DEFAULT_OPEN_HOURS every day.
+  - ExceptionalClosing covering the date (organization-wide or for the location)
+    closes the whole day.
+  - Appointments (pending/confirmed) block their provider for their duration,
+    widened by the BookingRule minimum gap on both sides. Appointments without
+    a provider block every provider.
+  - The BookingRule cutoff pushes the earliest bookable start past now + cutoff.
+"""
+import re
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import (
+    Appointment, BookingRule, BusinessHours, ExceptionalClosing, Option, Service, TeamMember
+)
+
+MINUTES_PER_DAY = 24 * 60
+DEFAULT_OPEN_HOURS = (9 * 60, 18 * 60)
+ACTIVE_STATUSES = ['pending', 'confirmed']
+
+_DURATION_UNITS = {
+    'm': 1, 'min': 1, 'mins': 1, 'minute': 1, 'minutes': 1,
+    'h': 60, 'hr': 60, 'hrs': 60, 'hour': 60, 'hours': 60,
+    'd': MINUTES_PER_DAY, 'day': MINUTES_PER_DAY, 'days': MINUTES_PER_DAY,
+    'w': 7 * MINUTES_PER_DAY, 'week': 7 * MINUTES_PER_DAY, 'weeks': 7 * MINUTES_PER_DAY,
+}
+_DURATION_RE = re.compile(r'(\d+(?:\.\d+)?)\s*([a-z]+)?')
+
+
+def parse_duration_minutes(value):
+    """
+    Parse BookingRule durations such as '15 minutes', '1 hour before', '1h 30m' or 'No gap'
+
+    A bare number is read as minutes. Unparseable values count as 0.
+    """
+    if not value:
+        return 0
+    total = 0
+    for amount, unit in _DURATION_RE.findall(str(value).lower()):
+        if unit and unit not in _DURATION_UNITS:
+            continue
+        total += float(amount) * _DURATION_UNITS.get(unit, 1)
+    return int(total)
+
+
+def time_to_minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def format_slot_time(minutes):
+    """Minutes since midnight -> '9:00 am', the format BookingCreateSerializer accepts."""
+    return datetime(2000, 1, 1, minutes // 60, minutes % 60).strftime("%I:%M %p").lower().lstrip('0')
+
+
+def parse_slot_time(value):
+    return time_to_minutes(datetime.strptime(value.strip(), "%I:%M %p").time())
+
+
+def subtract_intervals(intervals, removed):
+    """intervals minus removed; both sorted lists of (start, end)."""
+    result = []
+    removed = sorted(removed)
+    for start, end in intervals:
+        cursor = start
+        for r_start, r_end in removed:
+            if r_end <= cursor:
+                continue
+            if r_start >= end:
+                break
+            if r_start > cursor:
+                result.append((cursor, r_start))
+            cursor = max(cursor, r_end)
+            if cursor >= end:
+                break
+        if cursor < end:
+            result.append((cursor, end))
+    return result
+
+
+def booking_duration(organization_id, service_id, option_ids=None):
+    """
+    Total duration in minutes of a service plus its selected options
+
+    Raises:
+        Service.DoesNotExist
+    """
+    service_duration = Service.objects.values_list('duration', flat=True).get(
+        id=service_id, organization_id=organization_id
+    )
+    options_duration = 0
+    if option_ids:
+        options_duration = sum(Option.objects.filter(
+            id__in=option_ids, organization_id=organization_id
+        ).values_list('duration', flat=True))
+    return service_duration + options_duration
+
+
+def default_granularity():
+    return getattr(settings, 'BOOKING_SLOT_GRANULARITY', 30)
+
+
+def load_rule_minutes(organization_id):
+    """(minimum gap, cutoff) in minutes from the organization's BookingRule."""
+    rule = BookingRule.objects.filter(organization_id=organization_id).first()
+    gap = parse_duration_minutes(rule.gap_time_value) if rule and rule.set_minimum_gap else 0
+    cutoff = parse_duration_minutes(rule.cutoff_time_value) if rule and rule.set_cutoff_time else 0
+    return gap, cutoff
+
+
+def load_providers(organization_id, location_id=None, provider_id=None):
+    """Provider ids to schedule against; [None] when the organization has no team."""
+    if provider_id:
+        return [int(provider_id)]
+    members = TeamMember.objects.filter(organization_id=organization_id)
+    if location_id:
+        members = members.filter(Q(location__isnull=True) | Q(location_id=location_id))
+    return sorted(members.values_list('id', flat=True)) or [None]
+
+
+def earliest_start(day, cutoff, now=None):
+    """First bookable minute on a day given the cutoff; MINUTES_PER_DAY if none."""
+    now = now or timezone.localtime()
+    earliest = now + timedelta(minutes=cutoff)
+    if day > earliest.date():
+        return 0
+    if day < earliest.date():
+        return MINUTES_PER_DAY
+    return earliest.hour * 60 + earliest.minute + (1 if earliest.second or earliest.microsecond else 0)
+
+
+def load_hours(organization_id, location_id=None):
+    """
+    Weekly opening intervals: {'mon': [(start, end), ...], ...}
+
+    Location-specific rows override the organization's rows and breaks are cut
+    out of custom hours. None when the organization has no hours configured.
+    """
+    rows = list(BusinessHours.objects.filter(organization_id=organization_id).values(
+        'location_id', 'day_of_week', 'hours_type', 'open_time', 'close_time', 'break_start_time', 'break_end_time'
+    ))
+    if not rows:
+        return None
+
+    location_rows = [row for row in rows if location_id and row['location_id'] == location_id]
+    rows = location_rows or [row for row in rows if row['location_id'] is None]
+
+    hours = {}
+    for row in rows:
+        day = (row['day_of_week'] or '')[:3].lower()
+        if row['hours_type'] == 'closed':
+            hours[day] = []
+        elif row['hours_type'] == 'open_24':
+            hours[day] = [(0, MINUTES_PER_DAY)]
+        elif row['open_time'] and row['close_time']:
+            intervals = [(time_to_minutes(row['open_time']), time_to_minutes(row['close_time']))]
+            if row['break_start_time'] and row['break_end_time']:
+                intervals = subtract_intervals(intervals, [
+                    (time_to_minutes(row['break_start_time']), time_to_minutes(row['break_end_time']))
+                ])
+            hours[day] = intervals
+    return hours
+
+
+def weekly_opening_intervals(hours, day):
+    """Opening intervals of a date from load_hours() output, ignoring closings."""
+    if hours is None:
+        return [DEFAULT_OPEN_HOURS]
+    return hours.get(day.strftime('%a').lower(), [])
+
+
+def load_closings(organization_id, location_id=None, start_date=None, end_date=None):
+    """(open_date, close_date) ranges of ExceptionalClosing rows overlapping [start_date, end_date]."""
+    closings = ExceptionalClosing.objects.filter(organization_id=organization_id)
+    if start_date:
+        closings = closings.filter(close_date__gte=start_date)
+    if end_date:
+        closings = closings.filter(open_date__lte=end_date)
+    if location_id:
+        closings = closings.filter(Q(location__isnull=True) | Q(location_id=location_id))
+    else:
+        closings = closings.filter(location__isnull=True)
+    return list(closings.values_list('open_date', 'close_date'))
+
+
+class AvailabilityContext:
+    """
+    Booking inputs for one organization over [start_date, end_date], loaded in a fixed number of queries
+
+    Args:
+        location_id: restrict hours, closings and providers to a location
+        provider_id: compute availability for a single provider
+        providers: provider ids when already known (skips the team query)
+        exclude_appointment_id: ignore this appointment, e.g. the one being rescheduled
+        rules: (gap, cutoff) minutes when already loaded (skips the BookingRule query)
+    """
+
+    def __init__(self, organization_id, start_date, end_date, location_id=None, provider_id=None, providers=None,
+                 exclude_appointment_id=None, rules=None):
+        self.organization_id = organization_id
+        self.start_date = start_date
+        self.end_date = end_date
+        self.location_id = int(location_id) if location_id else None
+        self.provider_id = int(provider_id) if provider_id else None
+        self.exclude_appointment_id = exclude_appointment_id
+
+        self.hours = self._load_hours()
+        self.closed_dates = self._load_closed_dates()
+        self.gap, self.cutoff = rules or load_rule_minutes(organization_id)
+        self.providers = providers or load_providers(organization_id, self.location_id, self.provider_id)
+        self.busy = self._load_busy()
+
+    def _load_hours(self):
+        return load_hours(self.organization_id, self.location_id)
+
+    def _load_closed_dates(self):
+        closed = set()
+        for open_date, close_date in load_closings(self.organization_id, self.location_id, self.start_date, self.end_date):
+            day = max(open_date, self.start_date)
+            while day <= min(close_date, self.end_date):
+                closed.add(day)
+                day += timedelta(days=1)
+        return closed
+
+    def _load_busy(self):
+        """{(provider_id, date): [(start, end), ...]} including the minimum gap."""
+        appointments = Appointment.objects.filter(
+            organization_id=self.organization_id,
+            date__gte=self.start_date - timedelta(days=1),
+            date__lte=self.end_date,
+            status__in=ACTIVE_STATUSES,
+        )
+        if self.provider_id:
+            appointments = appointments.filter(Q(provider__isnull=True) | Q(provider_id=self.provider_id))
+        if self.exclude_appointment_id:
+            appointments = appointments.exclude(id=self.exclude_appointment_id)
+
+        busy = {}
+        for provider_id, day, start_time, duration in appointments.values_list('provider_id', 'date', 'time', 'duration'):
+            start = time_to_minutes(start_time) - self.gap
+            end = time_to_minutes(start_time) + duration + self.gap
+            # Split appointments running past midnight across both days
+            while day <= self.end_date and end > 0:
+                if day >= self.start_date:
+                    busy.setdefault((provider_id, day), []).append((max(start, 0), min(end, MINUTES_PER_DAY)))
+                start -= MINUTES_PER_DAY
+                end -= MINUTES_PER_DAY
+                day += timedelta(days=1)
+
+        if self.providers != [None]:
+            # Unassigned appointments block every provider
+            for (provider_id, day), intervals in list(busy.items()):
+                if provider_id is None:
+                    for member_id in self.providers:
+                        busy.setdefault((member_id, day), []).extend(intervals)
+        for intervals in busy.values():
+            intervals.sort()
+        return busy
+
+    def opening_intervals(self, day):
+        if day in self.closed_dates:
+            return []
+        return weekly_opening_intervals(self.hours, day)
+
+    def earliest_start(self, day, now=None):
+        return earliest_start(day, self.cutoff, now)
+
+    def blocked_bitmap(self, provider_id, day):
+        """Minute-resolution bitmap of a provider-day: 1 = closed or busy, 0 = bookable."""
+        blocked = bytearray(b'\x01') * MINUTES_PER_DAY
+        for start, end in self.opening_intervals(day):
+            blocked[start:end] = bytes(end - start)
+        for start, end in self.busy.get((provider_id, day), []):
+            blocked[start:end] = b'\x01' * (end - start)
+        return blocked
+
+    def candidate_starts(self, day, duration, granularity=None, earliest=0):
+        """Grid-aligned starts (from each opening) that fit in opening hours, from the earliest minute on."""
+        granularity = granularity or default_granularity()
+
+        candidates = []
+        for open_start, open_end in self.opening_intervals(day):
+            start = open_start
+            while start + duration <= open_end:
+                if start >= earliest:
+                    candidates.append(start)
+                start += granularity
+        return candidates
+
+    def day_slots(self, day, duration, granularity=None, now=None):
+        """
+        All candidate starts on a day, each with the providers free for the whole duration
+
+        Returns:
+            list of (start_minute, [provider_id, ...]); an empty provider list means booked
+        """
+        candidates = self.candidate_starts(day, duration, granularity, self.earliest_start(day, now))
+        if not candidates:
+            return []
+
+        free_by_start = {start: [] for start in candidates}
+        for provider_id in self.providers:
+            for start in free_starts(self.blocked_bitmap(provider_id, day), candidates, duration):
+                free_by_start[start].append(provider_id)
+        return [(start, free_by_start[start]) for start in candidates]
+
+
+def free_starts(blocked, candidates, duration):
+    """
+    Starts (from sorted candidates) whose whole [start, start + duration) window is unblocked
+
+    Slides the window over the bitmap; when a blocked minute is found every
+    candidate up to and including it is skipped, so each bitmap byte is
+    scanned at most once per granularity step.
+    """
+    free = set()
+    next_possible = 0
+    for start in candidates:
+        if start < next_possible:
+            continue
+        blocked_at = blocked.find(1, start, start + duration)
+        if blocked_at == -1:
+            free.add(start)
+        else:
+            next_possible = blocked_at + 1
+    return free
@@ -0,0 +1,321 @@
+"""
+Cached availability
+
+Computed free starts are cached per (organization, location, provider, date,
+duration bucket, granularity). Keys embed generation counters:
+
+    avail-gen:<org>                          bumped by hours, closings, rules, team, services
+    avail-gen:<org>:<provider>:<date>        bumped by appointments on that provider-day
+    avail-gen:<org>:None:<date>              bumped by unassigned appointments, which block every provider
+
+so invalidation is a counter bump and stale entries simply stop being read.
+Organization details, templates and the assistant only feed messages and the
+booking portal; they bump a separate msg-gen:<org> counter so editing them
+keeps warmed availability.
+Bumps run on transaction commit so a reader never caches pre-commit data under
+the new generation. The booking cutoff depends on the current time and is
+applied after reading from the cache.
+
+A fully cached request reads only the cache: generations, organization info
+(duration, providers, cutoff) and provider-day results are three get_many calls.
+
+next_available scans forward for the earliest free slots. Weekly hours and
+closings are cached per location under the organization generation, so days
+that are closed are skipped without being computed; open days are fetched in
+windows that double in size until enough slots are found.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .availability import (
+    AvailabilityContext, booking_duration, default_granularity, earliest_start,
+    free_starts, load_closings, load_hours, load_providers, load_rule_minutes,
+    weekly_opening_intervals,
+)
+from .models import Location
+
+logger = logging.getLogger(__name__)
+
+STATS_KEYS = {'hits': 'avail-stats:hits', 'misses': 'avail-stats:misses'}
+
+
+def _timeout():
+    return getattr(settings, 'AVAILABILITY_CACHE_TIMEOUT', 60 * 60)
+
+
+def duration_bucket(duration):
+    """Round up to AVAILABILITY_DURATION_BUCKET minutes; rounding up never offers a slot that is too short."""
+    bucket = getattr(settings, 'AVAILABILITY_DURATION_BUCKET', 5)
+    return -(-duration // bucket) * bucket
+
+
+def _org_generation_key(organization_id):
+    return f"avail-gen:{organization_id}"
+
+
+def _message_generation_key(organization_id):
+    return f"msg-gen:{organization_id}"
+
+
+def _provider_day_generation_key(organization_id, provider_id, day):
+    return f"avail-gen:{organization_id}:{provider_id}:{day.isoformat()}"
+
+
+def _get_generations(keys):
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            # Seed from the clock so an evicted counter never falls back to an old value
+            cache.add(key, time.time_ns(), None)
+            generations[key] = cache.get(key)
+    return generations
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def organization_generation(organization_id):
+    """Current generation of organization-wide inputs; embed it in keys of data derived from them."""
+    key = _org_generation_key(int(organization_id))
+    return _get_generations([key])[key]
+
+
+def message_generation(organization_id):
+    """Current generation of organization details, templates and the assistant, which messages are built from."""
+    key = _message_generation_key(int(organization_id))
+    return _get_generations([key])[key]
+
+
+def organization_generations(organization_id):
+    """(organization generation, message generation) in one cache read."""
+    keys = [_org_generation_key(int(organization_id)), _message_generation_key(int(organization_id))]
+    generations = _get_generations(keys)
+    return generations[keys[0]], generations[keys[1]]
+
+
+def invalidate_organization(organization_id):
+    """Drop every cached availability for an organization once the transaction commits."""
+    transaction.on_commit(lambda: _bump(_org_generation_key(organization_id)))
+
+
+def invalidate_messages(organization_id):
+    """Drop cached message bundles and portal payloads for an organization once the transaction commits."""
+    transaction.on_commit(lambda: _bump(_message_generation_key(organization_id)))
+
+
+def invalidate_provider_days(organization_id, provider_days):
+    """Drop cached availability for the given (provider_id, date) pairs once the transaction commits."""
+    keys = {_provider_day_generation_key(organization_id, provider_id, day) for provider_id, day in provider_days}
+
+    def bump():
+        for key in keys:
+            _bump(key)
+
+    transaction.on_commit(bump)
+
+
+def _record(hits, misses):
+    for name, count in (('hits', hits), ('misses', misses)):
+        if not count:
+            continue
+        try:
+            cache.incr(STATS_KEYS[name], count)
+        except ValueError:
+            cache.add(STATS_KEYS[name], 0, None)
+            cache.incr(STATS_KEYS[name], count)
+
+
+def cache_stats():
+    values = cache.get_many(STATS_KEYS.values())
+    hits = values.get(STATS_KEYS['hits'], 0)
+    misses = values.get(STATS_KEYS['misses'], 0)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': round(hits / total, 4) if total else None}
+
+
+def _organization_info(organization_id, org_generation, service_id, option_ids, location_id, provider_id):
+    key = f"avail:{organization_id}:{org_generation}:info:{service_id}:{','.join(map(str, option_ids))}:{location_id}:{provider_id}"
+    info = cache.get(key)
+    if info is None:
+        _, cutoff = load_rule_minutes(organization_id)
+        info = {
+            'duration': booking_duration(organization_id, service_id, option_ids),
+            'providers': load_providers(organization_id, location_id, provider_id),
+            'cutoff': cutoff,
+        }
+        cache.set(key, info, _timeout())
+    return info
+
+
+def get_availability(organization_id, start_date, end_date, service_id, option_ids=None,
+                     location_id=None, provider_id=None, granularity=None, now=None):
+    """
+    Availability over [start_date, end_date]
+
+    Returns:
+        tuple: (duration, days) where days is a list of
+            (date, open: bool, [(start_minute, [free provider ids])]) with the cutoff applied
+
+    Raises:
+        Service.DoesNotExist
+    """
+    days = []
+    day = start_date
+    while day <= end_date:
+        days.append(day)
+        day += timedelta(days=1)
+    return _availability(organization_id, days, service_id, option_ids, location_id, provider_id, granularity, now)
+
+
+def _availability(organization_id, days, service_id, option_ids=None, location_id=None, provider_id=None,
+                  granularity=None, now=None):
+    organization_id = int(organization_id)
+    location_id = int(location_id) if location_id else None
+    provider_id = int(provider_id) if provider_id else None
+    option_ids = sorted(set(option_ids or []))
+    granularity = granularity or default_granularity()
+
+    org_key = _org_generation_key(organization_id)
+    org_generation = _get_generations([org_key])[org_key]
+    info = _organization_info(organization_id, org_generation, service_id, option_ids, location_id, provider_id)
+    duration = info['duration']
+    bucket = duration_bucket(duration)
+    providers = info['providers']
+
+    pairs = [(provider, day) for day in days for provider in providers]
+    generation_keys = {(p, d): _provider_day_generation_key(organization_id, p, d) for p, d in pairs}
+    generation_keys.update({(None, d): _provider_day_generation_key(organization_id, None, d) for d in days})
+    generations = _get_generations(list(generation_keys.values()))
+    keys = {
+        (p, d): (
+            f"avail:{organization_id}:{org_generation}:{location_id}:{p}:{d.isoformat()}:"
+            f"{generations[generation_keys[(p, d)]]}:{generations[generation_keys[(None, d)]]}:{bucket}:{granularity}"
+        )
+        for p, d in pairs
+    }
+    cached = cache.get_many(keys.values())
+    results = {pair: cached[key] for pair, key in keys.items() if key in cached}
+    missing = [pair for pair in pairs if pair not in results]
+    _record(len(results), len(missing))
+
+    if missing:
+        missing_days = [d for _, d in missing]
+        context = AvailabilityContext(
+            organization_id, min(missing_days), max(missing_days),
+            location_id=location_id, provider_id=provider_id, providers=providers,
+        )
+        computed = {}
+        for p, d in missing:
+            candidates = context.candidate_starts(d, bucket, granularity)
+            free = sorted(free_starts(context.blocked_bitmap(p, d), candidates, bucket)) if candidates else []
+            computed[(p, d)] = (bool(context.opening_intervals(d)), candidates, free)
+        cache.set_many({keys[pair]: value for pair, value in computed.items()}, _timeout())
+        results.update(computed)
+
+    availability = []
+    for day in days:
+        earliest = earliest_start(day, info['cutoff'], now)
+        is_open = any(results[(p, day)][0] for p in providers)
+        candidates = results[(providers[0], day)][1]
+        free_by_start = {start: [] for start in candidates if start >= earliest}
+        for p in providers:
+            for start in results[(p, day)][2]:
+                if start in free_by_start:
+                    free_by_start[start].append(p)
+        availability.append((day, is_open, sorted(free_by_start.items())))
+    return duration, availability
+
+
+def _schedule(organization_id, org_generation, location_id):
+    """{location_id: {'hours', 'closings'}} for the locations to scan ([None] without locations)."""
+    key = f"avail:{organization_id}:{org_generation}:schedule:{location_id}"
+    schedule = cache.get(key)
+    if schedule is None:
+        if location_id:
+            locations = [location_id]
+        else:
+            locations = list(Location.objects.filter(
+                service_location__organization_id=organization_id
+            ).order_by('id').values_list('id', flat=True)) or [None]
+        schedule = {
+            location: {
+                'hours': load_hours(organization_id, location),
+                'closings': load_closings(organization_id, location, start_date=timezone.localdate()),
+            }
+            for location in locations
+        }
+        cache.set(key, schedule, _timeout())
+    return schedule
+
+
+def _open_days(schedule, start_date, end_date):
+    """Dates in [start_date, end_date] with opening hours and no closing, without touching the database."""
+    days = []
+    day = start_date
+    while day <= end_date:
+        if weekly_opening_intervals(schedule['hours'], day) and not any(
+            open_date <= day <= close_date for open_date, close_date in schedule['closings']
+        ):
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def next_available(organization_id, service_id, after, limit=5, option_ids=None, location_id=None,
+                   provider_id=None, granularity=None, max_days=60, now=None):
+    """
+    The earliest `limit` free slots starting at or after `after`
+
+    Scans up to max_days from after's date across every location (or the given
+    one) and every eligible provider. Open days are fetched in windows of
+    7, 14, 28... days and the scan stops at the first window that fills the limit.
+
+    Returns:
+        tuple: (duration, [(date, start_minute, location_id, [free provider ids])])
+
+    Raises:
+        Service.DoesNotExist
+    """
+    organization_id = int(organization_id)
+    location_id = int(location_id) if location_id else None
+    schedule = _schedule(organization_id, organization_generation(organization_id), location_id)
+    duration = None
+
+    after_day = after.date()
+    after_minute = after.hour * 60 + after.minute + (1 if after.second or after.microsecond else 0)
+    last_day = after_day + timedelta(days=max_days - 1)
+
+    found = []
+    window_start = after_day
+    window = 7
+    while window_start <= last_day and len(found) < limit:
+        window_end = min(window_start + timedelta(days=window - 1), last_day)
+        for location, location_schedule in schedule.items():
+            days = _open_days(location_schedule, window_start, window_end)
+            if not days:
+                continue
+            duration, availability = _availability(
+                organization_id, days, service_id, option_ids, location, provider_id, granularity, now
+            )
+            for day, _, slots in availability:
+                for start, providers in slots:
+                    if providers and (day > after_day or start >= after_minute):
+                        found.append((day, start, location, providers))
+        window_start = window_end + timedelta(days=1)
+        window *= 2
+
+    if duration is None:
+        # Nothing open in range; still validate the service and report its duration
+        duration = booking_duration(organization_id, service_id, option_ids)
+    found.sort(key=lambda slot: (slot[0], slot[1], slot[2] or 0))
+    return duration, found[:limit]
@@ -0,0 +1,103 @@
+"""
+In-process background jobs
+
+Work that must not block an HTTP worker (LLM calls, slow third-party APIs) is
+handed to a small thread pool. Jobs should persist their own state (see
+PromptGenerationJob) so clients can poll for the outcome.
+
+Set BACKGROUND_JOBS_EAGER = True to run jobs inline, e.g. in tests.
+
+Outbox drains use run_coalesced_in_background(): however many messages are
+queued, at most one drain per process occupies a pool thread.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# func -> whether another run was requested while it was running
+_coalesced = {}
+_coalesced_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'BACKGROUND_JOB_WORKERS', 4),
+                thread_name_prefix='background-job',
+            )
+    return _executor
+
+
+def shutdown_executor(wait=True):
+    """Stop the pool, by default after its queued jobs finish; the next job starts a new one."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def _run(func, args):
+    try:
+        func(*args)
+    except Exception as e:
+        logger.error(f"Background job {func.__name__} failed: {str(e)}", exc_info=True)
+    finally:
+        # Each worker thread has its own connection; don't leave it open between jobs
+        connection.close()
+
+
+def run_in_background(func, *args):
+    """Run func(*args) in the background once the current transaction commits."""
+    def submit():
+        if getattr(settings, 'BACKGROUND_JOBS_EAGER', False):
+            func(*args)
+        else:
+            get_executor().submit(_run, func, args)
+
+    transaction.on_commit(submit)
+
+
+def _run_coalesced(func):
+    while True:
+        try:
+            func()
+        except Exception as e:
+            logger.error(f"Background job {func.__name__} failed: {str(e)}", exc_info=True)
+        with _coalesced_lock:
+            if not _coalesced[func]:
+                del _coalesced[func]
+                return
+            _coalesced[func] = False
+
+
+def run_coalesced_in_background(func):
+    """
+    Run func() in the background once the current transaction commits, one run at a time
+
+    A request made while func is already queued or running does not submit
+    another job; it makes the current run go once more when it finishes, so
+    work committed meanwhile is still picked up.
+    """
+    def submit():
+        with _coalesced_lock:
+            if func in _coalesced:
+                _coalesced[func] = True
+                return
+            _coalesced[func] = False
+        if getattr(settings, 'BACKGROUND_JOBS_EAGER', False):
+            _run_coalesced(func)
+        else:
+            get_executor().submit(_run, _run_coalesced, (func,))
+
+    transaction.on_commit(submit)
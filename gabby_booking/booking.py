@@ -0,0 +1,198 @@
+"""
+Conflict-checked appointment writes
+
+Creating or moving an appointment locks the ProviderDayLedger rows of the
+provider-days it touches (SELECT ... FOR UPDATE, always in (date, provider)
+order) and then re-checks the slot with the availability engine against the
+appointments committed so far, all inside the caller's transaction. Two
+requests for the same provider and time serialize on the ledger row and the
+second one sees the first one's appointment; bookings for other providers or
+other days lock other rows and do not wait on each other.
+
+Lock scope:
+  - an appointment with a provider locks that provider's day
+  - an appointment without a provider blocks every provider (see
+    availability.py), so it locks provider_key 0 and every team member's day
+  - the neighbouring day is locked too when the minimum gap spills over midnight
+
+When TeamMemberConfig.auto_assign_bookings is on, bookings without a provider
+go through assign_provider: free providers are ranked by minutes booked that
+day (one aggregate query), ties broken by the configured strategy. The
+provider-days of every candidate are then locked in one sorted pass, like
+reserve_slot, and the best candidate still free gets the booking; locking
+candidates one by one in ranking order could deadlock two requests that rank
+them differently.
+"""
+import logging
+from datetime import timedelta
+
+from django.db.models import FilteredRelation, Max, Q, Sum
+from django.db.models.functions import Coalesce
+
+from .availability import (
+    ACTIVE_STATUSES, MINUTES_PER_DAY, AvailabilityContext, free_starts, load_providers, load_rule_minutes,
+    time_to_minutes,
+)
+from .models import ProviderDayLedger, TeamMember, TeamMemberConfig
+
+logger = logging.getLogger(__name__)
+
+NO_PROVIDER_KEY = 0
+
+
+class SlotUnavailable(Exception):
+    """The requested time is taken, outside opening hours or within the booking cutoff."""
+
+
+def _slot_start(start_time, duration):
+    start = time_to_minutes(start_time)
+    if start + duration > MINUTES_PER_DAY:
+        raise SlotUnavailable("Appointments cannot run past midnight")
+    return start
+
+
+def _slot_days(day, start, duration, gap):
+    """The day of the slot plus the neighbouring day the minimum gap spills into."""
+    days = [day]
+    if start - gap < 0:
+        days.append(day - timedelta(days=1))
+    if start + duration + gap > MINUTES_PER_DAY:
+        days.append(day + timedelta(days=1))
+    return days
+
+
+def lock_provider_days(organization_id, provider_keys, days):
+    """
+    Create (if needed) and lock the ledger rows for every (provider_key, day)
+
+    Must be called inside transaction.atomic(); the locks are held until it ends.
+    """
+    provider_keys = sorted(set(provider_keys))
+    days = sorted(set(days))
+    ProviderDayLedger.objects.bulk_create(
+        [ProviderDayLedger(organization_id=organization_id, provider_key=key, date=day)
+         for day in days for key in provider_keys],
+        ignore_conflicts=True,
+    )
+    return list(ProviderDayLedger.objects.select_for_update().filter(
+        organization_id=organization_id, provider_key__in=provider_keys, date__in=days,
+    ).order_by('date', 'provider_key'))
+
+
+def reserve_slot(organization_id, day, start_time, duration, location_id=None, provider_id=None,
+                 exclude_appointment_id=None, now=None):
+    """
+    Lock the provider-days a booking touches and verify the slot is still free
+
+    Must be called inside transaction.atomic(), and the appointment written in
+    the same transaction, so nobody can book the slot in between.
+
+    Returns:
+        list: provider ids free for the whole slot ([None] for an organization without a team)
+
+    Raises:
+        SlotUnavailable
+    """
+    start = _slot_start(start_time, duration)
+    if provider_id:
+        lock_keys = [int(provider_id)]
+        providers = lock_keys
+    else:
+        team = load_providers(organization_id)
+        lock_keys = [NO_PROVIDER_KEY] + [p for p in team if p]
+        providers = load_providers(organization_id, location_id) if location_id else team
+
+    rules = load_rule_minutes(organization_id)
+    lock_provider_days(organization_id, lock_keys, _slot_days(day, start, duration, rules[0]))
+
+    context = AvailabilityContext(
+        organization_id, day, day, location_id=location_id, provider_id=provider_id,
+        providers=providers, exclude_appointment_id=exclude_appointment_id, rules=rules,
+    )
+    if start < context.earliest_start(day, now):
+        raise SlotUnavailable("This time is too close to book")
+
+    free = [p for p in context.providers if free_starts(context.blocked_bitmap(p, day), [start], duration)]
+    if not free:
+        logger.info(f"Slot conflict for organization {organization_id} on {day} at {start_time} (provider {provider_id})")
+        raise SlotUnavailable("This time slot is no longer available")
+    return free
+
+
+def auto_assign_strategy(organization_id):
+    """The organization's assignment strategy, or None when bookings are not auto-assigned."""
+    return TeamMemberConfig.objects.filter(
+        organization_id=organization_id, auto_assign_bookings=True
+    ).values_list('assignment_strategy', flat=True).first()
+
+
+def rank_providers(organization_id, provider_ids, day, strategy='fewest_minutes'):
+    """
+    Order providers from least to most loaded in one aggregate query
+
+    Load is the minutes booked on the day. Ties are broken by the strategy:
+      - fewest_minutes: fewest minutes booked in the day's week (Monday to Sunday)
+      - round_robin: longest since the provider was last assigned a booking this week
+    then by id, so the order is stable.
+    """
+    if not provider_ids:
+        return []
+    week_start = day - timedelta(days=day.weekday())
+    rows = TeamMember.objects.filter(organization_id=organization_id, id__in=provider_ids).annotate(
+        week_appointments=FilteredRelation('appointments_as_provider', condition=Q(
+            appointments_as_provider__date__gte=week_start,
+            appointments_as_provider__date__lte=week_start + timedelta(days=6),
+            appointments_as_provider__status__in=ACTIVE_STATUSES,
+        )),
+        day_minutes=Coalesce(Sum('week_appointments__duration', filter=Q(week_appointments__date=day)), 0),
+        week_minutes=Coalesce(Sum('week_appointments__duration'), 0),
+        last_assigned=Max('week_appointments__created_at'),
+    ).values_list('id', 'day_minutes', 'week_minutes', 'last_assigned')
+
+    def key(row):
+        provider_id, day_minutes, week_minutes, last_assigned = row
+        if strategy == 'round_robin':
+            tie_break = last_assigned.timestamp() if last_assigned else float('-inf')
+        else:
+            tie_break = week_minutes
+        return day_minutes, tie_break, provider_id
+
+    return [row[0] for row in sorted(rows, key=key)]
+
+
+def assign_provider(organization_id, day, start_time, duration, location_id=None, strategy='fewest_minutes', now=None):
+    """
+    Reserve the slot with the least-loaded free provider at the location
+
+    Must be called inside transaction.atomic(), like reserve_slot. Candidates
+    are ranked from committed data without locks; then all of their
+    provider-days are locked at once, in the same (date, provider) order as
+    reserve_slot, and the slot re-checked, so the first ranked candidate still
+    free is safe to book.
+
+    Returns:
+        int: the provider id, or None for an organization without a team
+
+    Raises:
+        SlotUnavailable
+    """
+    start = _slot_start(start_time, duration)
+    context = AvailabilityContext(organization_id, day, day, location_id=location_id)
+    if context.providers == [None]:
+        reserve_slot(organization_id, day, start_time, duration, location_id=location_id, now=now)
+        return None
+    if start < context.earliest_start(day, now):
+        raise SlotUnavailable("This time is too close to book")
+
+    candidates = [p for p in context.providers if free_starts(context.blocked_bitmap(p, day), [start], duration)]
+    ranked = rank_providers(organization_id, candidates, day, strategy)
+    if ranked:
+        lock_provider_days(organization_id, ranked, _slot_days(day, start, duration, context.gap))
+        locked = AvailabilityContext(
+            organization_id, day, day, location_id=location_id, providers=ranked, rules=(context.gap, context.cutoff),
+        )
+        for provider_id in ranked:
+            if free_starts(locked.blocked_bitmap(provider_id, day), [start], duration):
+                return provider_id
+            logger.info(f"Provider {provider_id} was taken at {day} {start_time}, trying the next candidate")
+    raise SlotUnavailable("This time slot is no longer available")
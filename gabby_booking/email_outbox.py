@@ -0,0 +1,228 @@
+"""
+Queued email delivery
+
+With EMAIL_BACKEND = 'gabby_booking.email_outbox.QueuedEmailBackend' every
+send_mail() / EmailMessage.send() in the project (password resets, booking
+and reminder emails) only writes an OutboundEmail row in the caller's
+transaction; once it commits, a background drain (background.py) delivers it.
+Requests never wait on the SMTP server, and a burst of emails wakes at most
+one drain per process instead of submitting one pool job per send.
+
+deliver_due_emails() drains the outbox like sms_outbox.deliver_due():
+  - due rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED and leased,
+    so concurrent workers never send the same row
+  - failures are retried after EMAIL_RETRY_BASE_SECONDS * 2^(attempt - 1),
+    capped at EMAIL_RETRY_MAX_SECONDS; after EMAIL_MAX_ATTEMPTS, or on a
+    permanent SMTP error (refused recipient, 5xx reply), the row is dead-lettered
+
+Messages go out through EMAIL_DELIVERY_BACKEND: Django's SMTP backend in
+production, its console, filebased or locmem backends locally and in tests.
+Delivery connections are pooled per process: up to EMAIL_POOL_SIZE stay open
+between batches and are replaced once idle for EMAIL_CONNECTION_MAX_IDLE
+seconds, so a batch costs at most one SMTP handshake instead of one per message.
+
+Run `python manage.py send_email_outbox --loop` as a worker process so
+retries go out even when no new email triggers a drain.
+"""
+import logging
+import smtplib
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.utils import timezone
+
+from .background import run_coalesced_in_background
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+SMTP_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+LEASE_SECONDS = 5 * 60
+BATCH_SIZE = 100
+
+
+def delivery_backend():
+    return getattr(settings, 'EMAIL_DELIVERY_BACKEND', SMTP_BACKEND)
+
+
+class ConnectionPool:
+    """Open delivery connections shared by the drains of this process."""
+
+    def __init__(self):
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """An open connection, reusing one that has not been idle too long; raises if it cannot connect."""
+        max_idle = getattr(settings, 'EMAIL_CONNECTION_MAX_IDLE', 60)
+        with self._lock:
+            while self._idle:
+                connection, last_used = self._idle.pop()
+                if time.monotonic() - last_used < max_idle:
+                    return connection
+                self._close(connection)
+        connection = get_connection(delivery_backend(), fail_silently=False)
+        connection.open()
+        return connection
+
+    def release(self, connection, broken=False):
+        if not broken:
+            with self._lock:
+                if len(self._idle) < getattr(settings, 'EMAIL_POOL_SIZE', 4):
+                    self._idle.append((connection, time.monotonic()))
+                    return
+        self._close(connection)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._close(connection)
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception as e:
+            logger.warning(f"Error closing email connection: {e}")
+
+
+pool = ConnectionPool()
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """EMAIL_BACKEND that stores messages in the outbox; delivery happens after commit."""
+
+    def send_messages(self, email_messages):
+        rows = []
+        direct = []
+        for message in email_messages:
+            if not message.recipients():
+                continue
+            if message.attachments:
+                # Attachments are not stored in the outbox; send these as before
+                direct.append(message)
+                continue
+            rows.append(OutboundEmail(
+                from_email=message.from_email or '',
+                to=list(message.to),
+                cc=list(message.cc),
+                bcc=list(message.bcc),
+                reply_to=list(message.reply_to),
+                subject=message.subject,
+                body=message.body,
+                alternatives=[[content, mimetype] for content, mimetype in getattr(message, 'alternatives', [])],
+                headers=message.extra_headers,
+                next_attempt_at=timezone.now(),
+            ))
+        try:
+            if rows:
+                OutboundEmail.objects.bulk_create(rows)
+                run_coalesced_in_background(deliver_due_emails)
+            if direct:
+                get_connection(delivery_backend(), fail_silently=self.fail_silently).send_messages(direct)
+        except Exception:
+            if not self.fail_silently:
+                raise
+            logger.error(f"Could not queue {len(rows) + len(direct)} emails", exc_info=True)
+            return 0
+        return len(rows) + len(direct)
+
+
+def retry_delay(attempts):
+    base = getattr(settings, 'EMAIL_RETRY_BASE_SECONDS', 60)
+    return min(base * 2 ** (attempts - 1), getattr(settings, 'EMAIL_RETRY_MAX_SECONDS', 60 * 60))
+
+
+def is_permanent(error):
+    """Refused recipients and 5xx replies fail again; authentication and connection errors may not."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False
+    code = getattr(error, 'smtp_code', None)
+    return isinstance(code, int) and 500 <= code < 600
+
+
+def to_email_message(message, connection=None):
+    return EmailMultiAlternatives(
+        subject=message.subject,
+        body=message.body,
+        from_email=message.from_email or None,
+        to=message.to,
+        cc=message.cc,
+        bcc=message.bcc,
+        reply_to=message.reply_to,
+        headers=message.headers,
+        alternatives=[tuple(alternative) for alternative in message.alternatives],
+        connection=connection,
+    )
+
+
+def _claim(limit, now):
+    with transaction.atomic():
+        ids = list(OutboundEmail.objects.select_for_update(skip_locked=True).filter(
+            status__in=['pending', 'sending'], next_attempt_at__lte=now,
+        ).order_by('next_attempt_at').values_list('id', flat=True)[:limit])
+        OutboundEmail.objects.filter(id__in=ids).update(
+            status='sending', next_attempt_at=now + timedelta(seconds=LEASE_SECONDS)
+        )
+    return list(OutboundEmail.objects.filter(id__in=ids).order_by('id'))
+
+
+def _record_failure(message, error, now):
+    message.last_error = str(error)[:1000]
+    if is_permanent(error) or message.attempts >= getattr(settings, 'EMAIL_MAX_ATTEMPTS', 6):
+        message.status = 'dead'
+        logger.error(f"Email {message.id} dead-lettered after {message.attempts} attempts: {error}")
+    else:
+        message.status = 'pending'
+        message.next_attempt_at = now + timedelta(seconds=retry_delay(message.attempts))
+        logger.warning(f"Email {message.id} attempt {message.attempts} failed, retrying at {message.next_attempt_at}: {error}")
+
+
+def deliver_batch(messages, now=None):
+    """Send claimed messages over pooled connections and record each outcome."""
+    now = now or timezone.now()
+    connection = None
+    for message in messages:
+        message.attempts += 1
+        try:
+            if connection is None:
+                connection = pool.acquire()
+            connection.send_messages([to_email_message(message, connection)])
+        except Exception as e:
+            if connection is not None and not is_permanent(e):
+                # The connection may be unusable; the next message gets a fresh one
+                pool.release(connection, broken=True)
+                connection = None
+            _record_failure(message, e, now)
+        else:
+            message.status = 'sent'
+            message.sent_at = timezone.now()
+        message.save(update_fields=['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'])
+    if connection is not None:
+        pool.release(connection)
+
+
+def deliver_due_emails(limit=None, now=None):
+    """
+    Send every email that is due, in batches
+
+    Returns:
+        int: number of messages attempted
+    """
+    limit = limit or BATCH_SIZE
+    attempted = 0
+    while True:
+        batch_now = now or timezone.now()
+        batch = _claim(limit, batch_now)
+        deliver_batch(batch, batch_now)
+        attempted += len(batch)
+        if len(batch) < limit:
+            return attempted
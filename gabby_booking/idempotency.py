@@ -0,0 +1,77 @@
+"""
+Idempotency-Key support for POST endpoints
+
+    key = idempotency_key(request)
+    try:
+        with transaction.atomic():
+            record = claim(key, 'booking-create', request.data) if key else None
+            ... write ...
+            if record:
+                remember(record, 201, body)
+    except KeyAlreadyUsed:
+        return replay(key, 'booking-create', request.data)
+
+claim() inserts the key first so a concurrent retry blocks on the unique
+index until the original request commits (then replays it) or rolls back
+(then runs normally). Failed requests roll the key back with everything
+else, so only completed responses are ever replayed.
+"""
+import hashlib
+import json
+
+from django.db import IntegrityError, transaction
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+
+
+class KeyAlreadyUsed(Exception):
+    """The key was already used for this endpoint."""
+
+
+def idempotency_key(request):
+    key = (request.headers.get(HEADER) or '').strip()
+    return key[:255] or None
+
+
+def request_hash(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def claim(key, endpoint, data):
+    """Reserve the key inside the caller's transaction; raises KeyAlreadyUsed if it exists."""
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(key=key, endpoint=endpoint, request_hash=request_hash(data))
+    except IntegrityError:
+        raise KeyAlreadyUsed(key)
+
+
+def remember(record, response_status, body):
+    # Store the body exactly as the client received it (Decimals, dates rendered by DRF)
+    record.response_status = response_status
+    record.response_body = json.loads(JSONRenderer().render(body))
+    record.save(update_fields=['response_status', 'response_body'])
+
+
+def replay(key, endpoint, data):
+    """The stored response for a reused key, or 422 when the request body differs."""
+    record = IdempotencyKey.objects.filter(key=key, endpoint=endpoint).first()
+    if record is None or record.response_status is None:
+        # The original request rolled back after we saw its key; let the client retry
+        return Response(
+            {'success': False, 'error': 'A request with this Idempotency-Key is still in progress'},
+            status=status.HTTP_409_CONFLICT
+        )
+    if record.request_hash != request_hash(data):
+        return Response(
+            {'success': False, 'error': 'Idempotency-Key was already used with a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    response = Response(record.response_body, status=record.response_status)
+    response['Idempotent-Replayed'] = 'true'
+    return response
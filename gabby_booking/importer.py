@@ -0,0 +1,283 @@
+"""
+Bulk import of customers and historical appointments
+
+Used by the `import_bookings` management command and the dashboard import
+endpoint for businesses migrating from another booking tool. Input is CSV
+(with a header row) or NDJSON (one object per line), read incrementally so
+the file is never held in memory. Columns / keys:
+
+    email (required), first_name, last_name, phone
+    date, time, service             an appointment when date is present
+    duration, price                 default to the service's
+    provider                        team member email or name
+    location                        location name
+    status, note                    status defaults to completed (past) / confirmed (future)
+
+Rows are validated and written in batches: services, providers, locations and
+known customers are resolved through in-memory maps, new customers and
+appointments go in with bulk_create, one transaction per batch. bulk_create
+sends no signals, so no booking SMS goes out and the reminder of each upcoming
+appointment is scheduled here rather than by signals.py; cached availability
+is invalidated once at the end. Historical appointments are not conflict-checked.
+Emails are matched case-insensitively, as they are stored lowercased.
+"""
+import csv
+import json
+import logging
+import time
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .availability import ACTIVE_STATUSES
+from .availability_cache import invalidate_organization
+from .models import Appointment, Customer, Location, Service, TeamMember
+from .reminders import load_reminder_delay, reminder_due_at
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'ndjson')
+MAX_REPORTED_ERRORS = 1000
+# Appointment.total_price is DecimalField(max_digits=10, decimal_places=2)
+MAX_PRICE = Decimal('99999999.99')
+CENT = Decimal('0.01')
+STATUSES = {choice for choice, _ in Appointment.STATUS_CHOICES}
+TIME_FORMATS = ('%H:%M', '%H:%M:%S', '%I:%M %p', '%I:%M%p')
+
+
+class ImportFileError(Exception):
+    """The file itself cannot be read (unknown format, broken header)."""
+
+
+def iter_lines(stream):
+    """Decoded text lines from a binary or text stream, request body or uploaded file."""
+    for line in stream:
+        yield line.decode('utf-8-sig') if isinstance(line, bytes) else line
+
+
+def iter_records(stream, fmt):
+    """(line number, dict) pairs; lines that cannot be parsed come back as (line number, None)."""
+    if fmt not in FORMATS:
+        raise ImportFileError(f"Unknown format '{fmt}', expected one of {', '.join(FORMATS)}")
+    lines = iter_lines(stream)
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        if not reader.fieldnames or 'email' not in [name.strip().lower() for name in reader.fieldnames]:
+            raise ImportFileError("CSV header must include an 'email' column")
+        for record in reader:
+            yield reader.line_num, {(key or '').strip().lower(): (value or '').strip() for key, value in record.items()}
+    else:
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield line_number, None
+                continue
+            yield line_number, record if isinstance(record, dict) else None
+
+
+def _parse_time(value):
+    try:
+        # Fast path for the common HH:MM / HH:MM:SS, strptime is slow over 100k rows
+        return dt_time.fromisoformat(value.strip())
+    except ValueError:
+        pass
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(value.strip().upper(), fmt).time()
+        except ValueError:
+            continue
+    raise ValueError(f"invalid time '{value}'")
+
+
+class BulkImporter:
+    """
+    Streams records into one organization in batches
+
+    Args:
+        batch_size: records validated and written per transaction
+        dry_run: validate everything, write nothing
+        progress: optional callable(report) called after every batch
+    """
+
+    def __init__(self, organization_id, batch_size=2000, dry_run=False, progress=None):
+        self.organization_id = organization_id
+        self.batch_size = max(batch_size, 1)
+        self.dry_run = dry_run
+        self.progress = progress
+        self.today = timezone.localdate()
+
+        self.services = {}
+        for service_id, name, duration, price in Service.objects.filter(
+            organization_id=organization_id
+        ).values_list('id', 'name', 'duration', 'price'):
+            self.services[name.strip().lower()] = self.services[str(service_id)] = (service_id, duration, price)
+        self.providers = {}
+        for provider_id, name, email in TeamMember.objects.filter(organization_id=organization_id).values_list('id', 'name', 'email'):
+            self.providers[name.strip().lower()] = self.providers[email.strip().lower()] = provider_id
+        self.locations = {
+            name.strip().lower(): location_id
+            for location_id, name in Location.objects.filter(
+                service_location__organization_id=organization_id
+            ).values_list('id', 'name')
+        }
+        self.customers = {
+            email.lower(): customer_id
+            for email, customer_id in Customer.objects.filter(organization_id=organization_id).values_list('email', 'id')
+        }
+        # Loaded on the first upcoming appointment; history-only imports never need it
+        self.reminder_delay = None
+
+        self.report = {
+            'rows': 0, 'customers_created': 0, 'appointments_created': 0,
+            'error_count': 0, 'errors': [], 'dry_run': dry_run, 'seconds': 0.0,
+        }
+
+    def run(self, records):
+        """Import an iterable of (line number, record) pairs and return the report."""
+        started = time.monotonic()
+        batch = []
+        for line_number, record in records:
+            batch.append((line_number, record))
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+
+        if self.report['appointments_created'] and not self.dry_run:
+            invalidate_organization(self.organization_id)
+        self.report['seconds'] = round(time.monotonic() - started, 3)
+        return self.report
+
+    def error(self, line_number, message):
+        self.report['error_count'] += 1
+        if len(self.report['errors']) < MAX_REPORTED_ERRORS:
+            self.report['errors'].append({'line': line_number, 'error': message})
+
+    def clean(self, record):
+        """(customer fields, appointment fields or None) for a record; raises ValueError."""
+        record = {str(key).strip().lower(): '' if value is None else str(value).strip() for key, value in record.items()}
+        email = record.get('email', '').lower()
+        if '@' not in email:
+            raise ValueError('missing or invalid email')
+        customer = {
+            'email': email,
+            'first_name': record.get('first_name', '')[:255],
+            'last_name': record.get('last_name', '')[:255],
+            'phone': record.get('phone', '')[:20],
+        }
+        if not record.get('date'):
+            return customer, None
+
+        try:
+            day = date.fromisoformat(record['date'])
+        except ValueError:
+            raise ValueError(f"invalid date '{record['date']}'")
+        service = self.services.get(record.get('service', '').lower())
+        if service is None:
+            raise ValueError(f"unknown service '{record.get('service', '')}'")
+        service_id, duration, price = service
+
+        provider_id = None
+        if record.get('provider'):
+            provider_id = self.providers.get(record['provider'].lower())
+            if provider_id is None:
+                raise ValueError(f"unknown provider '{record['provider']}'")
+        location_id = None
+        if record.get('location'):
+            location_id = self.locations.get(record['location'].lower())
+            if location_id is None:
+                raise ValueError(f"unknown location '{record['location']}'")
+
+        status = record.get('status', '').lower() or ('completed' if day < self.today else 'confirmed')
+        if status not in STATUSES:
+            raise ValueError(f"invalid status '{status}'")
+        if record.get('price'):
+            try:
+                price = Decimal(record['price'])
+            except InvalidOperation:
+                raise ValueError(f"invalid price '{record['price']}'")
+            if not price.is_finite() or not 0 <= price <= MAX_PRICE or price != price.quantize(CENT):
+                raise ValueError(f"invalid price '{record['price']}'")
+        if record.get('duration'):
+            try:
+                duration = int(record['duration'])
+            except ValueError:
+                raise ValueError(f"invalid duration '{record['duration']}'")
+            if duration < 1:
+                raise ValueError(f"invalid duration '{record['duration']}'")
+
+        appointment = {
+            'service_id': service_id,
+            'provider_id': provider_id,
+            'location_id': location_id,
+            'date': day,
+            'time': _parse_time(record.get('time') or ''),
+            'duration': duration,
+            'total_price': price,
+            'status': status,
+            'note': record.get('note', ''),
+        }
+        if status in ACTIVE_STATUSES and day >= self.today:
+            if self.reminder_delay is None:
+                self.reminder_delay = load_reminder_delay(self.organization_id)
+            appointment['reminder_due_at'] = reminder_due_at(self.reminder_delay, day, appointment['time'])
+        return customer, appointment
+
+    def import_batch(self, batch):
+        new_customers = {}
+        appointments = []
+        for line_number, record in batch:
+            self.report['rows'] += 1
+            if record is None:
+                self.error(line_number, 'unreadable line')
+                continue
+            try:
+                customer, appointment = self.clean(record)
+            except (ValueError, TypeError) as e:
+                self.error(line_number, str(e))
+                continue
+            if customer['email'] not in self.customers:
+                new_customers.setdefault(customer['email'], customer)
+            if appointment:
+                appointments.append((customer['email'], appointment))
+
+        if self.dry_run:
+            self.report['customers_created'] += len(new_customers)
+            self.report['appointments_created'] += len(appointments)
+            for email in new_customers:
+                self.customers[email] = None
+        else:
+            with transaction.atomic():
+                if new_customers:
+                    inserted_at = timezone.now()
+                    Customer.objects.bulk_create(
+                        [Customer(organization_id=self.organization_id, **fields) for fields in new_customers.values()],
+                        ignore_conflicts=True,
+                    )
+                    # ignore_conflicts leaves primary keys unset; one read resolves the batch. Rows a
+                    # concurrent import or signup wrote first (ours were skipped) are matched, not counted
+                    found = {}
+                    for email, customer_id, created_at in Customer.objects.annotate(email_lower=Lower('email')).filter(
+                        organization_id=self.organization_id, email_lower__in=list(new_customers)
+                    ).values_list('email', 'id', 'created_at'):
+                        ours = email == email.lower() and created_at >= inserted_at
+                        if ours or email.lower() not in found:
+                            found[email.lower()] = customer_id
+                        self.report['customers_created'] += ours
+                    self.customers.update(found)
+                Appointment.objects.bulk_create([
+                    Appointment(organization_id=self.organization_id, customer_id=self.customers[email], **fields)
+                    for email, fields in appointments
+                ], batch_size=self.batch_size)
+                self.report['appointments_created'] += len(appointments)
+
+        logger.info(f"Import into organization {self.organization_id}: {self.report['rows']} rows processed")
+        if self.progress:
+            self.progress(self.report)
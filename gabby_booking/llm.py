@@ -0,0 +1,51 @@
+"""
+LLM backends used to generate business prompts
+
+PROMPT_LLM_BACKEND selects the backend: 'openai' (default) or 'fake', a local
+deterministic backend for tests and development that never calls the network.
+"""
+from django.conf import settings
+
+from sonoria_backend.clients import get_chat_model, human_message
+
+
+def build_meta_prompt(business_name, business_description):
+    return (
+        f"You are an AI prompt generator. Your task is to create a well-structured and effective prompt for OpenAI’s assistant, "
+        f"which will act as a business-specific AI agent. \n\n"
+        f"The AI assistant will handle appointment bookings for a business named '{business_name}', which provides '{business_description}'. \n\n"
+        f"Your response should be a fully formatted prompt that can be used directly in OpenAI for real-time interactions."
+    )
+
+
+class OpenAIPromptBackend:
+    model_name = "gpt-4o"
+
+    def generate(self, meta_prompt):
+        llm = get_chat_model(self.model_name, temperature=0.7)
+        response = llm.invoke([human_message(meta_prompt)])
+        return response.content
+
+
+class FakePromptBackend:
+    """Returns a canned prompt and counts calls."""
+    calls = 0
+
+    def generate(self, meta_prompt):
+        FakePromptBackend.calls += 1
+        return f"# Generated prompt\n{meta_prompt}"
+
+
+BACKENDS = {
+    'openai': OpenAIPromptBackend,
+    'fake': FakePromptBackend,
+}
+
+
+def get_prompt_backend():
+    return BACKENDS[getattr(settings, 'PROMPT_LLM_BACKEND', 'openai')]()
+
+
+def generate_business_prompt(business_name, business_description):
+    """Use the configured LLM to generate a real-time prompt for appointment booking."""
+    return get_prompt_backend().generate(build_meta_prompt(business_name, business_description))
@@ -0,0 +1,74 @@
+"""
+Import customers and historical appointments from a CSV or NDJSON export
+
+Usage:
+    python manage.py import_bookings 12 clients.csv
+    python manage.py import_bookings 12 history.ndjson --batch-size 5000 --report report.json
+    cat history.ndjson | python manage.py import_bookings 12 - --format ndjson --dry-run
+
+See gabby_booking/importer.py for the accepted columns. The file is streamed
+and written in batches without sending any SMS; progress is printed after
+each batch and the error report at the end.
+"""
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gabby_booking.importer import FORMATS, BulkImporter, ImportFileError, iter_records
+from gabby_booking.models import Organization
+
+
+class Command(BaseCommand):
+    help = 'Import customers and historical appointments from CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('organization_id', type=int)
+        parser.add_argument('path', help="File to import, or - for stdin")
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows validated and written per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and report without writing')
+        parser.add_argument('--report', help='Also write the full report as JSON to this path')
+        parser.add_argument('--errors', type=int, default=20, help='Number of errors to print')
+
+    def handle(self, *args, **options):
+        if not Organization.objects.filter(id=options['organization_id']).exists():
+            raise CommandError(f"Organization {options['organization_id']} does not exist")
+
+        path = options['path']
+        fmt = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        importer = BulkImporter(
+            options['organization_id'], batch_size=options['batch_size'], dry_run=options['dry_run'],
+            progress=lambda report: self.stdout.write(
+                f"  {report['rows']} rows, {report['customers_created']} customers, "
+                f"{report['appointments_created']} appointments, {report['error_count']} errors"
+            ),
+        )
+
+        stream = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        try:
+            report = importer.run(iter_records(stream, fmt))
+        except ImportFileError as e:
+            raise CommandError(str(e))
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+
+        mode = ' (dry run, nothing written)' if report['dry_run'] else ''
+        self.stdout.write(f"Imported {report['rows']} rows in {report['seconds']:.1f}s{mode}")
+        self.stdout.write(
+            f"  customers created: {report['customers_created']}, "
+            f"appointments created: {report['appointments_created']}, errors: {report['error_count']}"
+        )
+        for error in report['errors'][:options['errors']]:
+            self.stderr.write(f"  line {error['line']}: {error['error']}")
+
+        if options['report']:
+            with open(options['report'], 'w') as report_file:
+                json.dump(report, report_file, indent=2)
+            self.stdout.write(f"Report written to {options['report']}")
+
+        if report['error_count']:
+            self.stdout.write(self.style.WARNING(f"Completed with {report['error_count']} errors"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,41 @@
+"""
+Requeue prompt generation jobs left pending or running by a restart
+
+Usage:
+    python manage.py requeue_prompt_jobs            # requeue once and exit (cron, deploy hook)
+    python manage.py requeue_prompt_jobs --loop     # keep sweeping every --interval seconds
+
+Jobs run on the web process's background pool (gabby_booking/prompt_jobs.py);
+a job that has not moved for --timeout seconds lost its process and is run again.
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from gabby_booking.background import shutdown_executor
+from gabby_booking.prompt_jobs import requeue_stale_prompt_jobs
+
+
+class Command(BaseCommand):
+    help = 'Requeue prompt generation jobs left pending or running by a restart'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping instead of exiting')
+        parser.add_argument('--interval', type=float, default=60, help='Seconds between sweeps with --loop')
+        parser.add_argument('--timeout', type=float, default=None,
+                            help='Seconds without progress before a job is stale (default PROMPT_JOB_STALE_SECONDS)')
+
+    def handle(self, *args, **options):
+        timeout = options['timeout'] if options['timeout'] is not None else getattr(settings, 'PROMPT_JOB_STALE_SECONDS', 10 * 60)
+        while True:
+            requeued = requeue_stale_prompt_jobs(timeout=timeout)
+            if requeued:
+                self.stdout.write(f"Requeued {requeued} prompt jobs")
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
+        # Requeued jobs run on this process's pool; let them finish before exiting
+        shutdown_executor()
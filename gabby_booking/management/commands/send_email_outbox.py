@@ -0,0 +1,41 @@
+"""
+Deliver queued emails from the outbox
+
+Usage:
+    python manage.py send_email_outbox            # send what is due and exit (cron)
+    python manage.py send_email_outbox --loop     # worker process, polls every --interval seconds
+
+Queued emails already trigger a drain in the web process; this worker picks
+up retries whose backoff has expired and messages left behind by a restart.
+Its SMTP connections stay open between polls (see email_outbox.ConnectionPool).
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from gabby_booking.email_outbox import deliver_due_emails, pool
+from gabby_booking.models import OutboundEmail
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails from the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls with --loop')
+        parser.add_argument('--batch-size', type=int, default=100, help='Emails claimed per batch')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                attempted = deliver_due_emails(limit=options['batch_size'])
+                if attempted:
+                    dead = OutboundEmail.objects.filter(status='dead').count()
+                    self.stdout.write(f"Attempted {attempted} emails ({dead} dead-lettered in total)")
+                if not options['loop']:
+                    return
+                close_old_connections()
+                time.sleep(options['interval'])
+        finally:
+            pool.close_all()
@@ -0,0 +1,46 @@
+"""
+Send appointment reminders that are due
+
+Usage:
+    python manage.py send_reminders              # send what is due and exit (cron)
+    python manage.py send_reminders --loop       # scheduler process, polls every --interval seconds
+    python manage.py send_reminders --reschedule # recompute due times of upcoming appointments first
+
+Several schedulers can run at once; each claims its own batches.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from gabby_booking.models import BookingRule
+from gabby_booking.reminders import reschedule_reminders, send_due_reminders
+
+
+class Command(BaseCommand):
+    help = 'Send appointment reminders that are due'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting')
+        parser.add_argument('--interval', type=float, default=30, help='Seconds between polls with --loop')
+        parser.add_argument('--batch-size', type=int, default=500, help='Appointments claimed per batch')
+        parser.add_argument('--reschedule', action='store_true',
+                            help="Recompute every organization's pending reminders before sending")
+
+    def handle(self, *args, **options):
+        if options['reschedule']:
+            for organization_id in BookingRule.objects.values_list('organization_id', flat=True):
+                updated = reschedule_reminders(organization_id)
+                self.stdout.write(f"Organization {organization_id}: {updated} reminders rescheduled")
+
+        while True:
+            totals = send_due_reminders(limit=options['batch_size'])
+            if totals['claimed']:
+                self.stdout.write(
+                    f"Reminders: {totals['sent']} sent, {totals['failed']} failed, "
+                    f"{totals['skipped']} skipped (already started)"
+                )
+            if not options['loop']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
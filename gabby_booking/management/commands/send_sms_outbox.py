@@ -0,0 +1,37 @@
+"""
+Deliver queued SMS from the outbox
+
+Usage:
+    python manage.py send_sms_outbox            # send what is due and exit (cron)
+    python manage.py send_sms_outbox --loop     # worker process, polls every --interval seconds
+
+New bookings already trigger a drain in the web process; this worker picks
+up retries whose backoff has expired and messages left behind by a restart.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from gabby_booking.models import OutboundSMS
+from gabby_booking.sms_outbox import deliver_due
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued SMS from the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls with --loop')
+        parser.add_argument('--batch-size', type=int, default=50, help='Messages claimed per batch')
+
+    def handle(self, *args, **options):
+        while True:
+            attempted = deliver_due(limit=options['batch_size'])
+            if attempted:
+                dead = OutboundSMS.objects.filter(status='dead').count()
+                self.stdout.write(f"Attempted {attempted} messages ({dead} dead-lettered in total)")
+            if not options['loop']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
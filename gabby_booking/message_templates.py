@@ -0,0 +1,217 @@
+"""
+Compiled CommunicationTemplate messages
+
+Owners edit their booking SMS and emails in the dashboard with {{placeholder}}
+variables. Each template is parsed once into a tuple of segments
+
+    ('text', 'Hi '), ('var', 'client_first_name'), ('text', ',\n...')
+
+and stored, together with everything the placeholders need from the
+organization (business and assistant names, links, service names, location
+addresses), in one cached bundle per organization. The bundle key embeds the
+message generation (availability_cache.py), which signals.py bumps when the
+organization, templates, the assistant, services or locations change, so it
+doubles as the template version. Rendering a message is then a cache read and a join: no
+queries beyond the appointment's customer, which callers already have.
+
+Organizations without a saved template (or with an empty field) get the
+defaults shown in the dashboard. Unknown placeholders render as empty text.
+"""
+import logging
+import os
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .availability import format_slot_time, time_to_minutes
+from .availability_cache import message_generation
+from .models import Assistant, CommunicationTemplate, Location, Organization, Service, ServiceLocation
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+DEFAULT_ASSISTANT_NAME = 'Clara'
+
+# Owner-editable templates: the CommunicationTemplate field names and their defaults
+DEFAULT_TEMPLATES = {
+    'booking_sms_content': '''Hi this is {{assistant_name}} from {{business_name}}.
+
+Here's the link to book your appointment easily :
+
+{{booking_link}}
+
+Let me know if you need anything, I'm happy to help.''',
+    'confirmation_email_subject': 'Your appointment is confirmed ✅',
+    'confirmation_email_content': '''Hi {{client_first_name}},
+
+Thank you for your booking!
+
+Your appointment is confirmed for:
+Date: {{date_of_appointment}}
+Time: {{time_of_appointment}}
+Service: {{service_name}}
+Address: {{address_of_appointment}}
+
+If you have any questions feel free to reply to this email
+
+Looking forward to seeing you soon
+— The {{business_name}} Team
+
+If you have allowed appointment modifications or cancellations your clients will be able to access their customer portal directly through this email''',
+    'modification_email_subject': 'Your appointment has been updated ✅',
+    'modification_email_content': '''Hi {{client_first_name}},
+
+Your appointment has been successfully updated
+
+Previous date and time: {{previous_date_of_appointment}} at {{previous_time_of_appointment}}
+New date and time: {{date_of_appointment}} at {{time_of_appointment}}
+Service: {{service_name}}
+Address: {{address_of_appointment}}
+
+If you have any questions or need to make further changes feel free to reply to this email
+
+We look forward to seeing you soon
+— The {{business_name}} Team''',
+    'cancellation_email_subject': 'Your appointment has been canceled ❌',
+    'cancellation_email_content': '''Hi {{client_first_name}},
+
+Your appointment scheduled for
+Date: {{date_of_appointment}}
+Time: {{time_of_appointment}}
+Service: {{service_name}}
+Address: {{address_of_appointment}}
+has been successfully canceled
+
+If this was a mistake or you'd like to rebook you can use your customer portal or contact us
+
+Take care
+— The {{business_name}} Team''',
+    'reminder_email_subject': 'Reminder - Your appointment is coming up 📅',
+    'reminder_email_content': '''Hi {{client_first_name}},
+
+This is a quick reminder that you have an upcoming appointment scheduled for:
+Date: {{date_of_appointment}}
+Time: {{time_of_appointment}}
+Service: {{service_name}}
+Address: {{address_of_appointment}}
+
+If you need to reschedule or cancel feel free to use your customer portal or reply to this email
+
+We look forward to seeing you soon
+— The {{business_name}} Team''',
+}
+
+# Built-in messages without a CommunicationTemplate field
+BUILTIN_TEMPLATES = {
+    'reschedule_sms': '''Hi this is {{assistant_name}} from {{business_name}}. Here's the link to reschedule your appointment easily:
+{{customer_portal_link}}
+Let me know if you need anything, I'm happy to help.''',
+    'cancellation_sms': '''Hi this is {{assistant_name}} from {{business_name}}. Here's the link to cancel your appointment:
+{{customer_portal_link}}
+You can easily manage your booking there. Let me know if you need any help!''',
+    'reminder_sms': '''Hi {{client_first_name}}, this is {{assistant_name}} from {{business_name}}. Reminder: your {{service_name}} appointment is on {{date_of_appointment}} at {{time_of_appointment}}.
+Need to change it? {{customer_portal_link}}''',
+}
+
+
+@lru_cache(maxsize=1024)
+def compile_template(text):
+    """Parse a template into a tuple of ('text', str) and ('var', name) segments."""
+    segments = []
+    position = 0
+    for match in PLACEHOLDER.finditer(text):
+        if match.start() > position:
+            segments.append(('text', text[position:match.start()]))
+        segments.append(('var', match.group(1)))
+        position = match.end()
+    if position < len(text):
+        segments.append(('text', text[position:]))
+    return tuple(segments)
+
+
+def render_segments(segments, context):
+    return ''.join(value if kind == 'text' else str(context.get(value, '')) for kind, value in segments)
+
+
+def _build_bundle(organization_id):
+    organization = Organization.objects.filter(id=organization_id).values('id', 'name').first()
+    if organization is None:
+        raise Organization.DoesNotExist(f"Organization {organization_id} does not exist")
+
+    saved = CommunicationTemplate.objects.filter(organization_id=organization_id).values(*DEFAULT_TEMPLATES).first() or {}
+    base_url = os.getenv('FRONTEND_URL', 'https://sonoria-frontend-9cay.vercel.app')
+    return {
+        'templates': {
+            **{name: compile_template(saved.get(name) or default) for name, default in DEFAULT_TEMPLATES.items()},
+            **{name: compile_template(text) for name, text in BUILTIN_TEMPLATES.items()},
+        },
+        'context': {
+            'business_name': organization['name'],
+            'assistant_name': Assistant.objects.filter(
+                organization_id=organization_id
+            ).values_list('name', flat=True).first() or DEFAULT_ASSISTANT_NAME,
+            'booking_link': f"{base_url}/booking-portal?org={organization_id}",
+            'customer_portal_link': f"{base_url}/customer-portal?org={organization_id}",
+        },
+        'main_address': ServiceLocation.objects.filter(
+            organization_id=organization_id
+        ).values_list('main_address', flat=True).first() or '',
+        'services': dict(Service.objects.filter(organization_id=organization_id).values_list('id', 'name')),
+        'locations': dict(Location.objects.filter(
+            service_location__organization_id=organization_id
+        ).values_list('id', 'address')),
+    }
+
+
+def organization_bundle(organization_id):
+    """Compiled templates and organization context, cached until any of their inputs change."""
+    key = f"messages:{organization_id}:{message_generation(organization_id)}"
+    bundle = cache.get(key)
+    if bundle is None:
+        bundle = _build_bundle(organization_id)
+        cache.set(key, bundle, getattr(settings, 'MESSAGE_TEMPLATE_CACHE_TIMEOUT', 60 * 60))
+    return bundle
+
+
+def _spoken_date(day):
+    return f"{day.strftime('%A, %B')} {day.day}"
+
+
+def appointment_context(bundle, appointment, old_date=None, old_time=None):
+    """Placeholder values for an appointment; reads only already-loaded fields and the customer."""
+    context = {
+        'client_first_name': appointment.customer.first_name,
+        'client_last_name': appointment.customer.last_name,
+        'date_of_appointment': _spoken_date(appointment.date),
+        'time_of_appointment': format_slot_time(time_to_minutes(appointment.time)),
+        'service_name': bundle['services'].get(appointment.service_id, ''),
+        'address_of_appointment': bundle['locations'].get(appointment.location_id) or bundle['main_address'],
+    }
+    if old_date:
+        context['previous_date_of_appointment'] = _spoken_date(old_date)
+    if old_time:
+        context['previous_time_of_appointment'] = format_slot_time(time_to_minutes(old_time))
+    return context
+
+
+def render_message(organization_id, name, appointment=None, **extra):
+    """
+    Render one of the organization's messages
+
+    Args:
+        name: a DEFAULT_TEMPLATES or BUILTIN_TEMPLATES key, e.g. 'booking_sms_content'
+        appointment: fills the appointment placeholders (date, time, service, address, client)
+        extra: more placeholder values, e.g. old_date / old_time for modifications
+    """
+    return render_bundle_message(organization_bundle(organization_id), name, appointment, **extra)
+
+
+def render_bundle_message(bundle, name, appointment=None, **extra):
+    """render_message with an already loaded organization_bundle, for senders working through many appointments."""
+    context = dict(bundle['context'])
+    if appointment is not None:
+        context.update(appointment_context(bundle, appointment, extra.pop('old_date', None), extra.pop('old_time', None)))
+    context.update(extra)
+    return render_segments(bundle['templates'][name], context)
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-19 06:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gabby_booking', '0013_customer_appointment_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organizationprompt',
+            name='compiled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='organizationprompt',
+            name='compiled_prompt',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='organizationprompt',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', help_text='SHA-256 of compiled_prompt, used as ETag', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='organizationprompt',
+            name='version',
+            field=models.PositiveIntegerField(default=0, help_text='Incremented every time compiled_prompt changes'),
+        ),
+        migrations.AlterField(
+            model_name='organizationprompt',
+            name='generated_prompt',
+            field=models.TextField(blank=True, default='', help_text='LLM-generated prompt from organization creation'),
+        ),
+    ]
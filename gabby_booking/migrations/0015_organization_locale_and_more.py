@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 06:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gabby_booking', '0014_organizationprompt_compiled_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organization',
+            name='locale',
+            field=models.CharField(default='en', help_text='Language of the assistant prompt, see assistant/prompts/', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='organizationprompt',
+            name='section_versions',
+            field=models.JSONField(blank=True, default=dict, help_text='Per-section data versions, used as segment cache keys'),
+        ),
+    ]
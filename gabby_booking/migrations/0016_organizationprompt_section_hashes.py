@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gabby_booking', '0015_organization_locale_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organizationprompt',
+            name='section_hashes',
+            field=models.JSONField(blank=True, default=dict, help_text='Per-section content digests, used by rebuild_prompts reports'),
+        ),
+    ]
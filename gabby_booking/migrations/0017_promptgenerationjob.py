@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-19 06:19
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gabby_booking', '0016_organizationprompt_section_hashes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromptGenerationJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('input_hash', models.CharField(db_index=True, help_text='SHA-256 of (name, description)', max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('cached', models.BooleanField(default=False, help_text='Result reused from an earlier job with the same input')),
+                ('result', models.TextField(blank=True, default='')),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prompt_jobs', to='gabby_booking.organization')),
+            ],
+        ),
+    ]
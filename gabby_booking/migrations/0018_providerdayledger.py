@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-19 06:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gabby_booking', '0017_promptgenerationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderDayLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider_key', models.PositiveBigIntegerField(default=0)),
+                ('date', models.DateField()),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='provider_day_ledgers', to='gabby_booking.organization')),
+            ],
+            options={
+                'unique_together': {('organization', 'provider_key', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 06:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gabby_booking', '0018_providerdayledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='teammemberconfig',
+            name='assignment_strategy',
+            field=models.CharField(choices=[('fewest_minutes', 'Fewest minutes booked this week'), ('round_robin', 'Round robin')], default='fewest_minutes', help_text='Tie-break between equally loaded providers when auto-assigning', max_length=20),
+        ),
+    ]
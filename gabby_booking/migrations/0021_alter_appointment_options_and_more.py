@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 06:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gabby_booking', '0020_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='appointment',
+            options={},
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['organization', 'date', 'time', 'id'], name='gabby_booki_organiz_cdaf4a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['organization', 'status', 'date', 'time', 'id'], name='gabby_booki_organiz_3064a0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['provider', 'date', 'time', 'id'], name='gabby_booki_provide_9a7ca3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['location', 'date', 'time', 'id'], name='gabby_booki_locatio_0db47d_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-19 06:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gabby_booking', '0021_alter_appointment_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundSMS',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notification_type', models.CharField(blank=True, default='', max_length=20)),
+                ('to_number', models.CharField(max_length=20)),
+                ('from_number', models.CharField(blank=True, default='', max_length=20)),
+                ('body', models.TextField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('dead', 'Dead')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(help_text="When a worker may (re)try; while sending, the claim's expiry")),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('sid', models.CharField(blank=True, default='', help_text='Twilio message SID once accepted', max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('appointment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='outbound_sms', to='gabby_booking.appointment')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbound_sms', to='gabby_booking.organization')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='gabby_booki_status_53f214_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gabby_booking', '0022_outboundsms'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='reminder_due_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='reminder_sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('reminder_due_at__isnull', False)), fields=['status', 'reminder_due_at'], name='appointment_reminder_due_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gabby_booking', '0024_outboundemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundsms',
+            name='delivered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='outboundsms',
+            name='delivery_status',
+            field=models.CharField(blank=True, default='', help_text='Twilio MessageStatus, e.g. delivered', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='outboundsms',
+            name='error_code',
+            field=models.CharField(blank=True, default='', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='outboundsms',
+            name='sid',
+            field=models.CharField(blank=True, db_index=True, default='', help_text='Twilio message SID once accepted', max_length=64),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gabby_booking', '0025_outboundsms_delivered_at_outboundsms_delivery_status_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promptgenerationjob',
+            name='description',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='promptgenerationjob',
+            name='name',
+            field=models.CharField(blank=True, default='', help_text='Input kept so a stale job can be requeued', max_length=255),
+        ),
+    ]
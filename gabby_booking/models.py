@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from users.models import User
 
@@ -40,6 +42,7 @@ class Organization(models.Model):
     business_line = models.CharField(max_length=255, blank=True, null=True)
     industry = models.CharField(max_length=255, blank=True, null=True)
     description = models.TextField(blank=True, null=True)
+    locale = models.CharField(max_length=10, default='en', help_text="Language of the assistant prompt, see assistant/prompts/")
     # Progress tracking
     current_step = models.PositiveIntegerField(default=1)
     assistant_created = models.BooleanField(default=False)
@@ -90,11 +93,20 @@ class ServiceAddOnConfig(models.Model):
 
 
 class TeamMemberConfig(models.Model):
+    ASSIGNMENT_STRATEGY_CHOICES = [
+        ('fewest_minutes', 'Fewest minutes booked this week'),
+        ('round_robin', 'Round robin'),
+    ]
+
     organization = models.OneToOneField(Organization, on_delete=models.CASCADE, related_name='team_config')
     has_multiple_members = models.BooleanField(default=False)
     allow_staff_self_manage = models.BooleanField(default=False)
     allow_client_choose_worker = models.BooleanField(default=False)
     auto_assign_bookings = models.BooleanField(default=False)
+    assignment_strategy = models.CharField(
+        max_length=20, choices=ASSIGNMENT_STRATEGY_CHOICES, default='fewest_minutes',
+        help_text="Tie-break between equally loaded providers when auto-assigning"
+    )
 
     def __str__(self):
         return f"Team Config - {self.organization.name}"
@@ -135,13 +147,46 @@ class BusinessHours(models.Model):
 
 class OrganizationPrompt(models.Model):
     organization = models.OneToOneField(Organization, on_delete=models.CASCADE, related_name='prompt')
-    generated_prompt = models.TextField()
+    generated_prompt = models.TextField(blank=True, default='', help_text="LLM-generated prompt from organization creation")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Materialized output of assistant.prompt_builder.build_system_prompt
+    compiled_prompt = models.TextField(blank=True, default='')
+    content_hash = models.CharField(max_length=64, blank=True, default='', help_text="SHA-256 of compiled_prompt, used as ETag")
+    version = models.PositiveIntegerField(default=0, help_text="Incremented every time compiled_prompt changes")
+    compiled_at = models.DateTimeField(null=True, blank=True)
+    section_versions = models.JSONField(default=dict, blank=True, help_text="Per-section data versions, used as segment cache keys")
+    section_hashes = models.JSONField(default=dict, blank=True, help_text="Per-section content digests, used by rebuild_prompts reports")
+
     def __str__(self):
         return f"Prompt for {self.organization.name}"
 
 
+class PromptGenerationJob(models.Model):
+    """Background LLM prompt generation requested at organization creation."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='prompt_jobs')
+    input_hash = models.CharField(max_length=64, db_index=True, help_text="SHA-256 of (name, description)")
+    name = models.CharField(max_length=255, blank=True, default='', help_text="Input kept so a stale job can be requeued")
+    description = models.TextField(blank=True, default='')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    cached = models.BooleanField(default=False, help_text="Result reused from an earlier job with the same input")
+    result = models.TextField(blank=True, default='')
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Prompt job {self.id} ({self.status})"
+
+
 
 # Step 3: Exceptional Closings (Temporary Closures & Special Openings)
 class ExceptionalClosing(models.Model):
@@ -337,12 +382,139 @@ class Appointment(models.Model):
     confirmed_at = models.DateTimeField(null=True, blank=True)
     cancelled_at = models.DateTimeField(null=True, blank=True)
 
+    # Reminder (see reminders.py): due time while one is pending, cleared when the scheduler claims it
+    reminder_due_at = models.DateTimeField(null=True, blank=True)
+    reminder_sent_at = models.DateTimeField(null=True, blank=True)
+
     class Meta:
-        ordering = ['-date', '-time']
+        # No default ordering: callers order explicitly (keyset pages on date, time, id)
+        # so unordered reads like availability don't pay for a sort
         indexes = [
             models.Index(fields=['organization', 'date', 'status']),
             models.Index(fields=['customer', '-date']),
+            # Dashboard list (views_dashboard.AppointmentViewSet): one index per filter,
+            # each ending in the keyset order so pages are read in index order without a sort
+            models.Index(fields=['organization', 'date', 'time', 'id']),
+            models.Index(fields=['organization', 'status', 'date', 'time', 'id']),
+            models.Index(fields=['provider', 'date', 'time', 'id']),
+            models.Index(fields=['location', 'date', 'time', 'id']),
+            # Reminder scheduler: only appointments with a pending reminder are indexed
+            models.Index(fields=['status', 'reminder_due_at'], condition=models.Q(reminder_due_at__isnull=False),
+                         name='appointment_reminder_due_idx'),
         ]
 
     def __str__(self):
         return f"{self.customer.first_name} {self.customer.last_name} - {self.service.name} on {self.date} at {self.time}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response of a POST sent with an Idempotency-Key header, replayed when the
+    client retries with the same key. The row is inserted at the start of the
+    request's transaction, so a concurrent retry waits on it and then replays.
+    """
+    key = models.CharField(max_length=255)
+    endpoint = models.CharField(max_length=50)
+    request_hash = models.CharField(max_length=64, help_text="SHA-256 of the request body")
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ('key', 'endpoint')
+
+    def __str__(self):
+        return f"{self.endpoint} {self.key}"
+
+
+class ProviderDayLedger(models.Model):
+    """
+    One row per (organization, provider, date), locked with SELECT ... FOR UPDATE
+    while an appointment on that provider-day is checked and written.
+    provider_key is the TeamMember id, or 0 for appointments without a provider.
+    """
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='provider_day_ledgers')
+    provider_key = models.PositiveBigIntegerField(default=0)
+    date = models.DateField()
+
+    class Meta:
+        unique_together = ('organization', 'provider_key', 'date')
+
+    def __str__(self):
+        return f"Ledger {self.organization_id}/{self.provider_key or '-'} on {self.date}"
+
+
+class OutboundSMS(models.Model):
+    """
+    Transactional SMS outbox. Rows are written in the same transaction as the
+    appointment change that triggers them and delivered by sms_outbox.py, so a
+    rolled-back booking sends nothing and a Twilio outage delays messages
+    instead of losing them. Failed sends are retried with exponential backoff;
+    'dead' rows exhausted their attempts or were rejected for good.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('dead', 'Dead'),
+    ]
+
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='outbound_sms')
+    appointment = models.ForeignKey(Appointment, on_delete=models.SET_NULL, related_name='outbound_sms', null=True, blank=True)
+    notification_type = models.CharField(max_length=20, blank=True, default='')
+    to_number = models.CharField(max_length=20)
+    from_number = models.CharField(max_length=20, blank=True, default='')
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(help_text="When a worker may (re)try; while sending, the claim's expiry")
+    last_error = models.TextField(blank=True, default='')
+    sid = models.CharField(max_length=64, blank=True, default='', db_index=True, help_text="Twilio message SID once accepted")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # From Twilio status callbacks (assistant/status_callbacks.py)
+    delivery_status = models.CharField(max_length=20, blank=True, default='', help_text="Twilio MessageStatus, e.g. delivered")
+    error_code = models.CharField(max_length=10, blank=True, default='')
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"SMS {self.id} to {self.to_number} ({self.status})"
+
+
+class OutboundEmail(models.Model):
+    """
+    Email outbox. The queued EMAIL_BACKEND (email_outbox.py) stores each
+    message here, in the caller's transaction, and workers deliver them over
+    pooled SMTP connections with the same retry and dead-letter rules as
+    OutboundSMS.
+    """
+    STATUS_CHOICES = OutboundSMS.STATUS_CHOICES
+
+    from_email = models.CharField(max_length=254, blank=True, default='')
+    to = models.JSONField(default=list)
+    cc = models.JSONField(default=list)
+    bcc = models.JSONField(default=list)
+    reply_to = models.JSONField(default=list)
+    subject = models.TextField(blank=True, default='')
+    body = models.TextField(blank=True, default='')
+    alternatives = models.JSONField(default=list, help_text="[content, mimetype] pairs, e.g. an HTML version")
+    headers = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(help_text="When a worker may (re)try; while sending, the claim's expiry")
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"Email {self.id} to {', '.join(self.to)} ({self.status})"
@@ -0,0 +1,49 @@
+"""
+Keyset pagination of appointments on (date, time, id)
+
+    appointments = keyset_page_filter(queryset, decode_cursor(cursor), descending=True)
+    page = list(appointments.order_by(*keyset_ordering(descending=True))[:limit + 1])
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+
+Unlike OFFSET, a page after the cursor costs the same however deep it is,
+and rows inserted meanwhile never shift pages. Cursors are opaque to clients.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+
+def encode_cursor(appointment):
+    """Opaque cursor pointing after an appointment."""
+    value = f"{appointment.date.isoformat()}|{appointment.time.isoformat()}|{appointment.id}"
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(date, time, id) from a cursor made by encode_cursor; raises ValueError."""
+    try:
+        value = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        day, start, appointment_id = value.split('|')
+        moment = datetime.fromisoformat(f"{day}T{start}")
+        return moment.date(), moment.time(), int(appointment_id)
+    except (TypeError, UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError(f'invalid cursor: {e}')
+
+
+def keyset_ordering(descending=False):
+    return ['-date', '-time', '-id'] if descending else ['date', 'time', 'id']
+
+
+def keyset_page_filter(queryset, cursor, descending=False):
+    """Rows strictly after the cursor in keyset_ordering(descending); no-op without a cursor."""
+    if not cursor:
+        return queryset
+    day, start, appointment_id = cursor
+    op = 'lt' if descending else 'gt'
+    return queryset.filter(
+        Q(**{f'date__{op}': day})
+        | Q(date=day, **{f'time__{op}': start})
+        | Q(date=day, time=start, **{f'id__{op}': appointment_id})
+    )
@@ -0,0 +1,73 @@
+"""
+Cached booking portal catalog
+
+The organization payload of the public booking portal (organization info,
+locations, services with their options, providers) is serialized once and
+cached under the organization's availability and message generations, one of
+which signals.py bumps whenever any of those change. A cached request is served from two cache
+reads and no queries; the ETag (a hash of the rendered payload) and
+Last-Modified (when it was built) let browsers and CDNs revalidate with a 304.
+"""
+import hashlib
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+
+from .availability_cache import organization_generations
+from .models import Location, Organization, Service, TeamMember
+from .serializers import BookingPortalLocationSerializer, BookingPortalProviderSerializer, BookingPortalServiceSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def _timeout():
+    return getattr(settings, 'BOOKING_PORTAL_CACHE_TIMEOUT', 60 * 60)
+
+
+def build_portal_payload(organization):
+    """The booking portal payload of an organization, in a fixed number of queries."""
+    # Location is linked via ServiceLocation, not directly to Organization
+    locations = Location.objects.filter(service_location__organization=organization)
+    services = Service.objects.filter(organization=organization).prefetch_related('options__services')
+    team_members = TeamMember.objects.filter(organization=organization)
+    return {
+        'organization': {
+            'id': organization.id,
+            'name': organization.name,
+            'industry': organization.industry,
+            'description': organization.description,
+        },
+        'locations': BookingPortalLocationSerializer(locations, many=True).data,
+        'services': BookingPortalServiceSerializer(services, many=True).data,
+        'providers': BookingPortalProviderSerializer(team_members, many=True).data,
+    }
+
+
+def portal_payload(organization_id):
+    """
+    Cached booking portal payload
+
+    Returns:
+        dict: {'data', 'etag', 'last_modified' (unix seconds)}, or None if the organization does not exist
+    """
+    org_generation, message_generation = organization_generations(organization_id)
+    key = f"portal:{organization_id}:{org_generation}:{message_generation}"
+    entry = cache.get(key)
+    if entry is None:
+        organization = Organization.objects.filter(id=organization_id).first()
+        if organization is None:
+            return None
+        # Render once so the cached copy and the ETag match exactly what clients receive
+        rendered = JSONRenderer().render(build_portal_payload(organization))
+        entry = {
+            'data': json.loads(rendered),
+            'etag': hashlib.sha256(rendered).hexdigest()[:32],
+            'last_modified': int(time.time()),
+        }
+        cache.set(key, entry, _timeout())
+        logger.info(f"Built booking portal payload for organization {organization_id}")
+    return entry
@@ -0,0 +1,130 @@
+"""
+Background LLM prompt generation for new organizations
+
+Organization creation no longer waits for the model: it records a
+PromptGenerationJob and returns its id, which the client polls at
+GET /api/prompt-jobs/<job_id>/. Results are keyed by a hash of the
+(name, description) input, so resubmitting the same business reuses the
+earlier result instead of calling the model again.
+
+Jobs run on the in-process pool, so a restart drops those still pending or
+running. requeue_stale_prompt_jobs() (`python manage.py requeue_prompt_jobs`)
+puts back jobs that have not moved for PROMPT_JOB_STALE_SECONDS.
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .background import run_in_background
+from .llm import generate_business_prompt
+from .models import OrganizationPrompt, PromptGenerationJob
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NAME = "the business"
+DEFAULT_DESCRIPTION = "a professional service provider"
+
+
+def prompt_input_hash(name, description):
+    payload = json.dumps([name, description], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _store_result(job, result, cached=False):
+    job.status = 'succeeded'
+    job.result = result
+    job.cached = cached
+    job.save(update_fields=['status', 'result', 'cached', 'updated_at'])
+    OrganizationPrompt.objects.update_or_create(organization_id=job.organization_id, defaults={'generated_prompt': result})
+
+
+def submit_prompt_generation(organization, name=None, description=None):
+    """
+    Queue prompt generation for an organization
+
+    Returns:
+        PromptGenerationJob: already succeeded if a result for the same input exists
+    """
+    name = name or DEFAULT_NAME
+    description = description or DEFAULT_DESCRIPTION
+    input_hash = prompt_input_hash(name, description)
+
+    with transaction.atomic():
+        job = PromptGenerationJob.objects.create(
+            organization=organization, input_hash=input_hash, name=name, description=description
+        )
+
+        previous = PromptGenerationJob.objects.filter(
+            input_hash=input_hash, status='succeeded'
+        ).exclude(id=job.id).order_by('-updated_at').values_list('result', flat=True).first()
+        if previous is not None:
+            _store_result(job, previous, cached=True)
+            logger.info(f"Reused generated prompt for organization {organization.id} (job {job.id})")
+            return job
+
+        run_in_background(run_prompt_job, job.id, name, description)
+        return job
+
+
+def requeue_stale_prompt_jobs(timeout=None, now=None):
+    """
+    Requeue pending or running jobs whose process went away before they finished
+
+    Args:
+        timeout: seconds without progress before a job counts as stale (PROMPT_JOB_STALE_SECONDS)
+
+    Returns:
+        int: number of jobs requeued
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'PROMPT_JOB_STALE_SECONDS', 10 * 60)
+    now = now or timezone.now()
+    stale = list(PromptGenerationJob.objects.filter(
+        status__in=['pending', 'running'], updated_at__lt=now - timedelta(seconds=timeout),
+    ).values_list('id', 'status', 'name', 'description'))
+
+    requeued = 0
+    for job_id, status, name, description in stale:
+        # Conditional on the status seen above, so a job that just finished or another sweep won is left alone
+        with transaction.atomic():
+            if not PromptGenerationJob.objects.filter(id=job_id, status=status).update(status='pending', updated_at=timezone.now()):
+                continue
+            run_in_background(run_prompt_job, job_id, name or DEFAULT_NAME, description or DEFAULT_DESCRIPTION)
+        requeued += 1
+    if requeued:
+        logger.warning(f"Requeued {requeued} stale prompt generation jobs")
+    return requeued
+
+
+def run_prompt_job(job_id, name, description):
+    # Queryset updates skip auto_now; a job that waited in the queue must not look stale once it runs
+    updated = PromptGenerationJob.objects.filter(id=job_id, status='pending').update(status='running', updated_at=timezone.now())
+    if not updated:
+        return
+
+    job = PromptGenerationJob.objects.get(id=job_id)
+
+    # An identical submission may have finished while this one was queued
+    previous = PromptGenerationJob.objects.filter(
+        input_hash=job.input_hash, status='succeeded'
+    ).order_by('-updated_at').values_list('result', flat=True).first()
+    if previous is not None:
+        _store_result(job, previous, cached=True)
+        return
+
+    try:
+        result = generate_business_prompt(name, description)
+    except Exception as e:
+        logger.error(f"Prompt generation failed for job {job_id}: {str(e)}", exc_info=True)
+        job.status = 'failed'
+        job.error = str(e)
+        job.save(update_fields=['status', 'error', 'updated_at'])
+        return
+
+    _store_result(job, result)
+    logger.info(f"Generated prompt for organization {job.organization_id} (job {job_id})")
@@ -0,0 +1,215 @@
+"""
+Appointment reminders
+
+Each active appointment stores when its reminder is due:
+
+    reminder_due_at = appointment start - BookingRule.email_reminder_delay
+
+set by signals.py whenever the appointment is saved (a new date or time
+schedules a new reminder; cancelling clears it) and recomputed for the whole
+organization in the background when its booking rules change. The delay is
+free text ('24 hours', '2 days before'); it is parsed once per organization
+and cached under the organization generation.
+
+send_due_reminders() is the scheduler tick. It claims appointments whose
+reminder is due with SELECT ... FOR UPDATE SKIP LOCKED on the partial
+(status, reminder_due_at) index, which only holds pending reminders, so
+several schedulers can run side by side and a backlog is a range scan rather
+than a table scan. Each batch is rendered from the cached message bundles,
+handed to the email backend in one call (the queued backend stores it with
+one INSERT, see email_outbox.py) and, when REMINDER_CHANNELS includes 'sms',
+queued in the SMS outbox the same way. In the same transaction the batch is
+marked sent, clearing reminder_due_at and moving its rows out of the index;
+until that commits they stay due, so a crash never loses a reminder. Failed
+emails are due again after REMINDER_RETRY_SECONDS (unless the SMS went out);
+appointments that have already started are skipped.
+
+Run `python manage.py send_reminders --loop` as a worker process.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .availability import ACTIVE_STATUSES, parse_duration_minutes
+from .availability_cache import organization_generation
+from .message_templates import organization_bundle, render_bundle_message
+from .models import Appointment, BookingRule
+from .sms_outbox import enqueue_sms_batch
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+def load_reminder_delay(organization_id):
+    """Minutes between the reminder and the appointment; 0 when reminders are off."""
+    value = BookingRule.objects.filter(
+        organization_id=organization_id
+    ).values_list('email_reminder_delay', flat=True).first()
+    return parse_duration_minutes(value)
+
+
+def reminder_delay_minutes(organization_id):
+    """load_reminder_delay, cached until the organization's booking rules change."""
+    key = f"reminder-delay:{organization_id}:{organization_generation(organization_id)}"
+    delay = cache.get(key)
+    if delay is None:
+        delay = load_reminder_delay(organization_id)
+        cache.set(key, delay, getattr(settings, 'AVAILABILITY_CACHE_TIMEOUT', 60 * 60))
+    return delay
+
+
+def reminder_due_at(delay, day, start_time):
+    """When the reminder of an appointment starting at day/start_time is due, or None without a delay."""
+    if not delay:
+        return None
+    return timezone.make_aware(datetime.combine(day, start_time)) - timedelta(minutes=delay)
+
+
+def schedule_reminder(appointment, day, start_time, moved):
+    """
+    Set appointment.reminder_due_at before a save
+
+    Args:
+        moved: the appointment is new or its date/time changed, so any reminder already sent is stale
+    """
+    if moved:
+        appointment.reminder_sent_at = None
+    if appointment.status not in ACTIVE_STATUSES or appointment.reminder_sent_at:
+        appointment.reminder_due_at = None
+        return
+    if moved or appointment.reminder_due_at is None:
+        appointment.reminder_due_at = reminder_due_at(
+            reminder_delay_minutes(appointment.organization_id), day, start_time
+        )
+
+
+def reschedule_reminders(organization_id, batch_size=2000):
+    """
+    Recompute pending reminders of upcoming appointments, e.g. after the reminder delay changed
+
+    Returns:
+        int: number of appointments updated
+    """
+    delay = load_reminder_delay(organization_id)
+    appointments = Appointment.objects.filter(
+        organization_id=organization_id,
+        status__in=ACTIVE_STATUSES,
+        reminder_sent_at__isnull=True,
+        date__gte=timezone.localdate(),
+    ).only('id', 'date', 'time').order_by('id')
+
+    updated = 0
+    batch = []
+    for appointment in appointments.iterator(chunk_size=batch_size):
+        appointment.reminder_due_at = reminder_due_at(delay, appointment.date, appointment.time)
+        batch.append(appointment)
+        if len(batch) >= batch_size:
+            updated += Appointment.objects.bulk_update(batch, ['reminder_due_at'])
+            batch = []
+    if batch:
+        updated += Appointment.objects.bulk_update(batch, ['reminder_due_at'])
+    logger.info(f"Rescheduled {updated} reminders for organization {organization_id} ({delay} minutes before)")
+    return updated
+
+
+def due_reminders(now):
+    """Appointments whose reminder is due, oldest first; served by the partial reminder index."""
+    return Appointment.objects.filter(
+        status__in=ACTIVE_STATUSES, reminder_due_at__isnull=False, reminder_due_at__lte=now,
+    ).order_by('reminder_due_at')
+
+
+def _claim(limit, now):
+    """Lock up to `limit` due appointments for the current transaction; other schedulers skip them."""
+    ids = list(due_reminders(now).select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+    return list(Appointment.objects.filter(id__in=ids).select_related('customer').only(
+        'id', 'organization_id', 'date', 'time', 'service_id', 'location_id',
+        'customer__email', 'customer__first_name', 'customer__last_name', 'customer__phone',
+    ).order_by('id'))
+
+
+def _send_emails(emails):
+    """Hand (appointment id, EmailMessage) pairs to the email backend in one call; returns the ids that failed."""
+    try:
+        # Savepoint: a failed outbox insert must not break the batch's transaction
+        with transaction.atomic():
+            get_connection().send_messages([email for _, email in emails])
+    except Exception as e:
+        logger.error(f"Could not send {len(emails)} reminder emails: {e}")
+        return [appointment_id for appointment_id, _ in emails]
+    return []
+
+
+def _send_batch(limit, now, channels, retry_seconds):
+    """Claim, queue and mark one batch; returns (claimed, skipped ids, failed ids)."""
+    batch = _claim(limit, now)
+    bundles = {}
+    emails = []
+    sms = []
+    skipped = []
+    for appointment in batch:
+        if timezone.make_aware(datetime.combine(appointment.date, appointment.time)) <= now:
+            skipped.append(appointment.id)
+            continue
+        if appointment.organization_id not in bundles:
+            bundles[appointment.organization_id] = organization_bundle(appointment.organization_id)
+        bundle = bundles[appointment.organization_id]
+        if 'email' in channels and appointment.customer.email:
+            emails.append((appointment.id, EmailMessage(
+                subject=render_bundle_message(bundle, 'reminder_email_subject', appointment),
+                body=render_bundle_message(bundle, 'reminder_email_content', appointment),
+                to=[appointment.customer.email],
+            )))
+        if 'sms' in channels and appointment.customer.phone:
+            sms.append({
+                'organization_id': appointment.organization_id,
+                'appointment': appointment,
+                'notification_type': 'reminder',
+                'to_number': appointment.customer.phone,
+                'body': render_bundle_message(bundle, 'reminder_sms', appointment),
+            })
+
+    enqueue_sms_batch(sms)
+    failed = _send_emails(emails) if emails else []
+    # A reminder that went out by SMS is not retried for its email alone
+    queued_sms = {message['appointment'].id for message in sms}
+    failed = [appointment_id for appointment_id in failed if appointment_id not in queued_sms]
+
+    handled = {appointment.id for appointment in batch} - set(skipped) - set(failed)
+    Appointment.objects.filter(id__in=handled).update(reminder_due_at=None, reminder_sent_at=now)
+    if skipped:
+        Appointment.objects.filter(id__in=skipped).update(reminder_due_at=None)
+    if failed:
+        Appointment.objects.filter(id__in=failed).update(reminder_due_at=now + timedelta(seconds=retry_seconds))
+    return len(batch), skipped, failed
+
+
+def send_due_reminders(limit=None, now=None):
+    """
+    Send every reminder that is due, in batches
+
+    Each batch is claimed, queued in the outboxes and marked sent in one
+    transaction, so a crash part way leaves its reminders due for the next tick.
+
+    Returns:
+        dict: counts of 'claimed', 'sent', 'skipped' (already started) and 'failed' appointments
+    """
+    limit = limit or getattr(settings, 'REMINDER_BATCH_SIZE', BATCH_SIZE)
+    channels = getattr(settings, 'REMINDER_CHANNELS', ['email'])
+    retry_seconds = getattr(settings, 'REMINDER_RETRY_SECONDS', 10 * 60)
+    totals = {'claimed': 0, 'sent': 0, 'skipped': 0, 'failed': 0}
+    while True:
+        with transaction.atomic():
+            claimed, skipped, failed = _send_batch(limit, now or timezone.now(), channels, retry_seconds)
+        totals['claimed'] += claimed
+        totals['skipped'] += len(skipped)
+        totals['failed'] += len(failed)
+        totals['sent'] += claimed - len(skipped) - len(failed)
+        if claimed < limit:
+            return totals
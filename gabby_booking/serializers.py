@@ -1,4 +1,5 @@
 import logging
+from django.db import transaction
 from rest_framework import serializers
 from .models import (
     RegistrationStep, Organization, Option, Service, BusinessHours, ExceptionalClosing,
@@ -7,6 +8,7 @@ from .models import (
     ServiceAddOnConfig, TeamMemberConfig, TeamMember, BookingRule, CommunicationTemplate,
     Customer, Appointment
 )
+from .booking import assign_provider, auto_assign_strategy, reserve_slot
 
 logger = logging.getLogger(__name__)
 
@@ -372,13 +374,22 @@ class BookingPortalProviderSerializer(serializers.ModelSerializer):
 
 
 class AppointmentSerializer(serializers.ModelSerializer):
-    """Full Appointment serializer with nested relationships"""
+    """
+    Full Appointment serializer with nested relationships
+
+    Pass fields=[...] to render only some fields (sparse fieldsets), and load
+    the queryset with setup_eager_loading(queryset, fields) so only the
+    relations those fields read are fetched.
+    """
     customer = CustomerSerializer(read_only=True)
     service = BookingPortalServiceSerializer(read_only=True)
     options = OptionSerializer(many=True, read_only=True)
     provider = BookingPortalProviderSerializer(read_only=True)
     location = BookingPortalLocationSerializer(read_only=True)
 
+    SELECT_RELATED = ('customer', 'service', 'provider', 'location')
+    PREFETCH_RELATED = {'options': 'options__services', 'service': 'service__options__services'}
+
     class Meta:
         model = Appointment
         fields = ['id', 'organization', 'customer', 'location', 'service', 'options', 'provider',
@@ -386,6 +397,64 @@ class AppointmentSerializer(serializers.ModelSerializer):
                   'created_at', 'updated_at', 'confirmed_at', 'cancelled_at']
         read_only_fields = ['id', 'created_at', 'updated_at', 'confirmed_at', 'cancelled_at']
 
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None):
+        """Load everything the nested representation (or just `fields`) reads, in a fixed number of queries."""
+        return queryset.select_related(
+            *[name for name in cls.SELECT_RELATED if not fields or name in fields]
+        ).prefetch_related(
+            *[lookup for name, lookup in cls.PREFETCH_RELATED.items() if not fields or name in fields]
+        )
+
+
+class DashboardAppointmentSerializer(serializers.ModelSerializer):
+    """
+    Compact appointment row for dashboard lists
+
+    Load the queryset with setup_eager_loading(): one joined query that reads
+    only the columns rendered here.
+    """
+    customer = serializers.SerializerMethodField()
+    service = serializers.SerializerMethodField()
+    provider = serializers.SerializerMethodField()
+    location = serializers.SerializerMethodField()
+
+    ONLY_FIELDS = (
+        'id', 'date', 'time', 'duration', 'total_price', 'status', 'note',
+        'customer__id', 'customer__email', 'customer__first_name', 'customer__last_name', 'customer__phone',
+        'service__id', 'service__name', 'provider__id', 'provider__name', 'location__id', 'location__name',
+    )
+
+    class Meta:
+        model = Appointment
+        fields = ['id', 'customer', 'service', 'provider', 'location',
+                  'date', 'time', 'duration', 'total_price', 'status', 'note']
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        return queryset.select_related('customer', 'service', 'provider', 'location').only(*cls.ONLY_FIELDS)
+
+    def get_customer(self, obj):
+        customer = obj.customer
+        return {'id': customer.id, 'email': customer.email, 'firstName': customer.first_name,
+                'lastName': customer.last_name, 'phone': customer.phone}
+
+    def get_service(self, obj):
+        return {'id': obj.service.id, 'name': obj.service.name}
+
+    def get_provider(self, obj):
+        return {'id': obj.provider.id, 'name': obj.provider.name} if obj.provider else None
+
+    def get_location(self, obj):
+        return {'id': obj.location.id, 'name': obj.location.name} if obj.location else None
+
 
 class BookingCreateSerializer(serializers.Serializer):
     """Serializer for creating appointments from booking portal - matches frontend BookingData"""
@@ -436,67 +505,84 @@ class BookingCreateSerializer(serializers.Serializer):
         if data['date'] < timezone.now().date():
             raise serializers.ValidationError({"date": "Appointment date cannot be in the past."})
 
+        # Look up the service and options once, scoped to the organization; create() reuses them
+        data['service'] = Service.objects.filter(id=data['service_id'], organization_id=data['organization_id']).first()
+        if data['service'] is None:
+            raise serializers.ValidationError({"service_id": "Service not found for this organization."})
+        option_ids = set(data.get('option_ids') or [])
+        data['options'] = list(Option.objects.filter(
+            id__in=option_ids, organization_id=data['organization_id']
+        )) if option_ids else []
+        if len(data['options']) != len(option_ids):
+            raise serializers.ValidationError({"option_ids": "Unknown option for this organization."})
+
         return data
 
     def create(self, validated_data):
-        from decimal import Decimal
-
-        # Extract organization and related data
-        organization_id = validated_data.pop('organization_id')
-        service_id = validated_data.pop('service_id')
-        option_ids = validated_data.pop('option_ids', [])
-        location_id = validated_data.pop('location_id', None)
-        provider_id = validated_data.pop('provider_id', None)
-
-        # Extract customer data
-        email = validated_data.pop('email')
-        first_name = validated_data.pop('firstName', '')
-        last_name = validated_data.pop('lastName', '')
-        phone = validated_data.pop('phone', '')
-
-        # Get or create customer
-        organization = Organization.objects.get(id=organization_id)
-        customer, created = Customer.objects.get_or_create(
-            organization=organization,
-            email=email,
-            defaults={
-                'first_name': first_name,
-                'last_name': last_name,
-                'phone': phone
-            }
-        )
-
-        # Update customer info if already exists
-        if not created:
-            customer.first_name = first_name or customer.first_name
-            customer.last_name = last_name or customer.last_name
-            customer.phone = phone or customer.phone
-            customer.save()
-
-        # Get service and calculate duration and price
-        service = Service.objects.get(id=service_id)
-        options = Option.objects.filter(id__in=option_ids)
+        """Customer upsert, slot lock and appointment insert in one transaction."""
+        organization_id = validated_data['organization_id']
+        service = validated_data['service']
+        options = validated_data['options']
+        location_id = validated_data.get('location_id')
+        provider_id = validated_data.get('provider_id')
 
         total_duration = service.duration + sum(opt.duration for opt in options)
         total_price = service.price + sum(opt.price for opt in options)
-
-        # Create appointment
-        appointment = Appointment.objects.create(
-            organization=organization,
-            customer=customer,
-            service=service,
-            location_id=location_id,
-            provider_id=provider_id,
-            date=validated_data['date'],
-            time=validated_data['time'],
-            duration=total_duration,
-            total_price=total_price,
-            note=validated_data.get('note', ''),
-            status='pending'
-        )
-
-        # Add options
-        if options:
-            appointment.options.set(options)
+        strategy = None if provider_id else auto_assign_strategy(organization_id)
+
+        with transaction.atomic():
+            # Get or create customer; only write back fields that actually changed
+            customer, created = Customer.objects.get_or_create(
+                organization_id=organization_id,
+                email=validated_data['email'],
+                defaults={
+                    'first_name': validated_data.get('firstName', ''),
+                    'last_name': validated_data.get('lastName', ''),
+                    'phone': validated_data.get('phone', '')
+                }
+            )
+            if not created:
+                changed = []
+                for field, key in (('first_name', 'firstName'), ('last_name', 'lastName'), ('phone', 'phone')):
+                    value = validated_data.get(key)
+                    if value and value != getattr(customer, field):
+                        setattr(customer, field, value)
+                        changed.append(field)
+                if changed:
+                    customer.save(update_fields=changed + ['updated_at'])
+
+            # Lock the provider-day and re-check the slot; raises SlotUnavailable
+            if strategy:
+                provider_id = assign_provider(
+                    organization_id, validated_data['date'], validated_data['time'], total_duration,
+                    location_id=location_id, strategy=strategy
+                )
+            else:
+                reserve_slot(
+                    organization_id, validated_data['date'], validated_data['time'], total_duration,
+                    location_id=location_id, provider_id=provider_id
+                )
+
+            # Create appointment
+            appointment = Appointment.objects.create(
+                organization_id=organization_id,
+                customer=customer,
+                service=service,
+                location_id=location_id,
+                provider_id=provider_id,
+                date=validated_data['date'],
+                time=validated_data['time'],
+                duration=total_duration,
+                total_price=total_price,
+                note=validated_data.get('note', ''),
+                status='pending'
+            )
+
+            # Add options in one insert (the appointment is new, so nothing to diff against)
+            if options:
+                Appointment.options.through.objects.bulk_create([
+                    Appointment.options.through(appointment_id=appointment.id, option_id=option.id)
+                    for option in options
+                ])
 
         return appointment
\ No newline at end of file
@@ -0,0 +1,130 @@
+"""
+Invalidate cached availability when its inputs change
+
+The compiled message templates (message_templates.py) are cached under their
+own message generation, bumped by organization details, templates, the
+assistant, the main address and the service and location names they show, so
+editing those keeps warmed availability. The booking portal payload
+(portal_cache.py) embeds both generations.
+
+Appointment saves also keep their reminder due time current (reminders.py).
+"""
+from datetime import date, time, timedelta
+
+from django.db.models.signals import m2m_changed, post_init, post_save, post_delete, pre_save
+
+from .availability_cache import invalidate_messages, invalidate_organization, invalidate_provider_days
+from .background import run_in_background
+from .models import (
+    Appointment, Assistant, BookingRule, BusinessHours, CommunicationTemplate, ExceptionalClosing, Location, Option,
+    Organization, Service, ServiceLocation, TeamMember
+)
+from .reminders import reschedule_reminders, schedule_reminder
+
+# Changes to these affect every provider-day of the organization
+AVAILABILITY_INPUT_MODELS = [BusinessHours, ExceptionalClosing, BookingRule, TeamMember, Service, Option]
+# Read by the message templates; Service names appear in both
+MESSAGE_INPUT_MODELS = [CommunicationTemplate, Assistant, ServiceLocation, Service]
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def _provider_days(provider_id, day, start_time, duration):
+    days = [(provider_id, day)]
+    if start_time is not None and start_time.hour * 60 + start_time.minute + (duration or 0) > MINUTES_PER_DAY:
+        days.append((provider_id, day + timedelta(days=1)))
+    return days
+
+
+def _appointment_state(instance):
+    """Scheduling fields of an appointment, or None if any of them is deferred."""
+    fields = ('provider_id', 'date', 'time', 'duration', 'organization_id')
+    if any(field not in instance.__dict__ for field in fields):
+        return None
+    provider_id, day, start_time, duration, organization_id = (instance.__dict__[field] for field in fields)
+    # Views may assign raw request strings before saving
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    if isinstance(start_time, str):
+        start_time = time.fromisoformat(start_time)
+    return provider_id, day, start_time, duration, organization_id
+
+
+def appointment_loaded(sender, instance, **kwargs):
+    instance._availability_origin = _appointment_state(instance) if instance.pk else None
+
+
+def appointment_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Partial saves (update_fields) and fixtures leave the reminder alone
+    if raw or update_fields is not None or 'status' not in instance.__dict__:
+        return
+    state = _appointment_state(instance)
+    if state is None:
+        return
+    origin = getattr(instance, '_availability_origin', None)
+    moved = origin is None or origin[1:3] != state[1:3]
+    schedule_reminder(instance, state[1], state[2], moved)
+
+
+def appointment_changed(sender, instance, **kwargs):
+    states = [getattr(instance, '_availability_origin', None), _appointment_state(instance)]
+    if not all(states[1:]):
+        # Deferred fields: we can't tell which days were touched
+        invalidate_organization(instance.organization_id)
+    else:
+        provider_days = []
+        for provider_id, day, start_time, duration, organization_id in filter(None, states):
+            provider_days.extend(_provider_days(provider_id, day, start_time, duration))
+        invalidate_provider_days(instance.organization_id, provider_days)
+    instance._availability_origin = _appointment_state(instance)
+
+
+def availability_input_changed(sender, instance, **kwargs):
+    invalidate_organization(instance.organization_id)
+
+
+def message_input_changed(sender, instance, **kwargs):
+    invalidate_messages(instance.organization_id)
+
+
+def booking_rule_changed(sender, instance, **kwargs):
+    # The reminder delay may have changed; runs after the generation bump above
+    run_in_background(reschedule_reminders, instance.organization_id)
+
+
+def location_changed(sender, instance, **kwargs):
+    try:
+        organization_id = instance.service_location.organization_id
+    except ServiceLocation.DoesNotExist:
+        # Cascade from a deleted ServiceLocation; its organization is going away too
+        return
+    # Hours and closings are per location; messages show its address
+    invalidate_organization(organization_id)
+    invalidate_messages(organization_id)
+
+
+def organization_changed(sender, instance, **kwargs):
+    invalidate_messages(instance.id)
+
+
+def option_services_changed(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_organization(instance.organization_id)
+
+
+def connect_signals():
+    post_init.connect(appointment_loaded, sender=Appointment, dispatch_uid='availability_appointment_loaded')
+    post_save.connect(appointment_changed, sender=Appointment, dispatch_uid='availability_appointment_saved')
+    post_delete.connect(appointment_changed, sender=Appointment, dispatch_uid='availability_appointment_deleted')
+    for model in AVAILABILITY_INPUT_MODELS:
+        post_save.connect(availability_input_changed, sender=model, dispatch_uid=f'availability_{model.__name__}_saved')
+        post_delete.connect(availability_input_changed, sender=model, dispatch_uid=f'availability_{model.__name__}_deleted')
+    for model in MESSAGE_INPUT_MODELS:
+        post_save.connect(message_input_changed, sender=model, dispatch_uid=f'messages_{model.__name__}_saved')
+        post_delete.connect(message_input_changed, sender=model, dispatch_uid=f'messages_{model.__name__}_deleted')
+    pre_save.connect(appointment_saving, sender=Appointment, dispatch_uid='reminder_appointment_saving')
+    post_save.connect(booking_rule_changed, sender=BookingRule, dispatch_uid='reminder_booking_rule_saved')
+    post_save.connect(location_changed, sender=Location, dispatch_uid='availability_location_saved')
+    post_delete.connect(location_changed, sender=Location, dispatch_uid='availability_location_deleted')
+    post_save.connect(organization_changed, sender=Organization, dispatch_uid='portal_organization_saved')
+    m2m_changed.connect(option_services_changed, sender=Option.services.through, dispatch_uid='portal_option_services_changed')
@@ -0,0 +1,314 @@
+"""
+Transactional SMS outbox
+
+Booking notifications are not sent from the request. enqueue_sms() writes an
+OutboundSMS row inside the caller's transaction and, once it commits, wakes a
+background drain (background.py); the HTTP response never waits on Twilio.
+Wakes are coalesced so at most one drain per process uses the shared pool,
+and that drain never sleeps on the rate limit: messages over it are left for
+the send_sms_outbox worker.
+
+deliver_due() drains the outbox:
+  - due rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED and leased
+    (status 'sending', next_attempt_at = lease expiry), so concurrent workers
+    never send the same row and a crashed worker's rows are retried
+  - each sender number is limited to SMS_RATE_PER_SECOND messages per second
+    across processes (a per-second counter in the cache)
+  - failures are retried after SMS_RETRY_BASE_SECONDS * 2^(attempt - 1), capped
+    at SMS_RETRY_MAX_SECONDS; after SMS_MAX_ATTEMPTS, or on a permanent error
+    (Twilio 4xx such as an invalid number), the row is dead-lettered
+
+Retries that come due later, and messages held back by the rate limit, are
+sent by `python manage.py send_sms_outbox --loop`, a worker process that
+waits for send slots instead of giving up.
+
+SMS_BACKEND selects the transport: 'twilio' (default) or 'fake', a local
+backend for tests and development that records messages instead of sending.
+Twilio reports delivery through the status callback (assistant/status_callbacks.py).
+"""
+import logging
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from sonoria_backend.clients import get_twilio_client
+
+from .background import run_coalesced_in_background
+from .models import OutboundSMS
+
+logger = logging.getLogger(__name__)
+
+TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER')
+
+LEASE_SECONDS = 5 * 60
+BATCH_SIZE = 50
+
+
+def status_callback_url(url_name):
+    """Public URL Twilio should post status updates to, or None without TWILIO_CALLBACK_BASE_URL."""
+    base_url = getattr(settings, 'TWILIO_CALLBACK_BASE_URL', '')
+    return f"{base_url.rstrip('/')}{reverse(url_name)}" if base_url else None
+
+
+class SMSDeliveryError(Exception):
+    """A send failed; permanent errors are not retried."""
+
+    def __init__(self, message, permanent=False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+class TwilioSMSBackend:
+
+    def send(self, to_number, from_number, body):
+        """Returns the message SID; raises SMSDeliveryError."""
+        twilio_client = get_twilio_client()
+        if not twilio_client:
+            raise SMSDeliveryError('Twilio client not configured')
+        extra = {}
+        callback_url = status_callback_url('assistant_sms_status')
+        if callback_url:
+            # Delivery receipts land in OutboundSMS.delivery_status
+            extra['status_callback'] = callback_url
+        try:
+            message = twilio_client.messages.create(body=body, from_=from_number, to=to_number, **extra)
+        except Exception as e:
+            # TwilioRestException carries the HTTP status; 4xx other than 429 will fail again
+            http_status = getattr(e, 'status', None)
+            permanent = isinstance(http_status, int) and 400 <= http_status < 500 and http_status != 429
+            raise SMSDeliveryError(str(e), permanent=permanent)
+        return message.sid
+
+
+class FakeSMSBackend:
+    """Records sent messages; queue exceptions in `failures` to make the next sends fail."""
+    sent = []
+    failures = []
+
+    def send(self, to_number, from_number, body):
+        if FakeSMSBackend.failures:
+            raise FakeSMSBackend.failures.pop(0)
+        FakeSMSBackend.sent.append({'to': to_number, 'from': from_number, 'body': body, 'at': time.time()})
+        return f"SM{len(FakeSMSBackend.sent):032d}"
+
+
+BACKENDS = {
+    'twilio': TwilioSMSBackend,
+    'fake': FakeSMSBackend,
+}
+
+
+def get_sms_backend():
+    return BACKENDS[getattr(settings, 'SMS_BACKEND', 'twilio')]()
+
+
+def normalize_phone(phone):
+    """E.164 number from what customers type; 10-digit numbers are assumed US/Canada."""
+    digits = ''.join(filter(str.isdigit, phone or ''))
+    if not digits:
+        return ''
+    if len(digits) == 10:
+        return f'+1{digits}'
+    return f'+{digits}'
+
+
+def enqueue_sms(organization_id, to_number, body, appointment=None, notification_type=''):
+    """
+    Add a message to the outbox in the current transaction
+
+    Returns:
+        OutboundSMS, or None when there is no usable number
+    """
+    to_number = normalize_phone(to_number)
+    if not to_number:
+        logger.warning(f"No customer phone number for organization {organization_id} - skipping SMS")
+        return None
+    message = OutboundSMS.objects.create(
+        organization_id=organization_id,
+        appointment=appointment,
+        notification_type=notification_type,
+        to_number=to_number,
+        from_number=TWILIO_PHONE_NUMBER or '',
+        body=body,
+        next_attempt_at=timezone.now(),
+    )
+    run_coalesced_in_background(deliver_due_in_process)
+    return message
+
+
+def _dedup_key(organization_id, to_number, kind):
+    return f"sms-dedup:{organization_id}:{normalize_phone(to_number) or to_number}:{kind}"
+
+
+def claim_sms_send(organization_id, to_number, kind):
+    """
+    Whether this is the first `kind` message to the number within SMS_DEDUP_WINDOW_SECONDS
+
+    The voice assistant may call the same tool twice (it is told to retry failed
+    tools); callers skip the send when this returns False.
+    """
+    window = getattr(settings, 'SMS_DEDUP_WINDOW_SECONDS', 120)
+    if not window:
+        return True
+    return cache.add(_dedup_key(organization_id, to_number, kind), 1, window)
+
+
+def release_sms_send(organization_id, to_number, kind):
+    """Forget a claim whose send failed, so a retry goes out."""
+    cache.delete(_dedup_key(organization_id, to_number, kind))
+
+
+def record_sent_sms(organization_id, to_number, from_number, body, sid, notification_type=''):
+    """Log a message sent outside the outbox (e.g. during a call) so its delivery status is recorded too."""
+    now = timezone.now()
+    return OutboundSMS.objects.create(
+        organization_id=organization_id,
+        notification_type=notification_type,
+        to_number=normalize_phone(to_number) or to_number,
+        from_number=from_number or '',
+        body=body,
+        status='sent',
+        attempts=1,
+        next_attempt_at=now,
+        sent_at=now,
+        sid=sid,
+    )
+
+
+def enqueue_sms_batch(messages):
+    """
+    Add many messages to the outbox with one INSERT and wake a single drain
+
+    Args:
+        messages: dicts of enqueue_sms arguments (organization_id, to_number, body, appointment, notification_type)
+
+    Returns:
+        int: number of messages queued
+    """
+    now = timezone.now()
+    rows = []
+    for message in messages:
+        to_number = normalize_phone(message['to_number'])
+        if not to_number:
+            continue
+        rows.append(OutboundSMS(
+            organization_id=message['organization_id'],
+            appointment=message.get('appointment'),
+            notification_type=message.get('notification_type', ''),
+            to_number=to_number,
+            from_number=TWILIO_PHONE_NUMBER or '',
+            body=message['body'],
+            next_attempt_at=now,
+        ))
+    if rows:
+        OutboundSMS.objects.bulk_create(rows)
+        run_coalesced_in_background(deliver_due_in_process)
+    return len(rows)
+
+
+def retry_delay(attempts):
+    base = getattr(settings, 'SMS_RETRY_BASE_SECONDS', 30)
+    return min(base * 2 ** (attempts - 1), getattr(settings, 'SMS_RETRY_MAX_SECONDS', 60 * 60))
+
+
+def _take_send_slot(from_number, wait=True):
+    """
+    Count a send against the sender number's SMS_RATE_PER_SECOND for the current second
+
+    With wait, block until a slot frees up; without, return False when the number is at its limit.
+    """
+    rate = getattr(settings, 'SMS_RATE_PER_SECOND', 1)
+    while True:
+        now = time.time()
+        key = f"sms-rate:{from_number}:{int(now)}"
+        cache.add(key, 0, 10)
+        try:
+            if cache.incr(key) <= rate:
+                return True
+        except ValueError:
+            # Evicted between add and incr; let this one through
+            return True
+        if not wait:
+            return False
+        time.sleep(1 - (now % 1))
+
+
+def _claim(limit, now):
+    with transaction.atomic():
+        ids = list(OutboundSMS.objects.select_for_update(skip_locked=True).filter(
+            status__in=['pending', 'sending'], next_attempt_at__lte=now,
+        ).order_by('next_attempt_at').values_list('id', flat=True)[:limit])
+        OutboundSMS.objects.filter(id__in=ids).update(
+            status='sending', next_attempt_at=now + timedelta(seconds=LEASE_SECONDS)
+        )
+    return list(OutboundSMS.objects.filter(id__in=ids).order_by('id'))
+
+
+def deliver(message, backend=None, now=None, wait=True):
+    """
+    Send one claimed message and record the outcome
+
+    Returns:
+        bool: False when wait is off and the sender number is at its rate limit (nothing was sent)
+    """
+    backend = backend or get_sms_backend()
+    now = now or timezone.now()
+    if not _take_send_slot(message.from_number, wait):
+        return False
+    message.attempts += 1
+    try:
+        message.sid = backend.send(message.to_number, message.from_number, message.body)
+    except SMSDeliveryError as e:
+        message.last_error = str(e)[:1000]
+        if e.permanent or message.attempts >= getattr(settings, 'SMS_MAX_ATTEMPTS', 6):
+            message.status = 'dead'
+            logger.error(f"SMS {message.id} dead-lettered after {message.attempts} attempts: {e}")
+        else:
+            message.status = 'pending'
+            message.next_attempt_at = now + timedelta(seconds=retry_delay(message.attempts))
+            logger.warning(f"SMS {message.id} attempt {message.attempts} failed, retrying at {message.next_attempt_at}: {e}")
+    else:
+        message.status = 'sent'
+        message.sent_at = timezone.now()
+        logger.info(f"SMS {message.id} sent. SID: {message.sid}")
+    message.save(update_fields=['status', 'attempts', 'next_attempt_at', 'last_error', 'sid', 'sent_at'])
+    return True
+
+
+def deliver_due(limit=None, now=None, wait=True):
+    """
+    Send every message that is due, in batches
+
+    Args:
+        wait: sleep for rate limit slots; without, stop at the limit and release the rest of the batch
+
+    Returns:
+        int: number of messages attempted
+    """
+    backend = get_sms_backend()
+    limit = limit or BATCH_SIZE
+    attempted = 0
+    while True:
+        batch_now = now or timezone.now()
+        batch = _claim(limit, batch_now)
+        for position, message in enumerate(batch):
+            if not deliver(message, backend, batch_now, wait):
+                # Unlease what is left so the worker sends it as soon as the rate allows
+                OutboundSMS.objects.filter(id__in=[held.id for held in batch[position:]], status='sending').update(
+                    status='pending', next_attempt_at=batch_now
+                )
+                return attempted + position
+        attempted += len(batch)
+        if len(batch) < limit:
+            return attempted
+
+
+def deliver_due_in_process():
+    """Drain run in the web process's shared pool (background.py): never sleeps on the rate limit."""
+    return deliver_due(wait=False)
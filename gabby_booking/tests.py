@@ -1,3 +1,1064 @@
-from django.test import TestCase
+import json
+import statistics
+import tempfile
+import threading
+import time as clock
+import unittest
+from datetime import datetime, time, timedelta
+from io import StringIO
 
-# Create your tests here.
+import smtplib
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from users.models import User
+from .availability import parse_duration_minutes, parse_slot_time
+from .background import run_coalesced_in_background
+from .booking import assign_provider
+from .email_outbox import deliver_due_emails, pool
+from .importer import BulkImporter
+from .llm import BACKENDS, FakePromptBackend
+from .models import (
+    Appointment, Assistant, BookingRule, BusinessHours, CommunicationTemplate, Customer, ExceptionalClosing,
+    IdempotencyKey, Option, Organization, OrganizationPrompt, OutboundEmail, OutboundSMS, PromptGenerationJob, Service,
+    TeamMember, TeamMemberConfig
+)
+from .prompt_jobs import requeue_stale_prompt_jobs, run_prompt_job
+from .reminders import due_reminders, send_due_reminders
+from .sms_outbox import FakeSMSBackend, SMSDeliveryError, claim_sms_send, deliver_due, enqueue_sms, release_sms_send
+
+
+@override_settings(PROMPT_LLM_BACKEND='fake', BACKGROUND_JOBS_EAGER=True)
+class PromptGenerationJobTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        FakePromptBackend.calls = 0
+
+    def create_organization(self, name='Serenity Spa', description='Massages and facials'):
+        payload = {'owner': self.owner.id, 'name': name, 'business_line': 'Spa', 'description': description}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/organizations/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def test_create_returns_job_that_can_be_polled(self):
+        body = self.create_organization()
+        self.assertEqual(body['prompt_job']['status'], 'pending')
+
+        response = self.client.get(f"/api/prompt-jobs/{body['prompt_job']['id']}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'succeeded')
+        self.assertIn('Serenity Spa', response.json()['prompt'])
+        self.assertEqual(FakePromptBackend.calls, 1)
+        self.assertIn('Serenity Spa', OrganizationPrompt.objects.get(organization_id=body['data']['id']).generated_prompt)
+
+    def test_duplicate_submission_reuses_result(self):
+        self.create_organization()
+        body = self.create_organization()
+
+        self.assertEqual(body['prompt_job']['status'], 'succeeded')
+        self.assertEqual(FakePromptBackend.calls, 1)
+        response = self.client.get(f"/api/prompt-jobs/{body['prompt_job']['id']}/")
+        self.assertTrue(response.json()['cached'])
+
+        self.create_organization(description='Yoga classes')
+        self.assertEqual(FakePromptBackend.calls, 2)
+
+    def test_stale_jobs_are_requeued(self):
+        organization = Organization.objects.create(owner=self.owner, name='Serenity Spa', business_line='Spa')
+        stale = timezone.now() - timedelta(hours=1)
+        lost = PromptGenerationJob.objects.create(
+            organization=organization, input_hash='a' * 64, status='running', name='Serenity Spa', description='Massages'
+        )
+        fresh = PromptGenerationJob.objects.create(organization=organization, input_hash='b' * 64, status='running')
+        PromptGenerationJob.objects.filter(id=lost.id).update(updated_at=stale)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(requeue_stale_prompt_jobs(timeout=600), 1)
+
+        lost.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual(lost.status, 'succeeded')
+        self.assertIn('Serenity Spa', lost.result)
+        self.assertEqual(fresh.status, 'running')
+        self.assertEqual(FakePromptBackend.calls, 1)
+        self.assertEqual(requeue_stale_prompt_jobs(timeout=600), 0)
+
+    def test_job_that_waited_in_the_queue_is_not_requeued_while_running(self):
+        organization = Organization.objects.create(owner=self.owner, name='Serenity Spa', business_line='Spa')
+        job = PromptGenerationJob.objects.create(organization=organization, input_hash='c' * 64, name='Serenity Spa')
+        PromptGenerationJob.objects.filter(id=job.id).update(updated_at=timezone.now() - timedelta(hours=1))
+        requeued = []
+
+        class SweepingBackend(FakePromptBackend):
+            def generate(self, meta_prompt):
+                # Another process sweeps while the model call is in flight
+                requeued.append(requeue_stale_prompt_jobs(timeout=600))
+                return super().generate(meta_prompt)
+
+        BACKENDS['sweeping'] = SweepingBackend
+        try:
+            with self.settings(PROMPT_LLM_BACKEND='sweeping'), self.captureOnCommitCallbacks(execute=True):
+                run_prompt_job(job.id, 'Serenity Spa', 'Massages')
+        finally:
+            del BACKENDS['sweeping']
+
+        self.assertEqual(requeued, [0])
+        self.assertEqual(FakePromptBackend.calls, 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'succeeded')
+
+
+@override_settings(SMS_BACKEND='fake', BACKGROUND_JOBS_EAGER=True)
+class AvailabilityTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        self.organization = Organization.objects.create(owner=owner, name='Serenity Spa')
+        self.service = Service.objects.create(organization=self.organization, name='Massage', price=80, duration=60, detail='')
+        self.customer = Customer.objects.create(organization=self.organization, email='c@example.com')
+        self.day = timezone.localdate() + timedelta(days=7)
+        BusinessHours.objects.create(
+            organization=self.organization, day_of_week=self.day.strftime('%A'), hours_type='custom',
+            open_time=time(9, 0), close_time=time(17, 0), break_start_time=time(12, 0), break_end_time=time(13, 0)
+        )
+
+    def get_slots(self, **params):
+        params = {'organization_id': self.organization.id, 'date': self.day.isoformat(), 'service_id': self.service.id, **params}
+        response = self.client.get('/api/booking/time-slots/', params)
+        self.assertEqual(response.status_code, 200)
+        return {slot['time']: slot['available'] for slot in response.json()['time_slots']}
+
+    def book(self, start, duration=60, day=None, provider=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Appointment.objects.create(
+                organization=self.organization, customer=self.customer, service=self.service, provider=provider,
+                date=day or self.day, time=start, duration=duration, total_price=80, status='confirmed'
+            )
+
+    def test_slots_follow_business_hours_and_break(self):
+        slots = self.get_slots()
+        self.assertEqual(min(slots, key=parse_slot_time), '9:00 am')
+        self.assertIn('11:00 am', slots)
+        self.assertNotIn('11:30 am', slots)
+        self.assertNotIn('12:30 pm', slots)
+        self.assertIn('1:00 pm', slots)
+        self.assertNotIn('4:30 pm', slots)
+        self.assertTrue(all(slots.values()))
+
+    def test_unaligned_appointment_blocks_overlapping_slots(self):
+        self.book(time(10, 15), duration=30)
+        slots = self.get_slots()
+        self.assertTrue(slots['9:00 am'])
+        self.assertFalse(slots['9:30 am'])
+        self.assertFalse(slots['10:00 am'])
+        self.assertFalse(slots['10:30 am'])
+        self.assertTrue(slots['11:00 am'])
+
+    def test_gap_and_closing(self):
+        BookingRule.objects.create(organization=self.organization, set_minimum_gap=True, gap_time_value='15 minutes')
+        self.book(time(14, 0))
+        slots = self.get_slots()
+        self.assertFalse(slots['1:00 pm'])
+        self.assertFalse(slots['3:00 pm'])
+        self.assertTrue(slots['3:30 pm'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ExceptionalClosing.objects.create(organization=self.organization, open_date=self.day, close_date=self.day)
+        self.assertEqual(self.get_slots(), {})
+
+    def test_query_count_does_not_grow_with_appointments(self):
+        def count_queries():
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.get_slots(granularity=15)
+            return len(context.captured_queries)
+
+        few = count_queries()
+        for hour in (9, 10, 13, 14, 15):
+            self.book(time(hour, 0), duration=20)
+        self.assertEqual(count_queries(), few)
+
+    def test_parse_duration_minutes(self):
+        self.assertEqual(parse_duration_minutes('15 minutes'), 15)
+        self.assertEqual(parse_duration_minutes('1 hour before'), 60)
+        self.assertEqual(parse_duration_minutes('1h 30m'), 90)
+        self.assertEqual(parse_duration_minutes('No gap'), 0)
+
+    def test_calendar_range(self):
+        self.book(time(9, 0))
+        start = self.day - timedelta(days=3)
+        params = {
+            'organization_id': self.organization.id, 'service_id': self.service.id,
+            'from': start.isoformat(), 'to': (start + timedelta(days=6)).isoformat(),
+        }
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/booking/availability/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(context.captured_queries), 7)
+
+        days = {day['date']: day for day in response.json()['days']}
+        self.assertEqual(len(days), 7)
+        booked_day = days[self.day.isoformat()]
+        self.assertTrue(booked_day['open'])
+        self.assertEqual(booked_day['first_available'], '10:00 am')
+        self.assertNotIn('9:00 am', booked_day['slots'])
+        self.assertEqual(booked_day['slots'], [slot for slot, free in self.get_slots().items() if free])
+        self.assertFalse(days[start.isoformat()]['open'])
+
+        params['to'] = (start + timedelta(days=90)).isoformat()
+        self.assertEqual(self.client.get('/api/booking/availability/', params).status_code, 400)
+
+    def test_repeated_queries_are_served_from_cache(self):
+        first = self.get_slots()
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.get_slots(), first)
+        self.assertEqual(len(context.captured_queries), 0)
+
+        stats = self.client.get('/api/booking/availability/stats/').json()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_appointment_invalidates_only_its_day(self):
+        other_day = self.day + timedelta(days=7)
+        calendar = {'organization_id': self.organization.id, 'service_id': self.service.id,
+                    'from': self.day.isoformat(), 'to': other_day.isoformat()}
+        self.client.get('/api/booking/availability/', calendar)
+
+        self.book(time(9, 0))
+        with CaptureQueriesContext(connection) as context:
+            slots = self.get_slots()
+        self.assertFalse(slots['9:00 am'])
+        self.assertGreater(len(context.captured_queries), 0)
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/api/booking/time-slots/', {
+                'organization_id': self.organization.id, 'date': other_day.isoformat(), 'service_id': self.service.id,
+            })
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_business_hours_change_invalidates_organization(self):
+        self.assertIn('9:00 am', self.get_slots())
+        with self.captureOnCommitCallbacks(execute=True):
+            BusinessHours.objects.filter(organization=self.organization).update(open_time=time(10, 0))
+            BusinessHours.objects.get(organization=self.organization).save()
+        self.assertNotIn('9:00 am', self.get_slots())
+
+    def test_next_available_skips_fully_booked_weeks(self):
+        self.book(time(9, 0), duration=8 * 60)
+        self.book(time(9, 0), duration=8 * 60, day=self.day + timedelta(days=7))
+        params = {'organization_id': self.organization.id, 'service_id': self.service.id,
+                  'after': f'{self.day.isoformat()}T08:00', 'limit': 3}
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/booking/next-available/', params)
+        self.assertEqual(response.status_code, 200)
+        # schedule and organization info, then one fixed set of queries per scan window (7 and 14 days)
+        self.assertLessEqual(len(context.captured_queries), 14)
+        slots = response.json()['slots']
+        week_three = (self.day + timedelta(days=14)).isoformat()
+        self.assertEqual([(slot['date'], slot['time']) for slot in slots],
+                         [(week_three, '9:00 am'), (week_three, '9:30 am'), (week_three, '10:00 am')])
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get('/api/booking/next-available/', params).json()['slots'], slots)
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_next_available_starts_after_given_time(self):
+        params = {'organization_id': self.organization.id, 'service_id': self.service.id,
+                  'after': f'{self.day.isoformat()}T14:10', 'limit': 2}
+        slots = self.client.get('/api/booking/next-available/', params).json()['slots']
+        self.assertEqual([slot['time'] for slot in slots], ['2:30 pm', '3:00 pm'])
+        self.assertEqual(self.client.get('/api/booking/next-available/', {**params, 'limit': 0}).status_code, 400)
+
+    def booking_payload(self, start='10:00 am', **overrides):
+        return {
+            'email': 'new@example.com', 'firstName': 'Ada', 'organization_id': self.organization.id,
+            'service_id': self.service.id, 'date': self.day.isoformat(), 'time': start, **overrides,
+        }
+
+    def test_booking_conflicts_return_409(self):
+        self.book(time(10, 30), duration=30)
+        response = self.client.post('/api/booking/create/', self.booking_payload('10:00 am'), content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        response = self.client.post('/api/booking/create/', self.booking_payload('12:00 pm'), content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/booking/create/', self.booking_payload('11:00 am'), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(self.get_slots()['11:00 am'])
+        self.assertEqual(Appointment.objects.count(), 2)
+
+    def test_reschedule_checks_conflicts_but_ignores_itself(self):
+        appointment = self.book(time(9, 0))
+        self.book(time(14, 0))
+        url = f'/api/booking/appointments/{appointment.id}/reschedule/'
+
+        response = self.client.patch(url, {'date': self.day.isoformat(), 'time': '2:30 pm'}, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        response = self.client.patch(url, {'date': self.day.isoformat(), 'time': '9:30 am'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.time, time(9, 30))
+
+    def test_idempotency_key_replays_the_stored_response(self):
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'retry-1'}
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post('/api/booking/create/', self.booking_payload(), content_type='application/json', **headers)
+        replayed = self.client.post('/api/booking/create/', self.booking_payload(), content_type='application/json', **headers)
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(replayed.status_code, 201)
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+        self.assertEqual(replayed.json(), first.json())
+        self.assertEqual(Appointment.objects.count(), 1)
+
+        other = self.client.post('/api/booking/create/', self.booking_payload('2:00 pm'), content_type='application/json', **headers)
+        self.assertEqual(other.status_code, 422)
+
+        # Failed requests do not burn the key
+        self.client.post('/api/booking/create/', self.booking_payload('10:00 am'), content_type='application/json',
+                         HTTP_IDEMPOTENCY_KEY='retry-2')
+        self.assertFalse(IdempotencyKey.objects.filter(key='retry-2').exists())
+
+    def test_booking_query_count_is_pinned(self):
+        options = [
+            Option.objects.create(organization=self.organization, name=f'Add-on {i}', price=10, duration=15)
+            for i in range(3)
+        ]
+        for option in options:
+            option.services.add(self.service)
+        payload = self.booking_payload(option_ids=[option.id for option in options])
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post('/api/booking/create/', payload, content_type='application/json',
+                                        HTTP_IDEMPOTENCY_KEY='count')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['appointment']['options']), 3)
+        self.assertEqual(response.json()['appointment']['duration'], 105)
+        # Validation (service, options), key claim, customer upsert, slot lock and check, inserts,
+        # the eager-loaded reads for the response and the key update; the notification reads the cache,
+        # the reminder delay is read once and then cached. SAVEPOINT/RELEASE statements are left out:
+        # they depend on the backend and the test transaction, not on the booking path
+        queries = [
+            query for query in context.captured_queries
+            if not query['sql'].upper().startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT'))
+        ]
+        self.assertEqual(len(queries), 22)
+
+    def create_team(self, size, strategy='fewest_minutes'):
+        TeamMemberConfig.objects.create(organization=self.organization, auto_assign_bookings=True, assignment_strategy=strategy)
+        return TeamMember.objects.bulk_create([
+            TeamMember(organization=self.organization, name=f'Member {i}', email=f'm{i}@example.com') for i in range(size)
+        ])
+
+    def test_auto_assign_picks_least_loaded_provider(self):
+        first, second, third = self.create_team(3)
+        other_day = self.day - timedelta(days=1) if self.day.weekday() else self.day + timedelta(days=1)
+        self.book(time(9, 0), provider=first)
+        self.book(time(9, 0), duration=120, day=other_day, provider=second)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/booking/create/', self.booking_payload('2:00 pm'), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Appointment.objects.get(id=response.json()['appointment']['id']).provider_id, third.id)
+
+        # first is busy at 9:00, the others are tied on the day and second has fewer minutes this week
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/booking/create/', self.booking_payload('9:00 am'), content_type='application/json')
+        self.assertEqual(Appointment.objects.get(id=response.json()['appointment']['id']).provider_id, second.id)
+
+    def test_round_robin_prefers_longest_unassigned(self):
+        first, second, third = self.create_team(3, strategy='round_robin')
+        self.book(time(15, 0), provider=third)
+        self.book(time(16, 0), provider=first)
+        self.book(time(14, 0), provider=second)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(assign_provider(self.organization.id, self.day, time(9, 0), 60, strategy='round_robin'), third.id)
+
+    def test_assignment_cost_does_not_grow_with_team_size(self):
+        def measure(size):
+            with self.captureOnCommitCallbacks(execute=True):
+                Appointment.objects.all().delete()
+                TeamMemberConfig.objects.all().delete()
+                TeamMember.objects.all().delete()
+            members = self.create_team(size)
+            for member in members[:-1]:
+                self.book(time(9, 0), provider=member)
+            with CaptureQueriesContext(connection) as context, self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(assign_provider(self.organization.id, self.day, time(9, 0), 60), members[-1].id)
+            timings = []
+            for _ in range(20):
+                started = clock.perf_counter()
+                assign_provider(self.organization.id, self.day, time(9, 0), 60)
+                timings.append(clock.perf_counter() - started)
+            return len(context.captured_queries), statistics.median(timings)
+
+        queries, _ = measure(5)
+        large_queries, large_seconds = measure(50)
+        self.assertEqual(large_queries, queries)
+        # About 15 ms on SQLite; the bound leaves room for slow CI machines
+        self.assertLess(large_seconds, 0.1)
+
+    def test_portal_payload_is_cached_and_revalidated(self):
+        url = f'/api/booking/organization/{self.organization.id}/'
+        for i in range(3):
+            option = Option.objects.create(organization=self.organization, name=f'Add-on {i}', price=10, duration=15)
+            option.services.add(self.service)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['services'][0]['options']), 3)
+        built = len(context.captured_queries)
+        self.assertLessEqual(built, 6)
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(url).json(), response.json())
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(since.status_code, 304)
+
+        # Saving a service or linking an option invalidates the payload
+        with self.captureOnCommitCallbacks(execute=True):
+            Service.objects.filter(id=self.service.id).first().save()
+            Option.objects.create(organization=self.organization, name='Late', price=5, duration=5).services.add(self.service)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()['services'][0]['options']), 4)
+
+        self.assertEqual(self.client.get('/api/booking/organization/999999/').status_code, 404)
+
+    def test_organization_and_template_edits_keep_warmed_availability(self):
+        from .availability_cache import message_generation, organization_generation
+        from .message_templates import organization_bundle
+        self.get_slots()
+        generation = organization_generation(self.organization.id)
+        self.assertEqual(organization_bundle(self.organization.id)['context']['business_name'], 'Serenity Spa')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.organization.name = 'Serenity Day Spa'
+            self.organization.save()
+            CommunicationTemplate.objects.create(organization=self.organization, booking_sms_content='Booked')
+        self.assertEqual(organization_generation(self.organization.id), generation)
+        with CaptureQueriesContext(connection) as context:
+            self.get_slots()
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(organization_bundle(self.organization.id)['context']['business_name'], 'Serenity Day Spa')
+        self.assertEqual(self.client.get(f'/api/booking/organization/{self.organization.id}/').json()['organization']['name'], 'Serenity Day Spa')
+
+        # Services feed both
+        messages = message_generation(self.organization.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.save()
+        self.assertNotEqual(organization_generation(self.organization.id), generation)
+        self.assertNotEqual(message_generation(self.organization.id), messages)
+
+
+    def test_dashboard_appointment_list_filters_use_indexes(self):
+        provider = TeamMember.objects.create(organization=self.organization, name='Ana', email='ana@example.com')
+        Appointment.objects.bulk_create([
+            Appointment(organization=self.organization, customer=self.customer, service=self.service,
+                        provider=provider if i % 2 else None, date=self.day + timedelta(days=i % 5), time=time(9 + i % 8, 0),
+                        duration=60, total_price=80, status='completed' if i % 3 else 'confirmed')
+            for i in range(60)
+        ])
+        url = '/api/dashboard/appointments/by_organization/'
+        combinations = [
+            {},
+            {'date_from': self.day.isoformat(), 'date_to': (self.day + timedelta(days=2)).isoformat()},
+            {'status': 'confirmed'},
+            {'status': 'confirmed,completed', 'date_from': self.day.isoformat()},
+            {'provider_id': provider.id},
+            {'provider_id': provider.id, 'status': 'completed', 'date_from': self.day.isoformat()},
+            {'location_id': 1},
+            {'order': 'desc'},
+        ]
+        explain = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        for params in combinations:
+            with self.subTest(params=params):
+                with CaptureQueriesContext(connection) as context:
+                    response = self.client.get(url, {'organization_id': self.organization.id, 'limit': 10, **params})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(context.captured_queries), 1)
+                with connection.cursor() as cursor:
+                    if connection.vendor == 'postgresql':
+                        # Tiny test tables are cheaper to scan; ask whether an index path exists at all
+                        cursor.execute('SET LOCAL enable_seqscan = off')
+                    cursor.execute(explain + context.captured_queries[0]['sql'])
+                    plan = ' '.join(str(column) for row in cursor.fetchall() for column in row)
+                if connection.vendor == 'sqlite':
+                    self.assertIn('SEARCH gabby_booking_appointment USING INDEX', plan)
+                    # Rows come out in index order: no sort before the LIMIT
+                    self.assertNotIn('TEMP B-TREE', plan)
+                else:
+                    self.assertNotIn('Seq Scan on gabby_booking_appointment', plan)
+
+        # Walking the pages returns every row once, in order
+        seen, cursor = [], None
+        while True:
+            page = self.client.get(url, {'organization_id': self.organization.id, 'limit': 25, 'status': 'completed',
+                                         **({'cursor': cursor} if cursor else {})}).json()
+            seen += [(row['date'], row['time'], row['id']) for row in page['data']]
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 40)
+        self.assertEqual(seen, sorted(seen))
+
+    def test_customer_history_is_keyset_paginated_in_constant_queries(self):
+        option = Option.objects.create(organization=self.organization, name='Hot stones', price=10, duration=15)
+        option.services.add(self.service)
+        provider = TeamMember.objects.create(organization=self.organization, name='Ana', email='ana@example.com')
+
+        def add_history(count):
+            # Several visits share a date and time so the cursor has to break ties on id
+            created = Appointment.objects.bulk_create([
+                Appointment(organization=self.organization, customer=self.customer, service=self.service,
+                            provider=provider, date=self.day - timedelta(days=400 + i // 2), time=time(10, 0),
+                            duration=60, total_price=80, status='completed')
+                for i in range(count)
+            ])
+            Appointment.options.through.objects.bulk_create([
+                Appointment.options.through(appointment_id=appointment.id, option_id=option.id) for appointment in created
+            ])
+
+        def fetch(**params):
+            params = {'email': self.customer.email, 'organization_id': self.organization.id, **params}
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get('/api/booking/customer/appointments/', params)
+            self.assertEqual(response.status_code, 200)
+            return response.json(), len(context.captured_queries)
+
+        add_history(5)
+        _, few = fetch(limit=50)
+        add_history(195)
+        first_page, many = fetch(limit=50)
+        self.assertEqual(many, few)
+        self.assertEqual(len(first_page['appointments']), 50)
+        self.assertEqual(first_page['appointments'][0]['options'][0]['name'], 'Hot stones')
+
+        seen, cursor = [], None
+        while True:
+            page, _ = fetch(limit=30, **({'cursor': cursor} if cursor else {}))
+            seen += [appointment['id'] for appointment in page['appointments']]
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 200)
+        self.assertEqual(seen, list(Appointment.objects.filter(customer=self.customer).order_by(
+            '-date', '-time', '-id').values_list('id', flat=True)))
+
+        sparse, sparse_queries = fetch(limit=50, fields='id,date,time,status')
+        self.assertEqual(set(sparse['appointments'][0]), {'id', 'date', 'time', 'status'})
+        self.assertLess(sparse_queries, many)
+
+        response = self.client.get('/api/booking/customer/appointments/', {
+            'email': self.customer.email, 'organization_id': self.organization.id, 'fields': 'id,secret'
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(SMS_BACKEND='fake', BACKGROUND_JOBS_EAGER=True, SMS_RATE_PER_SECOND=1000)
+class SMSOutboxTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        FakeSMSBackend.sent.clear()
+        FakeSMSBackend.failures.clear()
+        owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        self.organization = Organization.objects.create(owner=owner, name='Serenity Spa')
+        self.service = Service.objects.create(organization=self.organization, name='Massage', price=80, duration=60, detail='')
+        self.day = timezone.localdate() + timedelta(days=7)
+        BusinessHours.objects.create(
+            organization=self.organization, day_of_week=self.day.strftime('%A'), hours_type='custom',
+            open_time=time(9, 0), close_time=time(17, 0)
+        )
+
+    def book(self, start='10:00 am'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/booking/create/', {
+                'email': 'new@example.com', 'phone': '(555) 123-4567', 'organization_id': self.organization.id,
+                'service_id': self.service.id, 'date': self.day.isoformat(), 'time': start,
+            }, content_type='application/json')
+
+    def test_booking_sms_is_queued_with_the_booking_and_sent_after_commit(self):
+        self.assertEqual(self.book().status_code, 201)
+        message = OutboundSMS.objects.get()
+        self.assertEqual((message.status, message.notification_type, message.to_number), ('sent', 'created', '+15551234567'))
+        self.assertEqual(FakeSMSBackend.sent[0]['to'], '+15551234567')
+
+        # A booking that fails writes no message
+        self.assertEqual(self.book().status_code, 409)
+        self.assertEqual(OutboundSMS.objects.count(), 1)
+
+    def test_owner_templates_are_compiled_once_and_rendered_without_queries(self):
+        from .message_templates import compile_template, render_message
+        self.assertEqual(compile_template('Hi {{ client_first_name }}, see {{booking_link}}!'), (
+            ('text', 'Hi '), ('var', 'client_first_name'), ('text', ', see '), ('var', 'booking_link'), ('text', '!'),
+        ))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CommunicationTemplate.objects.create(
+                organization=self.organization, booking_sms_content='{{business_name}}: {{service_name}} on {{date_of_appointment}} at {{time_of_appointment}} {{unknown}}'
+            )
+        self.assertEqual(self.book().status_code, 201)
+        expected = f"Serenity Spa: Massage on {self.day.strftime('%A, %B')} {self.day.day} at 10:00 am "
+        self.assertEqual(FakeSMSBackend.sent[0]['body'], expected)
+
+        appointment = Appointment.objects.select_related('customer').get()
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(render_message(self.organization.id, 'booking_sms_content', appointment), expected)
+            self.assertIn('Clara', render_message(self.organization.id, 'cancellation_sms'))
+        self.assertEqual(len(context.captured_queries), 0)
+
+        # Renaming the assistant or editing the template takes effect on the next message
+        with self.captureOnCommitCallbacks(execute=True):
+            Assistant.objects.create(organization=self.organization, name='Mia', voice_type='alloy')
+            CommunicationTemplate.objects.filter(organization=self.organization).first().save()
+        self.assertIn('Mia', render_message(self.organization.id, 'cancellation_sms'))
+
+    def test_failed_sends_back_off_then_dead_letter(self):
+        FakeSMSBackend.failures.extend([SMSDeliveryError('timeout'), SMSDeliveryError('timeout')])
+        with self.captureOnCommitCallbacks(execute=True):
+            message = enqueue_sms(self.organization.id, '5551234567', 'Hi')
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('pending', 1))
+        first_retry = message.next_attempt_at
+
+        # Not due yet; then due and failing again, with a doubled delay
+        self.assertEqual(deliver_due(), 0)
+        deliver_due(now=first_retry)
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('pending', 2))
+        self.assertEqual(message.next_attempt_at - first_retry, timedelta(seconds=60))
+
+        deliver_due(now=message.next_attempt_at)
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('sent', 3))
+
+        FakeSMSBackend.failures.append(SMSDeliveryError('invalid number', permanent=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            rejected = enqueue_sms(self.organization.id, '5550000000', 'Hi')
+        rejected.refresh_from_db()
+        self.assertEqual((rejected.status, rejected.last_error), ('dead', 'invalid number'))
+
+    @override_settings(SMS_MAX_ATTEMPTS=2, SMS_RETRY_BASE_SECONDS=0)
+    def test_dead_letter_after_max_attempts(self):
+        FakeSMSBackend.failures.extend([SMSDeliveryError('down')] * 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            message = enqueue_sms(self.organization.id, '5551234567', 'Hi')
+        deliver_due()
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('dead', 2))
+
+    @override_settings(SMS_RATE_PER_SECOND=1)
+    def test_in_process_drain_leaves_rate_limited_messages_to_the_worker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                enqueue_sms(self.organization.id, f'555000000{i}', 'Hi')
+        # One send per second; the rest wait for send_sms_outbox instead of sleeping in the shared pool
+        sent = OutboundSMS.objects.filter(status='sent').count()
+        self.assertLess(sent, 3)
+        self.assertEqual(OutboundSMS.objects.filter(status='pending', attempts=0).count(), 3 - sent)
+        self.assertEqual(deliver_due(), 3 - sent)
+        self.assertEqual(OutboundSMS.objects.filter(status='sent').count(), 3)
+
+    @override_settings(BACKGROUND_JOBS_EAGER=False)
+    def test_drains_are_coalesced_to_one_per_process(self):
+        started, release, finished = threading.Event(), threading.Event(), threading.Event()
+        runs = []
+
+        def drain():
+            runs.append(1)
+            started.set()
+            release.wait(5)
+            if len(runs) == 2:
+                finished.set()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            run_coalesced_in_background(drain)
+        self.assertTrue(started.wait(5))
+        # Wakes while the drain runs fold into a single rerun
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(5):
+                run_coalesced_in_background(drain)
+        release.set()
+        self.assertTrue(finished.wait(5))
+        threading.Event().wait(0.2)
+        self.assertEqual(len(runs), 2)
+
+    @override_settings(SMS_RATE_PER_SECOND=2)
+    def test_sends_are_rate_limited_per_sender(self):
+        for i in range(5):
+            enqueue_sms(self.organization.id, f'555000000{i}', 'Hi')
+        self.assertEqual(deliver_due(), 5)
+        per_second = {}
+        for sent in FakeSMSBackend.sent:
+            per_second[int(sent['at'])] = per_second.get(int(sent['at']), 0) + 1
+        self.assertLessEqual(max(per_second.values()), 2)
+
+
+@override_settings(SMS_BACKEND='fake', BACKGROUND_JOBS_EAGER=True, REMINDER_CHANNELS=['email', 'sms'])
+class ReminderTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        FakeSMSBackend.sent.clear()
+        owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        self.organization = Organization.objects.create(owner=owner, name='Serenity Spa')
+        self.service = Service.objects.create(organization=self.organization, name='Massage', price=80, duration=60, detail='')
+        self.customer = Customer.objects.create(organization=self.organization, email='ana@example.com', first_name='Ana', phone='5551234567')
+        with self.captureOnCommitCallbacks(execute=True):
+            BookingRule.objects.create(organization=self.organization, email_reminder_delay='24 hours before')
+        self.day = timezone.localdate() + timedelta(days=7)
+
+    def create_appointment(self, start=time(10, 0), **fields):
+        return Appointment.objects.create(
+            organization=self.organization, customer=self.customer, service=self.service,
+            date=self.day, time=start, duration=60, total_price=80, **fields
+        )
+
+    def starts_at(self, appointment):
+        return timezone.make_aware(timezone.datetime.combine(appointment.date, appointment.time))
+
+    def test_reminder_is_sent_once_when_due(self):
+        appointment = self.create_appointment()
+        due = self.starts_at(appointment) - timedelta(hours=24)
+        self.assertEqual(appointment.reminder_due_at, due)
+
+        self.assertEqual(send_due_reminders(now=due - timedelta(minutes=1))['claimed'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            totals = send_due_reminders(now=due)
+        self.assertEqual((totals['sent'], totals['failed']), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['ana@example.com'])
+        self.assertIn('Hi Ana', mail.outbox[0].body)
+        self.assertIn('10:00 am', mail.outbox[0].body)
+        self.assertIn('Massage appointment', FakeSMSBackend.sent[0]['body'])
+
+        appointment.refresh_from_db()
+        self.assertEqual((appointment.reminder_due_at, appointment.reminder_sent_at), (None, due))
+        # Unrelated saves do not schedule it again; the next tick finds nothing
+        appointment.status = 'confirmed'
+        appointment.save()
+        self.assertIsNone(appointment.reminder_due_at)
+        self.assertEqual(send_due_reminders(now=due + timedelta(hours=1))['claimed'], 0)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_moving_or_cancelling_an_appointment_updates_its_reminder(self):
+        appointment = self.create_appointment(reminder_sent_at=timezone.now())
+        appointment.time = time(14, 0)
+        appointment.save()
+        self.assertIsNone(appointment.reminder_sent_at)
+        self.assertEqual(appointment.reminder_due_at, self.starts_at(appointment) - timedelta(hours=24))
+
+        appointment.status = 'cancelled'
+        appointment.save()
+        self.assertIsNone(appointment.reminder_due_at)
+
+        # Changing the delay reschedules pending reminders in the background
+        upcoming = self.create_appointment(start=time(9, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            rule = BookingRule.objects.get(organization=self.organization)
+            rule.email_reminder_delay = '2 days'
+            rule.save()
+        upcoming.refresh_from_db()
+        self.assertEqual(upcoming.reminder_due_at, self.starts_at(upcoming) - timedelta(days=2))
+
+    @override_settings(EMAIL_BACKEND='gabby_booking.email_outbox.QueuedEmailBackend')
+    def test_reminders_are_queued_in_the_claiming_transaction(self):
+        appointment = self.create_appointment()
+        due = appointment.reminder_due_at
+        self.assertEqual(send_due_reminders(now=due)['sent'], 1)
+        # The outbox rows exist alongside the sent mark
+        self.assertEqual(OutboundEmail.objects.get().to, ['ana@example.com'])
+        self.assertEqual(OutboundSMS.objects.get().notification_type, 'reminder')
+        appointment.refresh_from_db()
+        self.assertEqual((appointment.reminder_due_at, appointment.reminder_sent_at), (None, due))
+
+    @override_settings(EMAIL_BACKEND='gabby_booking.tests.FlakyEmailBackend', REMINDER_CHANNELS=['email'])
+    def test_failed_reminder_emails_stay_due(self):
+        FlakyEmailBackend.failures[:] = [smtplib.SMTPServerDisconnected('gone')]
+        appointment = self.create_appointment()
+        due = appointment.reminder_due_at
+        self.assertEqual(send_due_reminders(now=due)['failed'], 1)
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.reminder_due_at, due + timedelta(minutes=10))
+        self.assertIsNone(appointment.reminder_sent_at)
+
+        self.assertEqual(send_due_reminders(now=appointment.reminder_due_at)['sent'], 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_started_appointments_are_skipped(self):
+        appointment = self.create_appointment()
+        totals = send_due_reminders(now=self.starts_at(appointment) + timedelta(minutes=5))
+        self.assertEqual((totals['claimed'], totals['skipped'], totals['sent']), (1, 1, 0))
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_due_reminders_are_claimed_through_the_partial_index(self):
+        for hour in range(9, 15):
+            self.create_appointment(start=time(hour, 0))
+        sql, params = due_reminders(timezone.now() + timedelta(days=30)).values('id')[:500].query.sql_with_params()
+        explain = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(explain + sql, params)
+            plan = ' '.join(str(column) for row in cursor.fetchall() for column in row)
+        self.assertIn('appointment_reminder_due_idx', plan)
+
+
+class SMSDedupTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_duplicate_sends_within_the_window_are_collapsed(self):
+        self.assertTrue(claim_sms_send(1, '(555) 123-4567', 'booking_sms_content'))
+        self.assertFalse(claim_sms_send(1, '+15551234567', 'booking_sms_content'))
+        # Other kinds, numbers and organizations are independent
+        self.assertTrue(claim_sms_send(1, '+15551234567', 'cancellation_sms'))
+        self.assertTrue(claim_sms_send(1, '+15559990000', 'booking_sms_content'))
+        self.assertTrue(claim_sms_send(2, '+15551234567', 'booking_sms_content'))
+
+        # A failed send releases its claim so the retry goes out
+        release_sms_send(1, '5551234567', 'booking_sms_content')
+        self.assertTrue(claim_sms_send(1, '+15551234567', 'booking_sms_content'))
+
+        with override_settings(SMS_DEDUP_WINDOW_SECONDS=0):
+            self.assertTrue(claim_sms_send(1, '+15551234567', 'booking_sms_content'))
+
+
+class FlakyEmailBackend(LocmemEmailBackend):
+    """Delivery backend for EmailOutboxTests: queue exceptions in `failures` to fail the next sends."""
+    failures = []
+    opened = 0
+
+    def open(self):
+        FlakyEmailBackend.opened += 1
+
+    def send_messages(self, messages):
+        if FlakyEmailBackend.failures:
+            raise FlakyEmailBackend.failures.pop(0)
+        return super().send_messages(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND='gabby_booking.email_outbox.QueuedEmailBackend',
+    EMAIL_DELIVERY_BACKEND='gabby_booking.tests.FlakyEmailBackend',
+    BACKGROUND_JOBS_EAGER=True,
+)
+class EmailOutboxTests(TestCase):
+
+    def setUp(self):
+        pool.close_all()
+        FlakyEmailBackend.failures.clear()
+        FlakyEmailBackend.opened = 0
+
+    def test_emails_are_queued_in_the_transaction_and_sent_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            message = mail.EmailMultiAlternatives('Welcome', 'Hi', 'team@example.com', ['ana@example.com'], reply_to=['desk@example.com'])
+            message.attach_alternative('<p>Hi</p>', 'text/html')
+            message.send()
+            self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboundEmail.objects.get().status, 'sent')
+        self.assertEqual((mail.outbox[0].subject, mail.outbox[0].to, mail.outbox[0].reply_to), ('Welcome', ['ana@example.com'], ['desk@example.com']))
+        self.assertEqual(mail.outbox[0].alternatives[0][0], '<p>Hi</p>')
+
+        # A rolled-back transaction sends nothing
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    mail.send_mail('Lost', 'Hi', None, ['ana@example.com'])
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual((OutboundEmail.objects.count(), len(mail.outbox)), (1, 1))
+
+    def test_password_reset_request_only_queues(self):
+        User.objects.create_user(username='ana', email='ana@example.com', password='pass12345')
+        with self.captureOnCommitCallbacks(execute=False):
+            response = self.client.post('/users/password-reset/', {'email': 'ana@example.com'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(OutboundEmail.objects.get().status, 'pending')
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(deliver_due_emails(), 1)
+        self.assertEqual(mail.outbox[0].subject, 'Password Reset Request')
+
+    def queue(self, subject, to):
+        with self.captureOnCommitCallbacks(execute=True):
+            mail.send_mail(subject, 'Hi', None, [to])
+
+    def test_connections_are_pooled_and_failures_retried(self):
+        for i in range(3):
+            self.queue(f'Message {i}', f'c{i}@example.com')
+        self.assertEqual(len(mail.outbox), 3)
+        self.queue('Later', 'd@example.com')
+        # Every drain reused the first connection
+        self.assertEqual(FlakyEmailBackend.opened, 1)
+
+        FlakyEmailBackend.failures.append(smtplib.SMTPServerDisconnected('gone'))
+        self.queue('Flaky', 'e@example.com')
+        message = OutboundEmail.objects.get(subject='Flaky')
+        self.assertEqual((message.status, message.attempts), ('pending', 1))
+        self.assertEqual(deliver_due_emails(now=message.next_attempt_at), 1)
+        message.refresh_from_db()
+        self.assertEqual(message.status, 'sent')
+        # The broken connection was replaced
+        self.assertEqual(FlakyEmailBackend.opened, 2)
+
+        FlakyEmailBackend.failures.append(smtplib.SMTPRecipientsRefused({'x@example.com': (550, b'No such user')}))
+        self.queue('Bounce', 'x@example.com')
+        self.assertEqual(OutboundEmail.objects.get(subject='Bounce').status, 'dead')
+
+
+class BulkImportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        self.organization = Organization.objects.create(owner=owner, name='Serenity Spa')
+        self.service = Service.objects.create(organization=self.organization, name='Massage', price=80, duration=60, detail='')
+        self.member = TeamMember.objects.create(organization=self.organization, name='Ana', email='ana@example.com')
+        Customer.objects.create(organization=self.organization, email='known@example.com', first_name='Known')
+
+    def test_csv_upload_reports_errors_by_line(self):
+        body = (
+            "email,first_name,date,time,service,provider,price\n"
+            "known@example.com,Known,2024-03-01,10:00,Massage,ana@example.com,\n"
+            "new@example.com,New,,,,,\n"
+            "other@example.com,Other,2024-03-02,2:30 pm,massage,,95\n"
+            "broken,No email,,,,,\n"
+            "late@example.com,Late,2024-03-03,09:00,Pedicure,,\n"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f'/api/dashboard/organization/{self.organization.id}/import/', body, content_type='text/csv'
+            )
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual((report['rows'], report['customers_created'], report['appointments_created']), (5, 2, 2))
+        self.assertEqual([error['line'] for error in report['errors']], [5, 6])
+
+        appointment = Appointment.objects.get(customer__email='known@example.com')
+        self.assertEqual((appointment.provider_id, appointment.status, appointment.duration), (self.member.id, 'completed', 60))
+        self.assertEqual(Appointment.objects.get(customer__email='other@example.com').total_price, 95)
+
+    def test_command_streams_ndjson_in_batches(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as source:
+            for i in range(5000):
+                source.write(json.dumps({
+                    'email': f'c{i % 2500}@example.com', 'date': '2024-01-15', 'time': '09:00', 'service': 'Massage',
+                }) + '\n')
+        report_path = source.name + '.report.json'
+
+        with CaptureQueriesContext(connection) as context:
+            call_command('import_bookings', self.organization.id, source.name, batch_size=1000,
+                         report=report_path, stdout=StringIO())
+        with open(report_path) as report_file:
+            report = json.load(report_file)
+        self.assertEqual((report['customers_created'], report['appointments_created'], report['error_count']), (2500, 5000, 0))
+        self.assertEqual(Customer.objects.filter(organization=self.organization).count(), 2501)
+        # Organization check and four lookups up front, then one customer id read per batch
+        # that creates customers (3 of 5); inserts are bulk, split only by the backend's parameter limit
+        reads = [query for query in context.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertEqual(len(reads), 5 + 3)
+
+    def test_out_of_range_duration_and_price_are_row_errors(self):
+        body = (
+            "email,date,time,service,duration,price\n"
+            "a@example.com,2024-03-01,10:00,Massage,-30,\n"
+            "b@example.com,2024-03-01,11:00,Massage,,NaN\n"
+            "c@example.com,2024-03-01,12:00,Massage,0,\n"
+            "d@example.com,2024-03-01,13:00,Massage,,123456789.00\n"
+            "e@example.com,2024-03-01,14:00,Massage,45,19.99\n"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f'/api/dashboard/organization/{self.organization.id}/import/', body, content_type='text/csv'
+            )
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual([error['line'] for error in report['errors']], [2, 3, 4, 5])
+        self.assertEqual(report['appointments_created'], 1)
+        appointment = Appointment.objects.get(customer__email='e@example.com')
+        self.assertEqual((appointment.duration, str(appointment.total_price)), (45, '19.99'))
+
+    def test_customers_inserted_meanwhile_are_not_counted_as_created(self):
+        importer = BulkImporter(self.organization.id)
+        # Written by someone else after the importer loaded its customer map
+        Customer.objects.create(organization=self.organization, email='late@example.com')
+        report = importer.run([(2, {'email': 'late@example.com'}), (3, {'email': 'fresh@example.com'})])
+        self.assertEqual(report['customers_created'], 1)
+        self.assertEqual(Customer.objects.filter(organization=self.organization).count(), 3)
+
+    def test_upcoming_appointments_get_reminders_and_emails_match_any_case(self):
+        BookingRule.objects.create(organization=self.organization, email_reminder_delay='24 hours before')
+        Customer.objects.create(organization=self.organization, email='Mixed@Example.com', first_name='Mixed')
+        day = timezone.localdate() + timedelta(days=3)
+        body = (
+            "email,date,time,service\n"
+            f"mixed@example.com,{day.isoformat()},10:00,Massage\n"
+            f"KNOWN@example.com,{(day - timedelta(days=30)).isoformat()},10:00,Massage\n"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f'/api/dashboard/organization/{self.organization.id}/import/', body, content_type='text/csv'
+            )
+        self.assertEqual(response.json()['customers_created'], 0)
+        upcoming = Appointment.objects.get(customer__email='Mixed@Example.com')
+        self.assertEqual(upcoming.reminder_due_at, timezone.make_aware(datetime.combine(day, time(10))) - timedelta(hours=24))
+        self.assertIsNone(Appointment.objects.get(customer__email='known@example.com').reminder_due_at)
+
+
+@unittest.skipUnless(connection.features.has_select_for_update, 'needs row locks (SELECT ... FOR UPDATE)')
+class ConcurrentBookingTests(TransactionTestCase):
+    """Fires simultaneous bookings for one slot from separate connections; exactly one may win."""
+
+    CLIENTS = 12
+
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        self.organization = Organization.objects.create(owner=owner, name='Serenity Spa')
+        self.service = Service.objects.create(organization=self.organization, name='Massage', price=80, duration=60, detail='')
+        self.day = timezone.localdate() + timedelta(days=7)
+
+    def test_only_one_concurrent_booking_wins(self):
+        barrier = threading.Barrier(self.CLIENTS)
+        statuses = []
+
+        def book(index):
+            try:
+                payload = {
+                    'email': f'c{index}@example.com', 'organization_id': self.organization.id,
+                    'service_id': self.service.id, 'date': self.day.isoformat(), 'time': '10:00 am',
+                }
+                barrier.wait()
+                statuses.append(Client().post('/api/booking/create/', payload, content_type='application/json').status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=book, args=(i,)) for i in range(self.CLIENTS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(statuses), [201] + [409] * (self.CLIENTS - 1))
+        self.assertEqual(Appointment.objects.filter(organization=self.organization).count(), 1)
@@ -1,11 +1,12 @@
 from django.urls import path,include
 from rest_framework.routers import DefaultRouter
-from .views import RegistrationStepAPIView,OrganizationViewSet,ServiceViewSet,OptionViewSet,BusinessHoursViewSet,ExceptionalClosingViewSet,ReservationTypeViewSet,SMSSettingViewSet,GoogleCalendarSettingViewSet,OrganizationFAQViewSet,AssistantViewSet,FallbackNumberViewSet,generate_prompt_view
+from .views import RegistrationStepAPIView,OrganizationViewSet,ServiceViewSet,OptionViewSet,BusinessHoursViewSet,ExceptionalClosingViewSet,ReservationTypeViewSet,SMSSettingViewSet,GoogleCalendarSettingViewSet,OrganizationFAQViewSet,AssistantViewSet,FallbackNumberViewSet,generate_prompt_view,prompt_job_status_view
 from .views_dashboard import (
     DashboardOrganizationViewSet, DashboardServiceViewSet, DashboardOptionViewSet,
     ServiceLocationViewSet, BusinessHoursViewSet as DashboardBusinessHoursViewSet,
     ServiceAddOnViewSet, TeamMemberViewSet, BookingRuleViewSet, CommunicationTemplateViewSet,
-    FAQViewSet, AssistantViewSet as DashboardAssistantViewSet, FallbackNumberViewSet as DashboardFallbackNumberViewSet
+    FAQViewSet, AssistantViewSet as DashboardAssistantViewSet, FallbackNumberViewSet as DashboardFallbackNumberViewSet,
+    AppointmentViewSet as DashboardAppointmentViewSet
 )
 
 
@@ -35,10 +36,12 @@ dashboard_router.register(r'communication-templates', CommunicationTemplateViewS
 dashboard_router.register(r'faqs', FAQViewSet, basename='dashboard-faqs')
 dashboard_router.register(r'assistant', DashboardAssistantViewSet, basename='dashboard-assistant')
 dashboard_router.register(r'fallback-numbers', DashboardFallbackNumberViewSet, basename='dashboard-fallback-numbers')
+dashboard_router.register(r'appointments', DashboardAppointmentViewSet, basename='dashboard-appointments')
 
 urlpatterns = [
     path('registration-steps/', RegistrationStepAPIView.as_view(), name='registration-steps'),
     path('', include(router.urls)),
     path('dashboard/', include(dashboard_router.urls)),
     path('generate-prompt/<int:organization_id>/', generate_prompt_view, name='generate_prompt'),
+    path('prompt-jobs/<uuid:job_id>/', prompt_job_status_view, name='prompt_job_status'),
 ]
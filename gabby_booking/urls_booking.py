@@ -18,6 +18,9 @@ urlpatterns = [
 
     # Time slots
     path('time-slots/', views_booking.get_available_time_slots, name='booking-time-slots'),
+    path('availability/', views_booking.get_availability_calendar, name='booking-availability'),
+    path('next-available/', views_booking.get_next_available, name='booking-next-available'),
+    path('availability/stats/', views_booking.get_availability_cache_stats, name='booking-availability-stats'),
 
     # Appointment management
     path('appointments/<int:appointment_id>/reschedule/', views_booking.reschedule_appointment, name='booking-reschedule'),
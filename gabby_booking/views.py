@@ -4,38 +4,17 @@ from rest_framework import status,viewsets
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.decorators import action
-from .models import RegistrationStep,Organization, Service , Option,BusinessHours , ExceptionalClosing,ReservationType,SMSSetting,GoogleCalendarSetting,OrganizationFAQ,Assistant,FallbackNumber,OrganizationPrompt
+from .models import RegistrationStep,Organization, Service , Option,BusinessHours , ExceptionalClosing,ReservationType,SMSSetting,GoogleCalendarSetting,OrganizationFAQ,Assistant,FallbackNumber,PromptGenerationJob
 from .serializers import RegistrationStepSerializer,OrganizationSerializer, ServiceSerializer, OptionSerializer,BusinessHoursSerializer,ExceptionalClosingSerializer,ReservationTypeSerializer,SMSSettingSerializer, GoogleCalendarSettingSerializer,OrganizationFAQSerializer,AssistantSerializer,FallbackNumberSerializer
 from rest_framework.response import Response
-from langchain_community.chat_models import ChatOpenAI
-from langchain_core.messages import HumanMessage
-from django.conf import settings 
 from rest_framework.decorators import api_view
 from django.shortcuts import get_object_or_404
 from .utils import generate_prompt
+from .prompt_jobs import submit_prompt_generation
 
 logger = logging.getLogger(__name__)
 
 
-def generated_prompt(data):
-    """Use OpenAI to generate a real-time prompt for appointment booking."""
-    openai_api_key = settings.OPENAI_API_KEY  # Fetch API key from Django settings
-    llm = ChatOpenAI(model_name="gpt-4o", temperature=0.7, openai_api_key=openai_api_key)
-
-    business_name = data.get("name", "the business")
-    business_description = data.get("description", "a professional service provider")
-
-    meta_prompt = (
-        f"You are an AI prompt generator. Your task is to create a well-structured and effective prompt for OpenAI’s assistant, "
-        f"which will act as a business-specific AI agent. \n\n"
-        f"The AI assistant will handle appointment bookings for a business named '{business_name}', which provides '{business_description}'. \n\n"
-        f"Your response should be a fully formatted prompt that can be used directly in OpenAI for real-time interactions."
-    )
-
-    message = HumanMessage(content=meta_prompt)
-    response = llm.invoke([message])
-
-    return response.content
 class RegistrationStepAPIView(APIView):
     # permission_classes = [IsAuthenticated]  # Require authentication
 
@@ -115,11 +94,13 @@ class OrganizationViewSet(viewsets.ModelViewSet):
             serializer = self.get_serializer(data=request.data)
             if serializer.is_valid():
                 organization = serializer.save()
-                prompt_text = generated_prompt(request.data)
-                print(prompt_text)
-                OrganizationPrompt.objects.create(organization=organization, generated_prompt=prompt_text)
+                job = submit_prompt_generation(organization, request.data.get("name"), request.data.get("description"))
                 logger.info(f"New organization created: {serializer.data}")
-                return Response({"message": "Organization created", "data": serializer.data}, status=status.HTTP_201_CREATED)
+                return Response({
+                    "message": "Organization created",
+                    "data": serializer.data,
+                    "prompt_job": {"id": str(job.id), "status": job.status},
+                }, status=status.HTTP_201_CREATED)
             logger.warning(f"Validation failed: {serializer.errors}")
             return Response({"errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
@@ -190,6 +171,28 @@ def generate_prompt_view(request, organization_id):
 
     return Response({"prompt": prompt})
 
+
+@api_view(['GET'])
+def prompt_job_status_view(request, job_id):
+    """
+    Poll a background prompt generation job
+
+    GET /api/prompt-jobs/<job_id>/
+    """
+    job = get_object_or_404(PromptGenerationJob, id=job_id)
+    data = {
+        "id": str(job.id),
+        "organization": job.organization_id,
+        "status": job.status,
+        "cached": job.cached,
+        "updated_at": job.updated_at,
+    }
+    if job.status == 'succeeded':
+        data["prompt"] = job.result
+    elif job.status == 'failed':
+        data["error"] = job.error
+    return Response(data, status=status.HTTP_200_OK)
+
         
 class ServiceViewSet(viewsets.ModelViewSet):
     queryset = Service.objects.all()
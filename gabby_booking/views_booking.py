@@ -7,20 +7,25 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from django.shortcuts import get_object_or_404
+from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from datetime import datetime
 import logging
 
-from .models import (
-    Organization, Customer, Appointment, Service, Option,
-    Location, TeamMember, BusinessHours
-)
+from .models import Customer, Appointment, Service, Option
 from .serializers import (
-    CustomerSerializer, AppointmentSerializer, BookingCreateSerializer,
-    BookingPortalLocationSerializer, BookingPortalServiceSerializer,
-    BookingPortalProviderSerializer, OrganizationSerializer
+    CustomerSerializer, AppointmentSerializer, BookingCreateSerializer, OrganizationSerializer
 )
 from .notifications import send_booking_notification
+from .availability import default_granularity, format_slot_time
+from .availability_cache import get_availability, cache_stats, next_available
+from .booking import SlotUnavailable, reserve_slot
+from .pagination import decode_cursor, encode_cursor, keyset_ordering, keyset_page_filter
+from .portal_cache import portal_payload
+from .idempotency import KeyAlreadyUsed, claim, idempotency_key, remember, replay
 
 logger = logging.getLogger(__name__)
 
@@ -33,30 +38,24 @@ def get_organization_booking_details(request, organization_id):
     Returns organization info, locations, services, and team members
 
     GET /api/booking/organization/<organization_id>/
+
+    The payload is cached until the catalog changes (see portal_cache.py) and
+    sent with ETag / Last-Modified; a matching If-None-Match or
+    If-Modified-Since gets a 304 without touching the database.
     """
     try:
-        organization = get_object_or_404(Organization, id=organization_id)
-
-        # Get all related booking data
-        # Location is linked via ServiceLocation, not directly to Organization
-        locations = Location.objects.filter(service_location__organization=organization)
-        services = Service.objects.filter(organization=organization)
-        team_members = TeamMember.objects.filter(organization=organization)
-
-        # Serialize data
-        data = {
-            'organization': {
-                'id': organization.id,
-                'name': organization.name,
-                'industry': organization.industry,
-                'description': organization.description,
-            },
-            'locations': BookingPortalLocationSerializer(locations, many=True).data,
-            'services': BookingPortalServiceSerializer(services, many=True).data,
-            'providers': BookingPortalProviderSerializer(team_members, many=True).data,
-        }
-
-        return Response(data, status=status.HTTP_200_OK)
+        entry = portal_payload(organization_id)
+        if entry is None:
+            return Response({'error': 'Organization not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        etag = f'"{entry["etag"]}"'
+        not_modified = get_conditional_response(request, etag=etag, last_modified=entry['last_modified'])
+        response = not_modified or Response(entry['data'], status=status.HTTP_200_OK)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(entry['last_modified'])
+        # Let browsers and CDNs keep a copy but revalidate it on every use
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
 
     except Exception as e:
         logger.error(f"Error fetching organization booking details: {str(e)}")
@@ -126,33 +125,14 @@ def create_booking(request):
         "time": "9:00 am",
         "note": "Customer notes"
     }
+
+    Send an Idempotency-Key header to make retries safe: a repeated key replays
+    the stored response instead of booking again. Returns 409 if the slot is taken.
     """
     try:
         serializer = BookingCreateSerializer(data=request.data)
 
-        if serializer.is_valid():
-            appointment = serializer.save()
-
-            # Send SMS notification
-            try:
-                send_booking_notification(appointment, notification_type='created')
-                logger.info(f"Booking confirmation SMS sent for appointment {appointment.id}")
-            except Exception as sms_error:
-                # Log error but don't fail the booking
-                logger.error(f"Failed to send booking SMS: {str(sms_error)}")
-
-            # Return full appointment data
-            response_data = AppointmentSerializer(appointment).data
-
-            return Response(
-                {
-                    'success': True,
-                    'message': 'Booking created successfully',
-                    'appointment': response_data
-                },
-                status=status.HTTP_201_CREATED
-            )
-        else:
+        if not serializer.is_valid():
             return Response(
                 {
                     'success': False,
@@ -161,6 +141,36 @@ def create_booking(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        key = idempotency_key(request)
+        try:
+            with transaction.atomic():
+                record = claim(key, 'booking-create', request.data) if key else None
+                appointment = serializer.save()
+                # Queued in the booking's transaction, sent in the background after it commits
+                send_booking_notification(appointment, notification_type='created')
+
+                # Return full appointment data
+                appointment = AppointmentSerializer.setup_eager_loading(Appointment.objects).get(id=appointment.id)
+                response_data = {
+                    'success': True,
+                    'message': 'Booking created successfully',
+                    'appointment': AppointmentSerializer(appointment).data
+                }
+                if record:
+                    remember(record, status.HTTP_201_CREATED, response_data)
+        except KeyAlreadyUsed:
+            return replay(key, 'booking-create', request.data)
+
+        return Response(response_data, status=status.HTTP_201_CREATED)
+
+    except SlotUnavailable as e:
+        return Response(
+            {
+                'success': False,
+                'error': str(e)
+            },
+            status=status.HTTP_409_CONFLICT
+        )
     except Exception as e:
         logger.error(f"Error creating booking: {str(e)}")
         return Response(
@@ -179,12 +189,17 @@ def get_available_time_slots(request):
     """
     Get available time slots for a specific date, service, and provider
 
+    Slots come from the organization's business hours, breaks, closings and
+    booking rules; existing appointments are loaded in one query.
+
     GET /api/booking/time-slots/?organization_id=<org_id>&date=<date>&service_id=<service_id>&provider_id=<provider_id>
+        optional: &option_ids=<id>,<id>&location_id=<location_id>&granularity=<minutes>
     """
     organization_id = request.GET.get('organization_id')
     date = request.GET.get('date')
     service_id = request.GET.get('service_id')
     provider_id = request.GET.get('provider_id')
+    location_id = request.GET.get('location_id')
 
     if not all([organization_id, date, service_id]):
         return Response(
@@ -193,67 +208,237 @@ def get_available_time_slots(request):
         )
 
     try:
-        from datetime import datetime, timedelta
+        day = datetime.strptime(date, '%Y-%m-%d').date()
+        option_ids = [int(option_id) for option_id in request.GET.get('option_ids', '').split(',') if option_id]
+        granularity = int(request.GET.get('granularity') or default_granularity())
+        if granularity <= 0:
+            raise ValueError('granularity must be positive')
+    except ValueError:
+        return Response(
+            {'error': 'Invalid date, option_ids or granularity'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        try:
+            duration, days = get_availability(
+                organization_id, day, day, service_id, option_ids,
+                location_id=location_id, provider_id=provider_id, granularity=granularity
+            )
+        except Service.DoesNotExist:
+            return Response({'error': 'Service not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        # Get service to know duration
-        service = get_object_or_404(Service, id=service_id)
+        _, _, slots = days[0]
+        time_slots = [
+            {'time': format_slot_time(start), 'available': bool(providers)}
+            for start, providers in slots
+        ]
 
-        # Get business hours for the organization
-        business_hours = BusinessHours.objects.filter(
-            organization_id=organization_id
-        ).first()
+        return Response({
+            'date': date,
+            'duration': duration,
+            'time_slots': time_slots
+        }, status=status.HTTP_200_OK)
 
-        # Get existing appointments for this date and provider
-        existing_appointments = Appointment.objects.filter(
-            organization_id=organization_id,
-            date=date,
-            status__in=['pending', 'confirmed']
+    except Exception as e:
+        logger.error(f"Error fetching time slots: {str(e)}")
+        return Response(
+            {'error': 'Failed to fetch time slots'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-        if provider_id:
-            existing_appointments = existing_appointments.filter(provider_id=provider_id)
 
-        # Generate time slots (simplified - you can make this more sophisticated)
-        # For now, generate hourly slots from 9 AM to 6 PM
-        time_slots = []
-        current_time = datetime.strptime("09:00 AM", "%I:%M %p")
-        end_time = datetime.strptime("06:00 PM", "%I:%M %p")
+MAX_CALENDAR_DAYS = 90
 
-        while current_time <= end_time:
-            time_str = current_time.strftime("%I:%M %p").lower().lstrip('0')
 
-            # Check if this time slot is already booked
-            is_booked = existing_appointments.filter(
-                time=current_time.time()
-            ).exists()
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_availability_calendar(request):
+    """
+    Availability for a range of dates in one request (month views)
 
-            time_slots.append({
-                'time': time_str,
-                'available': not is_booked
-            })
+    GET /api/booking/availability/?organization_id=<org_id>&service_id=<service_id>&from=<date>&to=<date>
+        optional: &provider_id=<id>&location_id=<id>&option_ids=<id>,<id>&granularity=<minutes>&include_slots=false
 
-            current_time += timedelta(hours=1)
+    Returns per-day summaries (open, available_count, first_available) and,
+    unless include_slots=false, the list of free start times. At most 90 days.
+    """
+    organization_id = request.GET.get('organization_id')
+    service_id = request.GET.get('service_id')
+
+    if not all([organization_id, service_id, request.GET.get('from')]):
+        return Response(
+            {'error': 'organization_id, service_id, and from are required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        start_date = datetime.strptime(request.GET['from'], '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.GET.get('to') or request.GET['from'], '%Y-%m-%d').date()
+        option_ids = [int(option_id) for option_id in request.GET.get('option_ids', '').split(',') if option_id]
+        granularity = int(request.GET.get('granularity') or default_granularity())
+        if granularity <= 0:
+            raise ValueError('granularity must be positive')
+    except ValueError:
+        return Response(
+            {'error': 'Invalid from, to, option_ids or granularity'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if end_date < start_date:
+        return Response({'error': 'to must not be before from'}, status=status.HTTP_400_BAD_REQUEST)
+    if (end_date - start_date).days + 1 > MAX_CALENDAR_DAYS:
+        return Response(
+            {'error': f'Range cannot exceed {MAX_CALENDAR_DAYS} days'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    include_slots = request.GET.get('include_slots', 'true').lower() not in ('false', '0', 'no')
+
+    try:
+        try:
+            duration, availability = get_availability(
+                organization_id, start_date, end_date, service_id, option_ids,
+                location_id=request.GET.get('location_id'), provider_id=request.GET.get('provider_id'),
+                granularity=granularity
+            )
+        except Service.DoesNotExist:
+            return Response({'error': 'Service not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        days = []
+        for day, is_open, slots in availability:
+            free = [start for start, providers in slots if providers]
+            summary = {
+                'date': day.isoformat(),
+                'open': is_open,
+                'available_count': len(free),
+                'first_available': format_slot_time(free[0]) if free else None,
+            }
+            if include_slots:
+                summary['slots'] = [format_slot_time(start) for start in free]
+            days.append(summary)
 
         return Response({
-            'date': date,
-            'time_slots': time_slots
+            'from': start_date.isoformat(),
+            'to': end_date.isoformat(),
+            'duration': duration,
+            'granularity': granularity,
+            'days': days
         }, status=status.HTTP_200_OK)
 
     except Exception as e:
-        logger.error(f"Error fetching time slots: {str(e)}")
+        logger.error(f"Error fetching availability calendar: {str(e)}")
         return Response(
-            {'error': 'Failed to fetch time slots'},
+            {'error': 'Failed to fetch availability'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
 
+MAX_NEXT_AVAILABLE_SLOTS = 50
+MAX_NEXT_AVAILABLE_DAYS = 180
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_next_available(request):
+    """
+    Earliest free slots from a given time, across providers and locations
+
+    GET /api/booking/next-available/?organization_id=<org_id>&service_id=<service_id>
+        optional: &after=<ISO datetime, default now>&limit=<1-50, default 5>&max_days=<1-180, default 60>
+                  &provider_id=<id>&location_id=<id>&option_ids=<id>,<id>&granularity=<minutes>
+
+    Closed days (hours and closings) are skipped without being computed and the
+    scan stops as soon as `limit` slots are found.
+    """
+    organization_id = request.GET.get('organization_id')
+    service_id = request.GET.get('service_id')
+
+    if not all([organization_id, service_id]):
+        return Response(
+            {'error': 'organization_id and service_id are required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        after = request.GET.get('after')
+        after = datetime.fromisoformat(after) if after else timezone.localtime()
+        if timezone.is_aware(after):
+            after = timezone.localtime(after)
+        limit = int(request.GET.get('limit') or 5)
+        max_days = int(request.GET.get('max_days') or 60)
+        option_ids = [int(option_id) for option_id in request.GET.get('option_ids', '').split(',') if option_id]
+        granularity = int(request.GET.get('granularity') or default_granularity())
+        if not 1 <= limit <= MAX_NEXT_AVAILABLE_SLOTS or not 1 <= max_days <= MAX_NEXT_AVAILABLE_DAYS or granularity <= 0:
+            raise ValueError('out of range')
+    except ValueError:
+        return Response(
+            {'error': (
+                f'Invalid after, option_ids or granularity, or limit/max_days outside '
+                f'1-{MAX_NEXT_AVAILABLE_SLOTS}/1-{MAX_NEXT_AVAILABLE_DAYS}'
+            )},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        try:
+            duration, slots = next_available(
+                organization_id, service_id, after, limit=limit, option_ids=option_ids,
+                location_id=request.GET.get('location_id'), provider_id=request.GET.get('provider_id'),
+                granularity=granularity, max_days=max_days
+            )
+        except Service.DoesNotExist:
+            return Response({'error': 'Service not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            'after': after.isoformat(),
+            'duration': duration,
+            'slots': [
+                {
+                    'date': day.isoformat(),
+                    'time': format_slot_time(start),
+                    'location_id': location_id,
+                    'provider_ids': [provider for provider in providers if provider],
+                }
+                for day, start, location_id, providers in slots
+            ]
+        }, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        logger.error(f"Error searching next available slots: {str(e)}")
+        return Response(
+            {'error': 'Failed to search availability'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+def get_availability_cache_stats(request):
+    """
+    Availability cache hit rate (provider-day lookups)
+
+    GET /api/booking/availability/stats/
+    """
+    return Response(cache_stats(), status=status.HTTP_200_OK)
+
+
+CUSTOMER_APPOINTMENTS_PAGE_SIZE = 20
+MAX_CUSTOMER_APPOINTMENTS_PAGE_SIZE = 100
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_customer_appointments(request):
     """
-    Get appointments for a specific customer
+    Get appointments for a specific customer, most recent first
 
     GET /api/booking/customer/appointments/?email=<email>&organization_id=<org_id>
+        optional: &limit=<1-100, default 20>&cursor=<next_cursor from the previous page>
+                  &fields=<id>,<date>,<time>,<service>,... (only render these appointment fields)
+
+    Pages are keyset-paginated on (date, time, id), so each page costs the same
+    number of queries however long the customer's history is. next_cursor is
+    null on the last page.
     """
     email = request.GET.get('email', '').strip().lower()
     organization_id = request.GET.get('organization_id')
@@ -264,6 +449,24 @@ def get_customer_appointments(request):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    fields = [name.strip() for name in request.GET.get('fields', '').split(',') if name.strip()]
+    unknown = set(fields) - set(AppointmentSerializer.Meta.fields)
+    if unknown:
+        return Response(
+            {'error': f"Unknown fields: {', '.join(sorted(unknown))}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        limit = int(request.GET.get('limit') or CUSTOMER_APPOINTMENTS_PAGE_SIZE)
+        if not 1 <= limit <= MAX_CUSTOMER_APPOINTMENTS_PAGE_SIZE:
+            raise ValueError('out of range')
+        cursor = decode_cursor(request.GET['cursor']) if request.GET.get('cursor') else None
+    except ValueError:
+        return Response(
+            {'error': f'Invalid cursor, or limit outside 1-{MAX_CUSTOMER_APPOINTMENTS_PAGE_SIZE}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
     try:
         # Find customer
         customer = Customer.objects.filter(
@@ -272,16 +475,22 @@ def get_customer_appointments(request):
         ).first()
 
         if not customer:
-            return Response({'appointments': []}, status=status.HTTP_200_OK)
+            return Response({'appointments': [], 'next_cursor': None}, status=status.HTTP_200_OK)
 
-        # Get appointments
-        appointments = Appointment.objects.filter(
-            customer=customer
-        ).order_by('-date', '-time')
+        # Get one page of appointments after the cursor
+        appointments = keyset_page_filter(Appointment.objects.filter(customer=customer), cursor, descending=True)
+        appointments = AppointmentSerializer.setup_eager_loading(
+            appointments.order_by(*keyset_ordering(descending=True)), fields
+        )
+        # One extra row tells whether there is a next page
+        page = list(appointments[:limit + 1])
+        next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+        page = page[:limit]
 
         return Response({
             'customer': CustomerSerializer(customer).data,
-            'appointments': AppointmentSerializer(appointments, many=True).data
+            'appointments': AppointmentSerializer(page, many=True, fields=fields or None).data,
+            'next_cursor': next_cursor,
         }, status=status.HTTP_200_OK)
 
     except Exception as e:
@@ -300,9 +509,11 @@ def reschedule_appointment(request, appointment_id):
 
     PATCH /api/booking/appointments/<appointment_id>/reschedule/
     Body: { "date": "2025-01-20", "time": "10:00 am" }
+
+    Returns 409 if the new time is no longer free.
     """
     try:
-        appointment = get_object_or_404(Appointment, id=appointment_id)
+        appointment = get_object_or_404(AppointmentSerializer.setup_eager_loading(Appointment.objects), id=appointment_id)
 
         new_date = request.data.get('date')
         new_time = request.data.get('time')
@@ -317,8 +528,15 @@ def reschedule_appointment(request, appointment_id):
         old_date = appointment.date
         old_time = appointment.time
 
+        try:
+            new_date = datetime.strptime(new_date, '%Y-%m-%d').date()
+        except ValueError:
+            return Response(
+                {'error': 'Invalid date format. Use YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
         # Convert 12-hour format to 24-hour format if needed
-        from datetime import datetime
         try:
             # Try parsing as 12-hour format first (e.g., "10:00 am")
             time_obj = datetime.strptime(new_time, '%I:%M %p')
@@ -338,22 +556,25 @@ def reschedule_appointment(request, appointment_id):
                         status=status.HTTP_400_BAD_REQUEST
                     )
 
-        # Update appointment
-        appointment.date = new_date
-        appointment.time = new_time
-        appointment.save()
-
-        # Send SMS notification
+        # Update appointment under the provider-day lock; moving away from the old slot needs no lock
         try:
-            send_booking_notification(
-                appointment,
-                notification_type='rescheduled',
-                old_date=old_date,
-                old_time=old_time
-            )
-            logger.info(f"Reschedule SMS sent for appointment {appointment.id}")
-        except Exception as sms_error:
-            logger.error(f"Failed to send reschedule SMS: {str(sms_error)}")
+            with transaction.atomic():
+                reserve_slot(
+                    appointment.organization_id, new_date, time_obj.time(), appointment.duration,
+                    location_id=appointment.location_id, provider_id=appointment.provider_id,
+                    exclude_appointment_id=appointment.id
+                )
+                appointment.date = new_date
+                appointment.time = time_obj.time()
+                appointment.save()
+                send_booking_notification(
+                    appointment,
+                    notification_type='rescheduled',
+                    old_date=old_date,
+                    old_time=old_time
+                )
+        except SlotUnavailable as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
 
         return Response({
             'success': True,
@@ -379,22 +600,17 @@ def cancel_appointment(request, appointment_id):
     Body: { "reason": "Scheduling conflict" }
     """
     try:
-        appointment = get_object_or_404(Appointment, id=appointment_id)
+        appointment = get_object_or_404(Appointment.objects.select_related('customer'), id=appointment_id)
 
         reason = request.data.get('reason', 'Customer requested cancellation')
 
-        # Update appointment status
-        appointment.status = 'cancelled'
-        appointment.internal_notes = f"Cancellation reason: {reason}"
-        appointment.cancelled_at = timezone.now()
-        appointment.save()
-
-        # Send SMS notification
-        try:
+        # Update appointment status and queue the SMS together
+        with transaction.atomic():
+            appointment.status = 'cancelled'
+            appointment.internal_notes = f"Cancellation reason: {reason}"
+            appointment.cancelled_at = timezone.now()
+            appointment.save()
             send_booking_notification(appointment, notification_type='cancelled')
-            logger.info(f"Cancellation SMS sent for appointment {appointment.id}")
-        except Exception as sms_error:
-            logger.error(f"Failed to send cancellation SMS: {str(sms_error)}")
 
         return Response({
             'success': True,
@@ -1,11 +1,15 @@
 import logging
-from rest_framework import status, viewsets
+from datetime import date
+from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import api_view, action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.db import transaction
+from .importer import BulkImporter, ImportFileError, iter_records
+from .message_templates import DEFAULT_TEMPLATES
+from .pagination import decode_cursor, encode_cursor, keyset_ordering, keyset_page_filter
 from .models import (
-    Organization, Service, Option, ServiceLocation, Location,
+    Appointment, Organization, Service, Option, ServiceLocation, Location,
     BusinessHours, ExceptionalClosing, ServiceAddOnConfig, TeamMemberConfig, TeamMember,
     BookingRule, CommunicationTemplate, OrganizationFAQ, Assistant, FallbackNumber
 )
@@ -24,7 +28,8 @@ from .serializers import (
     CommunicationTemplateSerializer,
     OrganizationFAQSerializer,
     AssistantSerializer,
-    FallbackNumberSerializer
+    FallbackNumberSerializer,
+    DashboardAppointmentSerializer
 )
 
 logger = logging.getLogger(__name__)
@@ -162,6 +167,48 @@ class DashboardOrganizationViewSet(viewsets.ModelViewSet):
             logger.error(f"Error completing services setup: {str(e)}")
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=True, methods=['post'], url_path='import')
+    def import_bookings(self, request, pk=None):
+        """
+        Bulk import customers and historical appointments (CSV or NDJSON)
+
+        POST /api/dashboard/organization/<id>/import/?dry_run=true
+        Body: the raw file (Content-Type text/csv or application/x-ndjson), or a
+        multipart upload in the "file" field. ?file_format=csv|ndjson overrides detection.
+
+        The body is streamed and written in batches without sending SMS; returns
+        the import report (counts and the first errors with their line numbers).
+        """
+        try:
+            organization = self.get_object()
+            content_type = request.content_type or ''
+            if content_type.startswith('multipart/'):
+                upload = request.FILES.get('file')
+                if upload is None:
+                    return Response({'error': 'Upload the file in the "file" field'}, status=status.HTTP_400_BAD_REQUEST)
+                stream, name = upload, upload.name
+            else:
+                stream, name = request.stream or [], ''
+
+            file_format = request.query_params.get('file_format') or (
+                'ndjson' if 'ndjson' in content_type or 'jsonl' in content_type or name.endswith(('.ndjson', '.jsonl'))
+                else 'csv'
+            )
+            dry_run = request.query_params.get('dry_run', '').lower() in ('1', 'true', 'yes')
+
+            importer = BulkImporter(organization.id, dry_run=dry_run)
+            report = importer.run(iter_records(stream, file_format))
+            logger.info(
+                f"Import for organization {organization.id}: {report['rows']} rows, "
+                f"{report['appointments_created']} appointments, {report['error_count']} errors in {report['seconds']}s"
+            )
+            return Response(report, status=status.HTTP_200_OK)
+        except ImportFileError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Error importing bookings: {str(e)}")
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 
 class DashboardServiceViewSet(viewsets.ModelViewSet):
     queryset = Service.objects.all()
@@ -685,74 +732,8 @@ class CommunicationTemplateViewSet(viewsets.ModelViewSet):
                 serializer = self.get_serializer(template)
                 return Response({'data': serializer.data}, status=status.HTTP_200_OK)
 
-            # Return default templates if none exist
-            default_template = {
-                'booking_sms_content': '''Hi this is {{assistant_name}} from {{business_name}}.
-
-Here's the link to book your appointment easily :
-
-{{booking_link}}
-
-Let me know if you need anything, I'm happy to help.''',
-                'confirmation_email_subject': 'Your appointment is confirmed ✅',
-                'confirmation_email_content': '''Hi {{client_first_name}},
-
-Thank you for your booking!
-
-Your appointment is confirmed for:
-Date: {{date_of_appointment}}
-Time: {{time_of_appointment}}
-Service: {{service_name}}
-Address: {{address_of_appointment}}
-
-If you have any questions feel free to reply to this email
-
-Looking forward to seeing you soon
-— The {{business_name}} Team
-
-If you have allowed appointment modifications or cancellations your clients will be able to access their customer portal directly through this email''',
-                'modification_email_subject': 'Your appointment has been updated ✅',
-                'modification_email_content': '''Hi {{client_first_name}},
-
-Your appointment has been successfully updated
-
-Previous date and time: {{previous_date_of_appointment}} at {{previous_time_of_appointment}}
-New date and time: {{date_of_appointment}} at {{time_of_appointment}}
-Service: {{service_name}}
-Address: {{address_of_appointment}}
-
-If you have any questions or need to make further changes feel free to reply to this email
-
-We look forward to seeing you soon
-— The {{business_name}} Team''',
-                'cancellation_email_subject': 'Your appointment has been canceled ❌',
-                'cancellation_email_content': '''Hi {{client_first_name}},
-
-Your appointment scheduled for
-Date: {{date_of_appointment}}
-Time: {{time_of_appointment}}
-Service: {{service_name}}
-Address: {{address_of_appointment}}
-has been successfully canceled
-
-If this was a mistake or you'd like to rebook you can use your customer portal or contact us
-
-Take care
-— The {{business_name}} Team''',
-                'reminder_email_subject': 'Reminder - Your appointment is coming up 📅',
-                'reminder_email_content': '''Hi {{client_first_name}},
-
-This is a quick reminder that you have an upcoming appointment scheduled for:
-Date: {{date_of_appointment}}
-Time: {{time_of_appointment}}
-Service: {{service_name}}
-Address: {{address_of_appointment}}
-
-If you need to reschedule or cancel feel free to use your customer portal or reply to this email
-
-We look forward to seeing you soon
-— The {{business_name}} Team'''
-            }
+            # Return default templates if none exist (the text sent until the owner saves their own)
+            default_template = dict(DEFAULT_TEMPLATES)
             return Response({'data': default_template}, status=status.HTTP_200_OK)
         except Exception as e:
             logger.error(f"Error fetching communication templates: {str(e)}")
@@ -992,3 +973,71 @@ class FallbackNumberViewSet(viewsets.ModelViewSet):
         except Exception as e:
             logger.error(f"Error saving fallback numbers: {str(e)}")
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+DASHBOARD_APPOINTMENTS_PAGE_SIZE = 50
+MAX_DASHBOARD_APPOINTMENTS_PAGE_SIZE = 200
+
+
+class AppointmentViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    # No unfiltered list action: listing goes through by_organization's keyset pages
+    queryset = Appointment.objects.all()
+    serializer_class = DashboardAppointmentSerializer
+
+    def get_queryset(self):
+        return DashboardAppointmentSerializer.setup_eager_loading(Appointment.objects.all())
+
+    @action(detail=False, methods=['get'])
+    def by_organization(self, request):
+        """
+        Appointments of an organization, filtered and keyset-paginated
+
+        GET /api/dashboard/appointments/by_organization/?organization_id=<id>
+            optional: &date_from=<YYYY-MM-DD>&date_to=<YYYY-MM-DD>&status=<status>,<status>
+                      &provider_id=<id>&location_id=<id>&order=asc|desc
+                      &limit=<1-200, default 50>&cursor=<next_cursor from the previous page>
+
+        Rows are ordered by (date, time, id) and each filter has a matching index
+        (see Appointment.Meta), so a page is an index range scan even for
+        organizations with millions of appointments.
+        """
+        organization_id = request.query_params.get('organization_id')
+        if not organization_id:
+            return Response({'error': 'organization_id required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        params = request.query_params
+        try:
+            appointments = Appointment.objects.filter(organization_id=int(organization_id))
+            if params.get('date_from'):
+                appointments = appointments.filter(date__gte=date.fromisoformat(params['date_from']))
+            if params.get('date_to'):
+                appointments = appointments.filter(date__lte=date.fromisoformat(params['date_to']))
+            if params.get('status'):
+                statuses = params['status'].split(',')
+                if not set(statuses) <= {choice for choice, _ in Appointment.STATUS_CHOICES}:
+                    raise ValueError(f"invalid status '{params['status']}'")
+                appointments = appointments.filter(status__in=statuses)
+            if params.get('provider_id'):
+                appointments = appointments.filter(provider_id=int(params['provider_id']))
+            if params.get('location_id'):
+                appointments = appointments.filter(location_id=int(params['location_id']))
+            descending = params.get('order', 'asc') == 'desc'
+            limit = int(params.get('limit') or DASHBOARD_APPOINTMENTS_PAGE_SIZE)
+            if not 1 <= limit <= MAX_DASHBOARD_APPOINTMENTS_PAGE_SIZE:
+                raise ValueError(f'limit must be between 1 and {MAX_DASHBOARD_APPOINTMENTS_PAGE_SIZE}')
+            cursor = decode_cursor(params['cursor']) if params.get('cursor') else None
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            appointments = keyset_page_filter(appointments, cursor, descending).order_by(*keyset_ordering(descending))
+            # One extra row tells whether there is a next page
+            page = list(DashboardAppointmentSerializer.setup_eager_loading(appointments)[:limit + 1])
+            next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+            return Response({
+                'data': self.get_serializer(page[:limit], many=True).data,
+                'next_cursor': next_cursor,
+            }, status=status.HTTP_200_OK)
+        except Exception as e:
+            logger.error(f"Error fetching appointments: {str(e)}")
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
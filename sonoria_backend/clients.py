@@ -0,0 +1,54 @@
+"""
+Lazily loaded third-party clients
+
+Twilio, Stripe and LangChain are slow to import and most processes (voice
+workers, management commands) only need some of them. Import them through
+these accessors, inside the function that uses them, never at module level:
+
+    from sonoria_backend.clients import get_twilio_client
+
+    twilio_client = get_twilio_client()
+    if twilio_client:
+        twilio_client.messages.create(...)
+
+startup_benchmark.py fails if any of these SDKs is loaded by django.setup()
+or URL resolution.
+"""
+import os
+from functools import lru_cache
+
+from django.conf import settings
+
+# SDK modules that must not be imported during startup
+LAZY_MODULES = ['twilio.rest', 'stripe', 'langchain_community', 'langchain_core', 'openai']
+
+
+@lru_cache(maxsize=1)
+def get_twilio_client():
+    """Shared Twilio REST client, or None if credentials are not configured."""
+    account_sid = os.getenv('TWILIO_ACCOUNT_SID')
+    auth_token = os.getenv('TWILIO_AUTH_TOKEN')
+    if not account_sid or not auth_token:
+        return None
+
+    from twilio.rest import Client
+    return Client(account_sid, auth_token)
+
+
+@lru_cache(maxsize=1)
+def get_stripe():
+    """The stripe module, configured with STRIPE_SECRET_KEY."""
+    import stripe
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    return stripe
+
+
+def get_chat_model(model_name, temperature=0.7):
+    """LangChain ChatOpenAI client."""
+    from langchain_community.chat_models import ChatOpenAI
+    return ChatOpenAI(model_name=model_name, temperature=temperature, openai_api_key=settings.OPENAI_API_KEY)
+
+
+def human_message(content):
+    from langchain_core.messages import HumanMessage
+    return HumanMessage(content=content)
@@ -144,7 +144,17 @@ CHANNEL_LAYERS = {
     }
 }
 
-EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+# Emails are queued in the outbox and sent by workers (gabby_booking/email_outbox.py)
+EMAIL_BACKEND = "gabby_booking.email_outbox.QueuedEmailBackend"
+# How queued emails go out; django.core.mail.backends.console.EmailBackend or
+# .filebased.EmailBackend (with EMAIL_FILE_PATH) for local development
+EMAIL_DELIVERY_BACKEND = os.getenv("EMAIL_DELIVERY_BACKEND", "django.core.mail.backends.smtp.EmailBackend")
+EMAIL_FILE_PATH = os.getenv("EMAIL_FILE_PATH", str(BASE_DIR / "sent_emails"))
+EMAIL_POOL_SIZE = 4  # open SMTP connections kept per process
+EMAIL_CONNECTION_MAX_IDLE = 60  # seconds before a pooled connection is replaced
+EMAIL_MAX_ATTEMPTS = 6
+EMAIL_RETRY_BASE_SECONDS = 60
+EMAIL_RETRY_MAX_SECONDS = 60 * 60
 EMAIL_HOST = "smtp.gmail.com"
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -166,7 +176,54 @@ DATABASES = {
     }
 }
 
+# Cache
+# Availability and prompt segments are invalidated by bumping counters in the
+# cache, so every worker must share it: set CACHE_BACKEND/CACHE_LOCATION to
+# Redis or Memcached when running more than one process.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", "sonoria"),
+    }
+}
+
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+PROMPT_LLM_BACKEND = os.getenv("PROMPT_LLM_BACKEND", "openai")  # "fake" for local development
+PROMPT_JOB_STALE_SECONDS = 10 * 60  # pending/running jobs this old lost their process; requeue_prompt_jobs reruns them
+
+# Booking portal: spacing of offered start times, in minutes
+BOOKING_SLOT_GRANULARITY = int(os.getenv("BOOKING_SLOT_GRANULARITY", 30))
+AVAILABILITY_CACHE_TIMEOUT = 60 * 60
+AVAILABILITY_DURATION_BUCKET = 5  # minutes; durations are rounded up to share cache entries
+BOOKING_PORTAL_CACHE_TIMEOUT = 60 * 60  # booking portal catalog payload, also invalidated on change
+MESSAGE_TEMPLATE_CACHE_TIMEOUT = 60 * 60  # compiled CommunicationTemplate bundle, also invalidated on change
+PROMPT_SEGMENT_CACHE_TIMEOUT = 60 * 60 * 24  # rendered system prompt sections, keyed by section version
+# Voice assistant check_availability tool: answer time budget and days warmed at call start
+VOICE_AVAILABILITY_BUDGET_MS = 250  # warmed answers take a few ms; this covers computing a cold day
+VOICE_AVAILABILITY_WARM_DAYS = 7
+
+# In-process background jobs (gabby_booking/background.py)
+BACKGROUND_JOB_WORKERS = int(os.getenv("BACKGROUND_JOB_WORKERS", 4))
+BACKGROUND_JOBS_EAGER = False
+
+# Booking SMS outbox (gabby_booking/sms_outbox.py)
+SMS_BACKEND = os.getenv("SMS_BACKEND", "twilio")  # "fake" for local development
+SMS_RATE_PER_SECOND = int(os.getenv("SMS_RATE_PER_SECOND", 1))  # per sender number; Twilio long codes allow 1
+SMS_MAX_ATTEMPTS = 6
+SMS_RETRY_BASE_SECONDS = 30
+SMS_RETRY_MAX_SECONDS = 60 * 60
+SMS_DEDUP_WINDOW_SECONDS = 120  # same message kind to the same number (voice tool retries); 0 disables
+
+# Twilio status callbacks (assistant/status_callbacks.py)
+TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")  # validates X-Twilio-Signature
+TWILIO_CALLBACK_BASE_URL = os.getenv("TWILIO_CALLBACK_BASE_URL", os.getenv("NGROK_URL", ""))  # public URL Twilio calls back
+STATUS_CALLBACK_FLUSH_SECONDS = 0.25
+STATUS_CALLBACK_BATCH_SIZE = 500  # flush early once this many updates are buffered
+
+# Appointment reminders (gabby_booking/reminders.py)
+REMINDER_CHANNELS = ["email"]  # add "sms" to also text customers through the outbox
+REMINDER_BATCH_SIZE = 500
+REMINDER_RETRY_SECONDS = 10 * 60
 
 
 # Password validation
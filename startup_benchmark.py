@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Cold-start benchmark for worker processes
+Run with: python startup_benchmark.py [--runs 3] [--top 15] [--budget 3.0]
+
+Each run starts a fresh interpreter that does what a new daphne worker does:
+django.setup(), loads the URLconf and websocket routing, and serves one
+request through the full middleware stack. Reports:
+  - time for django.setup(), URL loading and the first request
+  - the slowest imports (cumulative, from python -X importtime)
+  - SDKs from sonoria_backend.clients.LAZY_MODULES that were imported anyway
+
+Exits with status 1 if a lazy SDK is loaded at startup or the median time
+to first request exceeds --budget seconds.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+
+CHILD = r"""
+import json, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+setup_done = time.perf_counter()
+
+from django.urls import get_resolver
+get_resolver().url_patterns
+import assistant.routing
+urls_done = time.perf_counter()
+
+from django.test import Client
+Client().get('/__startup_probe__/')
+request_done = time.perf_counter()
+
+from sonoria_backend.clients import LAZY_MODULES
+print(json.dumps({
+    'setup': setup_done - started,
+    'urls': urls_done - setup_done,
+    'first_request': request_done - urls_done,
+    'total': request_done - started,
+    'lazy_loaded': [name for name in LAZY_MODULES if name in sys.modules],
+}))
+"""
+
+
+def run_once():
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'sonoria_backend.settings')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Startup failed:\n{result.stderr[-2000:]}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        # "import time:   self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, self_us, cumulative_us, name = [part.strip() for part in line.replace('import time:', '|').split('|')]
+        imports.append((int(cumulative_us), int(self_us), name))
+
+    return json.loads(result.stdout.strip().splitlines()[-1]), imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=15, help='Number of slowest imports to list')
+    parser.add_argument('--budget', type=float, default=None, help='Fail if median time to first request exceeds this (seconds)')
+    args = parser.parse_args()
+
+    timings = []
+    imports = []
+    for _ in range(args.runs):
+        timing, imports = run_once()
+        timings.append(timing)
+
+    print(f"Startup over {args.runs} runs (median):")
+    for key in ['setup', 'urls', 'first_request', 'total']:
+        print(f"  {key:<14} {statistics.median(t[key] for t in timings) * 1000:8.1f} ms")
+
+    print("\nSlowest imports (cumulative, last run):")
+    for cumulative_us, self_us, name in sorted(imports, reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    failed = False
+    lazy_loaded = sorted({name for t in timings for name in t['lazy_loaded']})
+    if lazy_loaded:
+        print(f"\nFAIL: loaded at startup, should go through sonoria_backend.clients: {', '.join(lazy_loaded)}")
+        failed = True
+
+    median_total = statistics.median(t['total'] for t in timings)
+    if args.budget is not None and median_total > args.budget:
+        print(f"\nFAIL: time to first request {median_total:.2f}s exceeds budget {args.budget:.2f}s")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
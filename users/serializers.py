@@ -1,11 +1,9 @@
-import stripe
 from django.conf import settings
 from rest_framework import serializers
 from django.contrib.auth.hashers import make_password
+from sonoria_backend.clients import get_stripe
 from .models import User, UserSubscription, PaymentPlan
 
-stripe.api_key = settings.STRIPE_SECRET_KEY  # Ensure it's set in settings.py
-
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True)
@@ -40,7 +38,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
             username=validated_data["email"],
         )
 
-        checkout_session = stripe.checkout.Session.create(
+        checkout_session = get_stripe().checkout.Session.create(
             payment_method_types=["card"],
             mode="subscription",  # Ensure it's set to subscription mode
             customer_email=user.email,
@@ -5,8 +5,8 @@ from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from django.shortcuts import get_object_or_404
-import stripe
 from django.conf import settings
+from sonoria_backend.clients import get_stripe
 from .models import UserSubscription, User
 from .serializers import UserRegistrationSerializer, UserSignupSerializer
 from django.contrib.auth import get_user_model
@@ -21,8 +21,6 @@ from rest_framework.exceptions import ValidationError
 
 User = get_user_model()
 
-stripe.api_key = settings.STRIPE_SECRET_KEY 
-
 class UserRegistrationViewSet(viewsets.ViewSet):
     permission_classes = [AllowAny]
 
@@ -53,6 +51,7 @@ class PaymentSuccessViewSet(viewsets.ViewSet):
     permission_classes = [AllowAny]
 
     def retrieve(self, request, session_id=None):
+        stripe = get_stripe()
         try:
             session = stripe.checkout.Session.retrieve(session_id)
             customer_email = session.customer_email